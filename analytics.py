@@ -0,0 +1,353 @@
+# analytics.py (Vectorized sales analytics over in-memory NumPy columns)
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from archive import sales_sources
+from metrics import timed
+from report_cache import get_data_version
+from timerange import DAY, GRAINS, HOUR, bucket_start, check_grain, format_epoch, parse_range
+
+DEFAULT_CHUNK_SIZE = 65536  # sales rows fetched per round trip while loading
+DEFAULT_MOVING_AVERAGE_DAYS = 7
+REVENUE_PERCENTILES = (25, 50, 75, 90, 95, 99)
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+_DTYPES = (
+    ("epoch", np.int64),
+    ("product_id", np.int32),
+    ("quantity", np.int32),
+    ("total", np.float64),
+    ("transaction", np.int32)
+)
+
+
+class SalesColumns:
+    """In-process NumPy copy of every sale line (hot table and archives), kept current by id.
+    
+    Sale lines are only ever added - archiving moves them to another file
+    but never changes them - so after the first full load refresh() reads
+    just the rows above the highest id seen. A transaction's lines are
+    written together and sit next to each other in id order, which is how
+    they are numbered into transactions without keeping the ID strings.
+    
+    Memory is unbounded by design: 28 bytes per sale line (the five columns
+    in _DTYPES), briefly twice that while new rows are merged in, so ten
+    million lines hold about 280 MB per database for the life of the
+    process. stats() reports the current figure as "bytes".
+    """
+    
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.through = -1
+        self._archives = None
+        self._columns = {name: np.empty(0, dtype) for name, dtype in _DTYPES}
+        self._pending = []
+        self._last_transaction = None
+        self._transactions = 0
+        self._lock = threading.Lock()
+        self._stats = {"full_loads": 0, "delta_refreshes": 0, "rows_loaded": 0}
+    
+    def _reset(self):
+        self._columns = {name: np.empty(0, dtype) for name, dtype in _DTYPES}
+        self._pending = []
+        self._last_transaction = None
+        self._transactions = 0
+    
+    def _append(self, rows: List[tuple]):
+        ids, epochs, product_ids, quantities, totals, transaction_ids = zip(*rows)
+        transaction_ids = np.array(transaction_ids)
+        starts = np.empty(len(rows), dtype=bool)
+        starts[0] = transaction_ids[0] != self._last_transaction
+        starts[1:] = transaction_ids[1:] != transaction_ids[:-1]
+        self._pending.append({
+            "epoch": np.array(epochs, dtype=np.int64),
+            "product_id": np.array(product_ids, dtype=np.int32),
+            "quantity": np.array(quantities, dtype=np.int32),
+            "total": np.array(totals, dtype=np.float64),
+            "transaction": (self._transactions - 1 + np.cumsum(starts)).astype(np.int32)
+        })
+        self._transactions += int(starts.sum())
+        self._last_transaction = str(transaction_ids[-1])
+    
+    def _load(self, conn: sqlite3.Connection, source: str, low: int, high: int) -> int:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        loaded = 0
+        try:
+            cursor.execute(f"""
+                SELECT id, epoch, product_id, quantity, total, transaction_id
+                FROM {source}
+                WHERE id > ? AND id <= ?
+                ORDER BY id
+            """, (low, high))
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                self._append(rows)
+                loaded += len(rows)
+        finally:
+            cursor.close()
+        return loaded
+    
+    @staticmethod
+    def _archive_signature(conn: sqlite3.Connection) -> tuple:
+        return tuple(conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(rows), 0), COALESCE(MAX(batch), 0) FROM sales_archives"
+        ).fetchone())
+    
+    def refresh(self, conn: sqlite3.Connection) -> int:
+        """Load the sales added since the last refresh; returns rows loaded"""
+        with self._lock:
+            high = get_data_version(conn)[0]
+            archives = self._archive_signature(conn)
+            if self.through >= 0 and archives == self._archives:
+                if high == self.through:
+                    return 0
+                loaded = self._load(conn, "sales", self.through, high)
+                self._stats["delta_refreshes"] += 1
+            else:
+                # First load, or an archive run moved rows the hot table no longer has
+                self._reset()
+                loaded = 0
+                for source in sales_sources(conn):
+                    loaded += self._load(conn, source, 0, high)
+                self._stats["full_loads"] += 1
+            
+            if self._archive_signature(conn) != archives:
+                # Rows were archived while loading: read everything again next time
+                archives = None
+            self.through = high
+            self._archives = archives
+            self._stats["rows_loaded"] += loaded
+            return loaded
+    
+    def columns(self, conn: sqlite3.Connection) -> Dict[str, np.ndarray]:
+        """Current column arrays, one element per sale line (never modified in place)"""
+        self.refresh(conn)
+        with self._lock:
+            if self._pending:
+                self._columns = {
+                    name: np.concatenate([self._columns[name]] + [chunk[name] for chunk in self._pending])
+                    for name, dtype in _DTYPES
+                }
+                self._pending = []
+            return dict(self._columns)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["through"] = self.through
+            stats["rows"] = len(self._columns["epoch"]) + sum(len(chunk["epoch"]) for chunk in self._pending)
+            stats["transactions"] = self._transactions
+            stats["bytes"] = sum(values.nbytes for values in self._columns.values()) + sum(
+                values.nbytes for chunk in self._pending for values in chunk.values())
+        return stats
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_sales_columns(conn: sqlite3.Connection) -> SalesColumns:
+    """Process-wide column store for conn's database file (shared by the GUI and API)"""
+    path = next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == "main")
+    if not path:
+        # In-memory database: nothing to share it with
+        return SalesColumns()
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = SalesColumns()
+            _stores[key] = store
+        return store
+
+
+def _select(conn: sqlite3.Connection, start_date: Optional[str], end_date: Optional[str]) -> Dict[str, np.ndarray]:
+    """Column arrays of the sale lines in the report period"""
+    start, end = parse_range(start_date, end_date)
+    columns = get_sales_columns(conn).columns(conn)
+    if start is None and end is None:
+        return columns
+    epoch = columns["epoch"]
+    mask = np.ones(len(epoch), dtype=bool)
+    if start is not None:
+        mask &= epoch >= start
+    if end is not None:
+        mask &= epoch < end
+    return {name: values[mask] for name, values in columns.items()}
+
+
+def _first_lines(transaction: np.ndarray) -> np.ndarray:
+    """True for the first line of each transaction (a transaction's lines are adjacent)"""
+    first = np.empty(len(transaction), dtype=bool)
+    first[:1] = True
+    first[1:] = transaction[1:] != transaction[:-1]
+    return first
+
+
+def _heatmap(columns: Dict[str, np.ndarray]) -> Dict:
+    epoch = columns["epoch"]
+    # Day 0 (1970-01-01) was a Thursday
+    cell = ((epoch // DAY + 3) % 7) * 24 + (epoch % DAY) // HOUR
+    first = _first_lines(columns["transaction"])
+    transactions = np.bincount(cell[first], minlength=7 * 24)
+    items = np.bincount(cell, weights=columns["quantity"], minlength=7 * 24)
+    revenue = np.bincount(cell, weights=columns["total"], minlength=7 * 24)
+    return {
+        "weekdays": WEEKDAYS,
+        "hours": list(range(24)),
+        "transactions_count": transactions.reshape(7, 24).tolist(),
+        "items_sold": items.astype(np.int64).reshape(7, 24).tolist(),
+        "total_revenue": np.round(revenue, 2).reshape(7, 24).tolist()
+    }
+
+
+def _daily(columns: Dict[str, np.ndarray], window: int) -> List[Dict]:
+    if window < 1:
+        raise ValueError("window must be at least 1 day")
+    epoch = columns["epoch"]
+    if len(epoch) == 0:
+        return []
+    day = epoch // DAY
+    first_day = int(day.min())
+    day -= first_day
+    days = int(day.max()) + 1
+    first = _first_lines(columns["transaction"])
+    transactions = np.bincount(day[first], minlength=days)
+    items = np.bincount(day, weights=columns["quantity"], minlength=days)
+    revenue = np.bincount(day, weights=columns["total"], minlength=days)
+    
+    # Trailing mean over the last `window` days (fewer while the history is shorter)
+    cumulative = np.cumsum(revenue)
+    dropped = np.concatenate((np.zeros(window), cumulative[:-window]))[:days]
+    moving_average = (cumulative - dropped) / np.minimum(np.arange(1, days + 1), window)
+    
+    return [
+        {
+            "period_start": (first_day + offset) * DAY,
+            "period": format_epoch((first_day + offset) * DAY),
+            "transactions_count": int(transactions[offset]),
+            "items_sold": int(items[offset]),
+            "total_revenue": round(float(revenue[offset]), 2),
+            "moving_average": round(float(moving_average[offset]), 2)
+        }
+        for offset in range(days)
+    ]
+
+
+def _category_trends(conn: sqlite3.Connection, columns: Dict[str, np.ndarray], grain: str) -> Dict:
+    check_grain(grain)
+    products = conn.execute("SELECT id, category FROM products").fetchall()
+    epoch = columns["epoch"]
+    if not products or len(epoch) == 0:
+        return {"grain": grain, "periods": [], "categories": []}
+    
+    # product id -> category code; sales of deleted products are left out, as in top_products
+    names = sorted({row[1] for row in products}, key=lambda name: (name is None, name or ""))
+    codes = {name: code for code, name in enumerate(names)}
+    lookup = np.full(max(max(row[0] for row in products), int(columns["product_id"].max())) + 1, -1, dtype=np.int64)
+    for product_id, category in products:
+        lookup[product_id] = codes[category]
+    category = lookup[columns["product_id"]]
+    known = category >= 0
+    
+    step = GRAINS[grain]
+    period = bucket_start(epoch[known], grain)
+    first_period = int(period.min()) if len(period) else bucket_start(int(epoch.min()), grain)
+    period = (period - first_period) // step
+    periods = int(period.max()) + 1 if len(period) else 1
+    cell = category[known] * periods + period
+    items = np.bincount(cell, weights=columns["quantity"][known], minlength=len(names) * periods)
+    revenue = np.bincount(cell, weights=columns["total"][known], minlength=len(names) * periods)
+    items = items.reshape(len(names), periods)
+    revenue = revenue.reshape(len(names), periods)
+    
+    # Least-squares slope of each category's revenue: change per period
+    x = np.arange(periods) - (periods - 1) / 2
+    trend = revenue @ x / (x @ x) if periods > 1 else np.zeros(len(names))
+    
+    totals = revenue.sum(axis=1)
+    return {
+        "grain": grain,
+        "periods": [format_epoch(first_period + offset * step) for offset in range(periods)],
+        "categories": [
+            {
+                "category": names[code],
+                "items_sold": int(items[code].sum()),
+                "total_revenue": round(float(totals[code]), 2),
+                "revenue": np.round(revenue[code], 2).tolist(),
+                "trend": round(float(trend[code]), 2)
+            }
+            for code in np.argsort(-totals, kind="stable")
+        ]
+    }
+
+
+def _baskets(columns: Dict[str, np.ndarray]) -> Dict:
+    first = _first_lines(columns["transaction"])
+    count = int(first.sum())
+    if count == 0:
+        return {
+            "transactions_count": 0, "average_items": 0.0, "average_lines": 0.0, "average_revenue": 0.0,
+            "revenue_percentiles": {f"p{p}": 0.0 for p in REVENUE_PERCENTILES}
+        }
+    index = np.cumsum(first) - 1
+    lines = np.bincount(index)
+    items = np.bincount(index, weights=columns["quantity"])
+    revenue = np.bincount(index, weights=columns["total"])
+    percentiles = np.percentile(revenue, REVENUE_PERCENTILES)
+    return {
+        "transactions_count": count,
+        "average_items": round(float(items.mean()), 2),
+        "average_lines": round(float(lines.mean()), 2),
+        "average_revenue": round(float(revenue.mean()), 2),
+        "revenue_percentiles": {f"p{p}": round(float(value), 2) for p, value in zip(REVENUE_PERCENTILES, percentiles)}
+    }
+
+
+@timed("analytics.heatmap")
+def hourly_heatmap(conn: sqlite3.Connection, start_date: Optional[str] = None,
+                   end_date: Optional[str] = None) -> Dict:
+    """Transactions, items sold and revenue by weekday and hour of day (UTC)"""
+    return _heatmap(_select(conn, start_date, end_date))
+
+
+@timed("analytics.daily")
+def daily_sales(conn: sqlite3.Connection, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                window: int = DEFAULT_MOVING_AVERAGE_DAYS) -> List[Dict]:
+    """Totals per UTC day with a trailing moving average of revenue, oldest first"""
+    return _daily(_select(conn, start_date, end_date), window)
+
+
+@timed("analytics.category_trends")
+def category_trends(conn: sqlite3.Connection, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                    grain: str = "week") -> Dict:
+    """Revenue per category and period, with each category's revenue trend per period"""
+    return _category_trends(conn, _select(conn, start_date, end_date), grain)
+
+
+@timed("analytics.baskets")
+def basket_stats(conn: sqlite3.Connection, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict:
+    """Average basket size and value, and percentiles of transaction revenue"""
+    return _baskets(_select(conn, start_date, end_date))
+
+
+@timed("analytics.breakdown")
+def sales_analytics(conn: sqlite3.Connection, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                    grain: str = "week", window: int = DEFAULT_MOVING_AVERAGE_DAYS) -> Dict:
+    """Every analytic above from one pass over the columns"""
+    check_grain(grain)
+    columns = _select(conn, start_date, end_date)
+    return {
+        "baskets": _baskets(columns),
+        "heatmap": _heatmap(columns),
+        "daily": _daily(columns, window),
+        "categories": _category_trends(conn, columns, grain)
+    }
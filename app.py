@@ -1,25 +1,174 @@
 # app.py (Web backend)
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, make_response, request, g
+import base64
+import functools
+import gzip
+import json
+import os
 import sqlite3
+import time
+from contextlib import closing
 from datetime import datetime, timedelta
 
+from archive import sales_sources
+from catalog_cache import get_catalog_cache
+from checkout import InsufficientStockError, process_checkout
+from db import get_connection_manager
+from ingest import MAX_BATCH_TRANSACTIONS, ingest_transactions
+from metrics import get_metrics
+from migrations import migrate
+from product_import import FORMATS, detect_format, import_products
+from report_cache import get_data_version_tracker, get_report_cache
+from replication import DEFAULT_BATCH_SIZE as REPLICATION_BATCH_SIZE, changes_since, receive_push
+from reports import sales_by_period, sales_summary, top_products
+from search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, lookup_sku, search_products
+from timerange import parse_range, to_epoch
+from txn_ids import next_transaction_id
+from writes import get_write_coordinator
+
 app = Flask(__name__)
 
 # Database configuration
-DATABASE = 'pos_system.db'
+DATABASE = os.environ.get('POS_DATABASE', 'pos_system.db')
+DB_OPTIONS = {
+    'synchronous': os.environ.get('POS_DB_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('POS_DB_BUSY_TIMEOUT', 5000)),
+    'pool_size': int(os.environ.get('POS_DB_POOL_SIZE', 8))
+}
+
+# Paging for GET /api/sales
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+STREAM_FETCH_SIZE = 500
+
+# Rows per GET /api/reports/top-products
+MAX_TOP_PRODUCTS = 1000
+
+# Conditional GET: clients revalidate with If-None-Match (max-age 0 = always ask)
+HTTP_MAX_AGE = int(os.environ.get('POS_HTTP_MAX_AGE', 0))
+
+_schema_ready = False
+
+def get_db_manager():
+    """Return the shared connection manager, upgrading the schema on first use"""
+    global _schema_ready
+    manager = get_connection_manager(DATABASE, **DB_OPTIONS)
+    if not _schema_ready:
+        with manager.pooled() as conn:
+            migrate(conn)
+        _schema_ready = True
+    return manager
+
+def get_writer():
+    """Write coordinator for the database (single-writer group commit with POS_WRITE_QUEUE=1)"""
+    return get_write_coordinator(get_db_manager())
 
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Borrow a pooled connection for the current request"""
+    if 'db' not in g:
+        g.db = get_db_manager().acquire()
+    return g.db
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    """Per-endpoint latency (until the response is handed to the server)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        get_metrics().observe_operation(f'http {request.method} {endpoint}', time.perf_counter() - started,
+                                        error=response.status_code >= 500)
+    return response
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Hand the request's connection back to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_db_manager().release(conn)
+
+@app.errorhandler(sqlite3.OperationalError)
+def database_error(error):
+    """Lock contention that outlasted busy_timeout is retryable: 503, not a crash"""
+    message = str(error)
+    if 'locked' in message or 'busy' in message:
+        response = jsonify({'error': message})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    return jsonify({'error': message}), 500
+
+def make_etag(scope):
+    """Strong ETag from the data version: the catalog version for catalog
+    responses, plus the sales high-water mark for reports"""
+    sales_high_water, catalog_version = get_data_version_tracker(DATABASE).current(get_db_connection)
+    if scope == 'catalog':
+        return f'c{catalog_version}'
+    return f's{sales_high_water}-c{catalog_version}'
+
+def conditional(scope):
+    """Answer If-None-Match with 304 when the data version has not moved.
+    
+    The version comes from the data version tracker, which only queries the
+    database when its files changed, so a matching poll costs a stat() call.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = make_etag(scope)
+            cache_control = f'private, max-age={HTTP_MAX_AGE}, must-revalidate' if HTTP_MAX_AGE else 'no-cache'
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
 
 @app.route('/api/products', methods=['GET'])
+@conditional('catalog')
 def get_products():
-    """Get all products"""
+    """Get all products (optionally ?category=...) from the in-memory catalog"""
+    conn = get_db_connection()
+    products = get_catalog_cache(DATABASE).products(conn, category=request.args.get('category'))
+    return jsonify(products)
+
+@app.route('/api/products/search', methods=['GET'])
+@conditional('catalog')
+def search_products_route():
+    """Search products by name or barcode (?q=...), or look up one barcode (?sku=...)"""
     conn = get_db_connection()
-    products = conn.execute('SELECT * FROM products').fetchall()
-    conn.close()
-    return jsonify([dict(product) for product in products])
+    sku = request.args.get('sku')
+    if sku:
+        product = lookup_sku(conn, sku)
+        if product is None:
+            return jsonify({'error': 'Product not found'}), 404
+        return jsonify(product)
+    
+    try:
+        limit = int(request.args.get('limit', DEFAULT_SEARCH_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    
+    return jsonify(search_products(conn, request.args.get('q', ''), limit))
+
+@app.route('/api/products/<int:product_id>', methods=['GET'])
+@conditional('catalog')
+def get_product(product_id):
+    """Get a single product"""
+    conn = get_db_connection()
+    product = get_catalog_cache(DATABASE).get(conn, product_id)
+    if product is None:
+        return jsonify({'error': 'Product not found'}), 404
+    return jsonify(product)
 
 @app.route('/api/products', methods=['POST'])
 def add_product():
@@ -30,110 +179,404 @@ def add_product():
     if not all(field in data for field in required_fields):
         return jsonify({'error': 'Missing required fields'}), 400
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO products (name, price, category, stock_quantity) VALUES (?, ?, ?, ?)',
-        (data['name'], data['price'], data['category'], data.get('stock_quantity', 0))
-    )
-    product_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    def insert(cursor):
+        cursor.execute(
+            'INSERT INTO products (name, price, category, stock_quantity, sku) VALUES (?, ?, ?, ?, ?)',
+            (data['name'], data['price'], data['category'], data.get('stock_quantity', 0), data.get('sku') or None)
+        )
+        return cursor.lastrowid
+    
+    try:
+        product_id = get_writer().run(insert, conn=get_db_connection())
+    except sqlite3.IntegrityError:
+        return jsonify({'error': 'A product with this SKU already exists'}), 409
     
     return jsonify({'message': 'Product added successfully', 'product_id': product_id}), 201
 
+@app.route('/api/products/bulk', methods=['POST'])
+def bulk_import_products():
+    """Upsert products by SKU from a CSV or NDJSON request body (streamed, not buffered).
+    
+    The format comes from ?format=csv|ndjson or the Content-Type header.
+    Invalid rows are reported in the response and skipped.
+    """
+    fmt = request.args.get('format') or detect_format(content_type=request.content_type)
+    if fmt not in FORMATS:
+        return jsonify({'error': f'format must be one of: {", ".join(FORMATS)}'}), 400
+    
+    conn = get_db_connection()
+    result = import_products(conn, request.stream, fmt, coordinator=get_writer())
+    status = 200 if result['error_count'] == 0 else 207
+    return jsonify(result), status
+
+def encode_cursor(epoch, sale_id):
+    """Opaque keyset cursor for the (epoch, id) position of a sale"""
+    raw = json.dumps([epoch, sale_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    epoch, sale_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    if isinstance(epoch, str):
+        # Cursors handed out before sales had epochs carry the timestamp text
+        epoch = to_epoch(epoch)
+    return int(epoch), int(sale_id)
+
+def query_sales(conn, query, params, start, end, limit=None, fetch_size=STREAM_FETCH_SIZE):
+    """Yield rows of a sales query over the hot table and the archives in [start, end).
+    
+    query reads FROM {sales} and is ordered newest first; it runs once per
+    source, newest source first, so the rows come out in order.
+    """
+    with closing(sales_sources(conn, start, end)) as sources:
+        for source in sources:
+            source_query = query.format(sales=source)
+            source_params = list(params)
+            if limit is not None:
+                source_query += ' LIMIT ?'
+                source_params.append(limit)
+            cursor = conn.execute(source_query, source_params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield dict(row)
+                    if limit is not None:
+                        limit -= len(rows)
+            finally:
+                # An abandoned stream must not keep its archives attached
+                cursor.close()
+            if limit is not None and limit <= 0:
+                break
+
+def stream_query(query, params, start, end, limit=None):
+    """Yield rows as dicts straight off a pooled connection's cursor"""
+    with get_db_manager().pooled() as conn:
+        yield from query_sales(conn, query, params, start, end, limit)
+
+def stream_json_array(rows):
+    """Encode rows as one JSON array, a row at a time"""
+    yield '['
+    first = True
+    for row in rows:
+        yield ('' if first else ',') + json.dumps(row)
+        first = False
+    yield ']'
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
 @app.route('/api/sales', methods=['GET'])
 def get_sales():
-    """Get sales data with optional date filtering"""
+    """Get sales data with optional date filtering.
+    
+    end_date includes the whole day (or minute) it names. With limit and/or
+    after, returns one keyset page ordered by (epoch, id) descending plus a
+    next_cursor. stream=ndjson streams rows as NDJSON; with
+    no paging arguments the full list is streamed as a JSON array.
+    """
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    after = request.args.get('after')
+    limit = request.args.get('limit')
+    stream = request.args.get('stream')
+    try:
+        start, end = parse_range(start_date, end_date)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     query = '''
         SELECT s.*, p.name as product_name 
-        FROM sales s 
+        FROM {sales} s 
         JOIN products p ON s.product_id = p.id
     '''
+    conditions = []
     params = []
     
-    if start_date and end_date:
-        query += ' WHERE s.timestamp BETWEEN ? AND ?'
-        params.extend([start_date, end_date])
-    elif start_date:
-        query += ' WHERE s.timestamp >= ?'
-        params.append(start_date)
-    elif end_date:
-        query += ' WHERE s.timestamp <= ?'
-        params.append(end_date)
+    if start is not None:
+        conditions.append('s.epoch >= ?')
+        params.append(start)
+    if end is not None:
+        conditions.append('s.epoch < ?')
+        params.append(end)
+    
+    if after:
+        try:
+            after_epoch, after_id = decode_cursor(after)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        conditions.append('(s.epoch, s.id) < (?, ?)')
+        params.extend([after_epoch, after_id])
     
-    query += ' ORDER BY s.timestamp DESC'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY s.epoch DESC, s.id DESC'
     
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    
+    if stream == 'ndjson':
+        rows = stream_query(query, params, start, end, limit)
+        return Response(stream_ndjson(rows), mimetype='application/x-ndjson')
+    
+    if limit is None and after is None:
+        # Unpaged: same JSON array as before, but never materialised in memory
+        rows = stream_query(query, params, start, end)
+        return Response(stream_json_array(rows), mimetype='application/json')
+    
+    limit = limit or DEFAULT_PAGE_SIZE
     conn = get_db_connection()
-    sales = conn.execute(query, params).fetchall()
-    conn.close()
+    sales = list(query_sales(conn, query, params, start, end, limit + 1))
+    next_cursor = None
+    if len(sales) > limit:
+        sales = sales[:limit]
+        next_cursor = encode_cursor(sales[-1]['epoch'], sales[-1]['id'])
     
-    return jsonify([dict(sale) for sale in sales])
+    return jsonify({'sales': sales, 'next_cursor': next_cursor, 'limit': limit})
+
+@app.route('/api/sales', methods=['POST'])
+def create_sale():
+    """Record a sale: {"items": [{"product_id": 1, "quantity": 2}, ...]}"""
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
+    
+    conn = get_db_connection()
+    try:
+        transaction_id = process_checkout(conn, next_transaction_id(), items, get_writer())
+    except InsufficientStockError as e:
+        return jsonify({'error': str(e), 'shortages': e.shortages}), 409
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'message': 'Sale recorded', 'transaction_id': transaction_id}), 201
+
+@app.route('/api/sync/ingest', methods=['POST'])
+@app.route('/api/sales/batch', methods=['POST'])
+def ingest_sales_batch():
+    """Accept a batch of terminal transactions (CloudSync payload, gzip or plain JSON).
+    
+    Retries are safe: transactions are deduplicated by transaction ID and
+    every one is acknowledged as accepted, duplicate or rejected. The batch
+    is written in a single transaction; a 503 means nothing was stored.
+    """
+    body = request.get_data()
+    try:
+        if request.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        payload = json.loads(body)
+    except (OSError, EOFError, ValueError):
+        return jsonify({'error': 'Body must be JSON (optionally gzip-encoded)'}), 400
+    
+    transactions = payload.get('transactions') if isinstance(payload, dict) else None
+    if not isinstance(transactions, list):
+        return jsonify({'error': 'transactions must be a list'}), 400
+    if len(transactions) > MAX_BATCH_TRANSACTIONS:
+        return jsonify({'error': f'At most {MAX_BATCH_TRANSACTIONS} transactions per batch'}), 413
+    
+    terminal_id = payload.get('terminal_id') or request.headers.get('X-Terminal-ID')
+    conn = get_db_connection()
+    result = ingest_transactions(conn, transactions, terminal_id, get_writer())
+    status = 200 if result['rejected'] == 0 else 207
+    return jsonify(result), status
+
+@app.route('/api/replication/push', methods=['POST'])
+def replication_push():
+    """Apply a store's product changes once each; returns the acknowledged sequence"""
+    body = request.get_data()
+    try:
+        if request.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        payload = json.loads(body)
+    except (OSError, EOFError, ValueError):
+        return jsonify({'error': 'Body must be JSON (optionally gzip-encoded)'}), 400
+    
+    store_id = payload.get('store_id') if isinstance(payload, dict) else None
+    changes = payload.get('changes') if isinstance(payload, dict) else None
+    if not store_id or not isinstance(changes, list):
+        return jsonify({'error': 'store_id and a changes list are required'}), 400
+    
+    try:
+        acked = get_writer().run(receive_push, str(store_id), changes, conn=get_db_connection())
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid change: {e}'}), 400
+    return jsonify({'acked_seq': acked})
+
+@app.route('/api/replication/changes', methods=['GET'])
+def replication_changes():
+    """Product change feed after ?since=SEQ (stock echoes of ?store_id left out)"""
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', REPLICATION_BATCH_SIZE))
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    
+    conn = get_db_connection()
+    return jsonify(changes_since(conn, since, limit, request.args.get('store_id')))
 
 @app.route('/api/reports/summary', methods=['GET'])
+@conditional('report')
 def get_summary_report():
     """Get summary sales report"""
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    query = '''
-        SELECT 
-            COUNT(DISTINCT transaction_id) as transactions_count,
-            SUM(quantity) as items_sold,
-            SUM(total) as total_revenue
-        FROM sales
-    '''
-    params = []
-    
-    if start_date and end_date:
-        query += ' WHERE timestamp BETWEEN ? AND ?'
-        params.extend([start_date, end_date])
-    elif start_date:
-        query += ' WHERE timestamp >= ?'
-        params.append(start_date)
-    elif end_date:
-        query += ' WHERE timestamp <= ?'
-        params.append(end_date)
-    
     conn = get_db_connection()
-    result = conn.execute(query, params).fetchone()
-    conn.close()
-    
-    report = {
-        'transactions_count': result['transactions_count'] or 0,
-        'items_sold': result['items_sold'] or 0,
-        'total_revenue': result['total_revenue'] or 0.0
-    }
+    try:
+        report = get_report_cache().get_or_compute(
+            conn, (DATABASE, 'summary'), {'start_date': start_date, 'end_date': end_date},
+            lambda: sales_summary(conn, start_date, end_date)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify(report)
 
 @app.route('/api/reports/top-products', methods=['GET'])
+@conditional('report')
 def get_top_products():
     """Get top selling products"""
-    limit = request.args.get('limit', 10)
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    limit = max(1, min(limit, MAX_TOP_PRODUCTS))
     
-    query = '''
-        SELECT 
-            p.id,
-            p.name,
-            p.category,
-            SUM(s.quantity) as total_sold,
-            SUM(s.total) as total_revenue
-        FROM sales s
-        JOIN products p ON s.product_id = p.id
-        GROUP BY p.id
-        ORDER BY total_sold DESC
-        LIMIT ?
-    '''
+    conn = get_db_connection()
+    try:
+        products = get_report_cache().get_or_compute(
+            conn, (DATABASE, 'top-products'), {'start_date': start_date, 'end_date': end_date, 'limit': limit},
+            lambda: top_products(conn, start_date, end_date, limit)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(products)
+
+@app.route('/api/reports/sales-by-period', methods=['GET'])
+@conditional('report')
+def get_sales_by_period():
+    """Get sales per hour, day or week (?grain=, UTC buckets; weeks start on Monday)"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    grain = request.args.get('grain', 'day')
     
     conn = get_db_connection()
-    products = conn.execute(query, (limit,)).fetchall()
-    conn.close()
+    try:
+        periods = get_report_cache().get_or_compute(
+            conn, (DATABASE, 'sales-by-period'), {'start_date': start_date, 'end_date': end_date, 'grain': grain},
+            lambda: sales_by_period(conn, start_date, end_date, grain)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify([dict(product) for product in products])
+    return jsonify(periods)
+
+def analytics_report(name, params, compute):
+    """Cached analytics response; bad dates or parameters are a 400, a missing NumPy a 501"""
+    try:
+        import analytics
+    except ImportError:
+        return jsonify({'error': 'Sales analytics need NumPy (pip install numpy)'}), 501
+    if params.get('window', 0) is None:
+        params['window'] = analytics.DEFAULT_MOVING_AVERAGE_DAYS
+    conn = get_db_connection()
+    try:
+        result = get_report_cache().get_or_compute(conn, (DATABASE, name), params, lambda: compute(analytics, conn))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+def analytics_window():
+    """Moving-average window in days; None (not given) is filled in by analytics_report"""
+    window = request.args.get('window')
+    return None if window is None else int(window)
+
+@app.route('/api/reports/analytics', methods=['GET'])
+@conditional('report')
+def get_sales_analytics():
+    """Basket stats, hourly heat map, daily moving average and category trends in one response"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    grain = request.args.get('grain', 'week')
+    try:
+        window = analytics_window()
+    except ValueError:
+        return jsonify({'error': 'window must be an integer'}), 400
+    params = {'start_date': start_date, 'end_date': end_date, 'grain': grain, 'window': window}
+    return analytics_report('analytics', params,
+                            lambda analytics, conn: analytics.sales_analytics(conn, start_date, end_date, grain, params['window']))
+
+@app.route('/api/reports/heatmap', methods=['GET'])
+@conditional('report')
+def get_hourly_heatmap():
+    """Transactions, items and revenue by weekday and hour of day (UTC)"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    return analytics_report('heatmap', {'start_date': start_date, 'end_date': end_date},
+                            lambda analytics, conn: analytics.hourly_heatmap(conn, start_date, end_date))
+
+@app.route('/api/reports/daily', methods=['GET'])
+@conditional('report')
+def get_daily_sales():
+    """Daily totals with a trailing moving average of revenue (?window=days)"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    try:
+        window = analytics_window()
+    except ValueError:
+        return jsonify({'error': 'window must be an integer'}), 400
+    params = {'start_date': start_date, 'end_date': end_date, 'window': window}
+    return analytics_report('daily', params,
+                            lambda analytics, conn: analytics.daily_sales(conn, start_date, end_date, params['window']))
+
+@app.route('/api/reports/categories', methods=['GET'])
+@conditional('report')
+def get_category_trends():
+    """Revenue per category per hour, day or week (?grain=) with each category's trend"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    grain = request.args.get('grain', 'week')
+    return analytics_report('categories', {'start_date': start_date, 'end_date': end_date, 'grain': grain},
+                            lambda analytics, conn: analytics.category_trends(conn, start_date, end_date, grain))
+
+@app.route('/api/reports/baskets', methods=['GET'])
+@conditional('report')
+def get_basket_stats():
+    """Average basket size and value, and transaction revenue percentiles"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    return analytics_report('baskets', {'start_date': start_date, 'end_date': end_date},
+                            lambda analytics, conn: analytics.basket_stats(conn, start_date, end_date))
+
+@app.route('/api/reports/cache/stats', methods=['GET'])
+def get_report_cache_stats():
+    """Get report cache hit/miss statistics"""
+    return jsonify(get_report_cache().stats())
+
+@app.route('/metrics', methods=['GET'])
+def get_prometheus_metrics():
+    """Statement and operation latency histograms in Prometheus text format"""
+    return Response(get_metrics().prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics_snapshot():
+    """Same metrics as JSON, including the recent slow-query log"""
+    return jsonify(get_metrics().snapshot())
+
+@app.route('/api/db/stats', methods=['GET'])
+def get_db_stats():
+    """Get connection pool and write coordinator statistics"""
+    return jsonify(dict(get_db_manager().stats(), writes=get_writer().stats()))
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,404 @@
+# archive.py (Hot/cold sales archiving into monthly SQLite files)
+import calendar
+import datetime
+import os
+import re
+import sqlite3
+import sys
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import rollups
+from metrics import timed
+from timerange import EPOCH_SQL
+from writes import write_transaction
+
+DEFAULT_ARCHIVE_AFTER_DAYS = int(os.environ.get("POS_ARCHIVE_AFTER_DAYS", 90))
+DEFAULT_ARCHIVE_DIR = os.environ.get("POS_ARCHIVE_DIR", "archive")  # relative to the hot database's directory
+DEFAULT_BATCH_SIZE = 5000   # sales rows moved per copy/delete pair of transactions
+MAX_ATTACHED_ARCHIVES = 8   # SQLite attaches at most 10 databases per connection by default
+
+SALES_COLUMNS = "id, transaction_id, product_id, quantity, price, total, timestamp, synced, epoch"
+
+_MONTH = re.compile(r"^\d{4}-\d{2}$")
+
+# One row per archived month in the hot database. batch is the last archive
+# batch whose rows were also removed from the hot table: rows of a later
+# batch are left over from an interrupted run and are never read.
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS sales_archives (
+        month TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        rows INTEGER NOT NULL DEFAULT 0,
+        first_timestamp TEXT,
+        last_timestamp TEXT,
+        batch INTEGER NOT NULL DEFAULT 0,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+]
+
+# Created in each attached archive file ({schema} is its attach name)
+ARCHIVE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS {schema}.sales (
+        id INTEGER PRIMARY KEY,
+        transaction_id TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        price REAL NOT NULL,
+        total REAL NOT NULL,
+        timestamp DATETIME,
+        synced INTEGER,
+        archive_batch INTEGER NOT NULL,
+        epoch INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_sales_timestamp ON sales (timestamp)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_sales_epoch ON sales (epoch)"
+]
+
+
+def _schema_name(month: str) -> str:
+    if not _MONTH.match(month):
+        raise ValueError(f"Invalid archive month: {month!r}")
+    return "archive_" + month.replace("-", "_")
+
+
+def _next_month(month: str) -> str:
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+
+
+def _month_epoch(month: str) -> int:
+    return calendar.timegm((int(month[:4]), int(month[5:7]), 1, 0, 0, 0))
+
+
+def _hot_path(conn: sqlite3.Connection) -> str:
+    for row in conn.execute("PRAGMA database_list").fetchall():
+        if row[1] == "main":
+            return row[2] or os.path.abspath("pos_system.db")
+    return os.path.abspath("pos_system.db")
+
+
+def _resolve(conn: sqlite3.Connection, path: str) -> str:
+    """Archive paths are stored relative to the hot database's directory"""
+    return os.path.join(os.path.dirname(_hot_path(conn)), path)
+
+
+def _new_archive_path(conn: sqlite3.Connection, month: str, archive_dir: Optional[str]) -> str:
+    hot = _hot_path(conn)
+    stem = os.path.splitext(os.path.basename(hot))[0]
+    directory = os.path.join(os.path.dirname(hot), archive_dir or DEFAULT_ARCHIVE_DIR)
+    return os.path.relpath(os.path.join(directory, f"{stem}-sales-{month}.db"), os.path.dirname(hot))
+
+
+def list_archives(conn: sqlite3.Connection) -> List[Dict]:
+    """Every archived month, newest first"""
+    cursor = conn.execute("""
+        SELECT month, path, rows, first_timestamp, last_timestamp, batch, archived_at
+        FROM sales_archives ORDER BY month DESC
+    """)
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def overlapping_archives(conn: sqlite3.Connection, start: Optional[int] = None,
+                         end: Optional[int] = None) -> List[Dict]:
+    """Archived months holding sales in the epoch range [start, end), newest first"""
+    conditions = ["rows > 0"]
+    params = []
+    if start is not None:
+        conditions.append("CAST(strftime('%s', last_timestamp) AS INTEGER) >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("CAST(strftime('%s', first_timestamp) AS INTEGER) < ?")
+        params.append(end)
+    cursor = conn.execute(f"""
+        SELECT month, path, batch FROM sales_archives
+        WHERE {' AND '.join(conditions)}
+        ORDER BY month DESC
+    """, params)
+    return [{"month": row[0], "path": row[1], "batch": row[2]} for row in cursor.fetchall()]
+
+
+def _attach(conn: sqlite3.Connection, month: str, path: str, create: bool = False) -> str:
+    path = _resolve(conn, path)
+    if not create and not os.path.exists(path):
+        raise FileNotFoundError(f"Sales archive {path} is missing")
+    schema = _schema_name(month)
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+    return schema
+
+
+def sales_sources(conn: sqlite3.Connection, start: Optional[int] = None, end: Optional[int] = None) -> Iterator[str]:
+    """Yield FROM sources that together hold every sale in the epoch range [start, end).
+    
+    With no archived month in the range this is just "sales", so queries
+    over recent data never touch an archive. Otherwise the overlapping
+    archives are attached (MAX_ATTACHED_ARCHIVES at a time) and each source
+    is a UNION ALL of them and the hot table. Sources are yielded newest
+    first and cover disjoint periods, so per-source results can be added up
+    or concatenated in order. Each source is read in one read transaction,
+    so an archiver moving rows at the same time is never seen half done.
+    The caller must finish its statements before asking for the next source.
+    """
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        conn.execute("BEGIN")
+    try:
+        archives = overlapping_archives(conn, start, end)
+        if not archives:
+            yield "sales"
+            return
+        
+        groups = [archives[i:i + MAX_ATTACHED_ARCHIVES] for i in range(0, len(archives), MAX_ATTACHED_ARCHIVES)]
+        upper = None
+        for index, group in enumerate(groups):
+            # The hot table is split at the group boundaries so no sale is read twice
+            lower = _month_epoch(group[-1]["month"]) if index < len(groups) - 1 else None
+            hot_conditions = [condition for condition in (lower is not None and f"epoch >= {lower}",
+                                                          upper is not None and f"epoch < {upper}") if condition]
+            parts = [f"SELECT {SALES_COLUMNS} FROM main.sales"
+                     + (" WHERE " + " AND ".join(hot_conditions) if hot_conditions else "")]
+            
+            if index > 0 and own_transaction:
+                conn.execute("BEGIN")
+            attached = []
+            try:
+                for archive in group:
+                    schema = _attach(conn, archive["month"], archive["path"])
+                    attached.append(schema)
+                    parts.append(f"SELECT {SALES_COLUMNS} FROM {schema}.sales "
+                                 f"WHERE archive_batch <= {int(archive['batch'])}")
+                yield "(" + " UNION ALL ".join(parts) + ")"
+            finally:
+                if own_transaction and conn.in_transaction:
+                    conn.commit()
+                for schema in attached:
+                    conn.execute(f"DETACH DATABASE {schema}")
+            upper = lower
+    finally:
+        if own_transaction and conn.in_transaction:
+            conn.commit()
+
+
+@contextmanager
+def open_archives(conn: sqlite3.Connection) -> Iterator[List[Tuple[sqlite3.Connection, str]]]:
+    """Read-only connections to every archive, as (connection, source) pairs for rollups"""
+    opened = []
+    try:
+        for archive in list_archives(conn):
+            path = _resolve(conn, archive["path"])
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Sales archive {path} is missing")
+            # Read-only and only read by one thread at a time, but possibly the write coordinator's
+            archive_conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            opened.append((archive_conn, f"(SELECT * FROM sales WHERE archive_batch <= {int(archive['batch'])})"))
+        yield opened
+    finally:
+        for archive_conn, source in opened:
+            archive_conn.close()
+
+
+def add_epoch_column(cursor: sqlite3.Cursor):
+    """Migration step: give archive files written before sales.epoch the column and its index"""
+    for archive in list_archives(cursor.connection):
+        path = _resolve(cursor.connection, archive["path"])
+        if not os.path.exists(path):
+            continue
+        archive_conn = sqlite3.connect(path)
+        try:
+            if "epoch" not in [row[1] for row in archive_conn.execute("PRAGMA table_info(sales)")]:
+                archive_conn.execute("ALTER TABLE sales ADD COLUMN epoch INTEGER")
+                archive_conn.execute(f"UPDATE sales SET epoch = {EPOCH_SQL}")
+            archive_conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_epoch ON sales (epoch)")
+            archive_conn.commit()
+        finally:
+            archive_conn.close()
+
+
+def rebuild(cursor: sqlite3.Cursor):
+    """Migration step: rollups.rebuild including every archive"""
+    with open_archives(cursor.connection) as archived:
+        rollups.rebuild(cursor, archived)
+
+
+def rebuild_rollups(conn: sqlite3.Connection, writer=None):
+    """Recompute the rollups from the hot table and every archive (through writer when given)"""
+    with open_archives(conn) as archived:
+        rollups.rebuild_rollups(conn, archived, writer)
+
+
+def check_rollups(conn: sqlite3.Connection) -> List[Dict]:
+    """Compare the rollups with the hot table plus every archive"""
+    with open_archives(conn) as archived:
+        return rollups.check_rollups(conn, archived)
+
+
+def _archive_month(conn: sqlite3.Connection, month: str, before: int, through_id: int,
+                   archive_dir: Optional[str], batch_size: int) -> int:
+    row = conn.execute("SELECT path, batch FROM sales_archives WHERE month = ?", (month,)).fetchone()
+    path, committed = (row[0], row[1]) if row else (_new_archive_path(conn, month, archive_dir), 0)
+    os.makedirs(os.path.dirname(_resolve(conn, path)), exist_ok=True)
+    lower, upper = _month_epoch(month), min(_month_epoch(_next_month(month)), before)
+    
+    if conn.in_transaction:
+        conn.commit()
+    schema = _attach(conn, month, path, create=True)
+    try:
+        # Archive commits must be on disk before the hot rows are deleted
+        conn.execute(f"PRAGMA {schema}.synchronous = FULL")
+        
+        def prepare(cursor):
+            for statement in ARCHIVE_SCHEMA:
+                cursor.execute(statement.format(schema=schema))
+            # Left over from an interrupted run: copied, but still in the hot table
+            cursor.execute(f"DELETE FROM {schema}.sales WHERE archive_batch > ?", (committed,))
+        
+        write_transaction(conn, prepare)
+        
+        moved = 0
+        last_id = 0
+        while True:
+            batch = committed + 1
+            
+            def copy(cursor):
+                ids = [row[0] for row in cursor.execute("""
+                    SELECT id FROM main.sales
+                    WHERE epoch >= ? AND epoch < ? AND synced = 1 AND id > ? AND id <= ?
+                    ORDER BY id LIMIT ?
+                """, (lower, upper, last_id, through_id, batch_size)).fetchall()]
+                if not ids:
+                    return None
+                # Never split a transaction (its lines are consecutive ids, and only
+                # fully synced ones move): per-source counts would count it twice
+                last = cursor.execute("""
+                    SELECT MAX(id) FROM main.sales
+                    WHERE transaction_id = (SELECT transaction_id FROM main.sales WHERE id = ?)
+                """, (ids[-1],)).fetchone()[0]
+                ids.append(last)
+                cursor.execute(f"""
+                    INSERT INTO {schema}.sales ({SALES_COLUMNS}, archive_batch)
+                    SELECT {SALES_COLUMNS}, ? FROM main.sales s
+                    WHERE id BETWEEN ? AND ? AND epoch >= ? AND epoch < ? AND synced = 1
+                      AND NOT EXISTS (SELECT 1 FROM main.sales u WHERE u.transaction_id = s.transaction_id
+                                      AND u.synced = 0)
+                """, (batch, ids[0], ids[-1], lower, upper))
+                return ids[0], ids[-1]
+            
+            # Two transactions (the copy, then the delete) because commits across
+            # attached WAL databases are not atomic as a set
+            copied = write_transaction(conn, copy)
+            if copied is None:
+                break
+            
+            def remove(cursor):
+                cursor.execute(f"""
+                    DELETE FROM main.sales WHERE id IN (
+                        SELECT id FROM {schema}.sales WHERE id BETWEEN ? AND ? AND archive_batch = ?
+                    )
+                """, (copied[0], copied[1], batch))
+                removed = cursor.rowcount
+                first, last = cursor.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM {schema}.sales").fetchone()
+                cursor.execute("""
+                    INSERT INTO sales_archives (month, path, rows, first_timestamp, last_timestamp, batch)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (month) DO UPDATE SET
+                        rows = rows + excluded.rows,
+                        first_timestamp = excluded.first_timestamp,
+                        last_timestamp = excluded.last_timestamp,
+                        batch = excluded.batch,
+                        archived_at = CURRENT_TIMESTAMP
+                """, (month, path, removed, first, last, batch))
+                return removed
+            
+            moved += write_transaction(conn, remove)
+            committed = batch
+            last_id = copied[1]
+    finally:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute(f"DETACH DATABASE {schema}")
+    return moved
+
+
+@timed("archive.sales")
+def archive_sales(conn: sqlite3.Connection, older_than_days: int = DEFAULT_ARCHIVE_AFTER_DAYS,
+                  archive_dir: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                  now: Optional[datetime.datetime] = None) -> Dict:
+    """Move synced sales older than older_than_days into per-month archive files.
+    
+    Only synced rows already counted in the rollups are moved, so the sync
+    outbox and the rollups are unaffected and summary reports still come
+    straight from the rollups. Rows move in batches of batch_size, each
+    copied (and committed) into the archive before it is deleted from the
+    hot table, so the hot database is locked only briefly at a time and an
+    interrupted run loses nothing; running it again carries on.
+    
+    These batches bypass the write coordinator: they read and write the
+    archive file ATTACHed to conn, which the coordinator's writer thread
+    cannot see. Each is a short write_transaction with the usual retry.
+    """
+    # Sales above the watermark stay in the hot table until checkout, ingestion or catch_up folds them in
+    through_id = rollups.get_rollup_watermark(conn)
+    # Sale times are UTC, so the cutoff is a UTC midnight
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    cutoff = (now - datetime.timedelta(days=older_than_days)).date()
+    before = calendar.timegm(cutoff.timetuple())
+    
+    months = [row[0] for row in conn.execute("""
+        SELECT DISTINCT substr(timestamp, 1, 7) FROM sales
+        WHERE epoch < ? AND synced = 1 AND id <= ?
+        ORDER BY 1
+    """, (before, through_id)).fetchall() if row[0] and _MONTH.match(row[0])]
+    
+    moved = {}
+    for month in months:
+        moved[month] = _archive_month(conn, month, before, through_id, archive_dir, max(1, int(batch_size)))
+    return {"before": str(cutoff), "months": moved, "rows": sum(moved.values())}
+
+
+def main(argv: List[str]) -> int:
+    """python archive.py [db] [archive [days] | list | rebuild | check] [--vacuum]"""
+    args = [arg for arg in argv[1:] if arg != "--vacuum"]
+    db_name = args[0] if args else "pos_system.db"
+    command = args[1] if len(args) > 1 else "archive"
+    
+    from migrations import migrate
+    
+    conn = sqlite3.connect(db_name)
+    conn.row_factory = sqlite3.Row
+    try:
+        migrate(conn)
+        if command == "archive":
+            days = int(args[2]) if len(args) > 2 else DEFAULT_ARCHIVE_AFTER_DAYS
+            result = archive_sales(conn, days)
+            for month, rows in result["months"].items():
+                print(f"  {month}: {rows} sales archived")
+            print(f"{db_name}: archived {result['rows']} synced sales from before {result['before']}")
+            if "--vacuum" in argv:
+                # Deleted pages are reused anyway; VACUUM also gives them back to the filesystem
+                conn.execute("VACUUM")
+        elif command == "list":
+            for archive in list_archives(conn):
+                print(f"  {archive['month']}: {archive['rows']} sales, {archive['first_timestamp']} .. "
+                      f"{archive['last_timestamp']} in {archive['path']}")
+        elif command == "rebuild":
+            rebuild_rollups(conn)
+            print(f"{db_name}: rollups rebuilt from the hot table and {len(list_archives(conn))} archives")
+        elif command == "check":
+            mismatches = check_rollups(conn)
+            print(f"{db_name}: {len(mismatches)} mismatched rollup buckets")
+            return 1 if mismatches else 0
+        else:
+            print(f"Unknown command: {command}")
+            return 2
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,5 @@
+# benchmarks (Synthetic data generator and reproducible performance suite)
+#
+#   python -m benchmarks.datagen bench.db --rows 1000000
+#   python -m benchmarks.run --rows 100000 --out results.json
+#   python -m benchmarks.run --compare old.json new.json
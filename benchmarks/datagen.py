@@ -0,0 +1,288 @@
+# benchmarks/datagen.py (Synthetic catalogs and sales histories)
+import argparse
+import bisect
+import calendar
+import datetime
+import math
+import random
+import sqlite3
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from archive import rebuild_rollups
+from migrations import migrate
+from sync import set_sync_watermark
+
+DEFAULT_PRODUCTS = 10000
+DEFAULT_ROWS = 100000
+DEFAULT_DAYS = 365
+DEFAULT_BASKET = "geometric"
+DEFAULT_BASKET_MEAN = 2.5
+DEFAULT_TIME_PROFILE = "retail"
+DEFAULT_SYNCED_FRACTION = 0.9
+DEFAULT_POPULARITY_SKEW = 1.0
+DEFAULT_BATCH_ROWS = 50000
+DEFAULT_SEED = 42
+
+BASKET_DISTRIBUTIONS = ("geometric", "poisson", "uniform", "fixed")
+TIME_PROFILES = ("uniform", "retail")
+
+# Share of a trading day's transactions per hour (store open 08:00-21:00,
+# lunch and after-work peaks) and per weekday (Monday first)
+RETAIL_HOURS = {8: 3, 9: 5, 10: 6, 11: 8, 12: 12, 13: 11, 14: 7, 15: 6, 16: 7, 17: 10, 18: 11, 19: 8, 20: 6}
+RETAIL_WEEKDAYS = [0.85, 0.85, 0.9, 0.95, 1.15, 1.4, 1.0]
+
+_WORDS = ["Classic", "Organic", "Premium", "Compact", "Deluxe", "Fresh", "Wireless", "Family", "Mini", "Pro",
+          "Large", "Small", "Eco", "Smart", "Value", "Ultra", "Basic", "Golden", "Spiced", "Vintage"]
+_NOUNS = ["Coffee", "Tea", "Bread", "Cheese", "Mouse", "Keyboard", "Lamp", "Chair", "Desk", "Bottle",
+          "Notebook", "Pen", "Cable", "Charger", "Soap", "Shampoo", "Juice", "Rice", "Pasta", "Chocolate"]
+
+
+def basket_sampler(kind: str, mean: float, rng: random.Random) -> Callable[[], int]:
+    """Lines per transaction (always at least 1) with the given mean"""
+    if kind not in BASKET_DISTRIBUTIONS:
+        raise ValueError(f"Unknown basket distribution: {kind}")
+    mean = max(1.0, mean)
+    if kind == "fixed":
+        size = max(1, round(mean))
+        return lambda: size
+    if kind == "uniform":
+        high = max(1, round(2 * mean - 1))
+        return lambda: rng.randint(1, high)
+    if kind == "poisson":
+        # 1 + Poisson(mean - 1), by Knuth's method (means are small)
+        limit = math.exp(-(mean - 1))
+        
+        def poisson():
+            k, p = 0, rng.random()
+            while p > limit:
+                k += 1
+                p *= rng.random()
+            return 1 + k
+        return poisson
+    
+    # Geometric on {1, 2, ...}: many single-item baskets, a long tail of big ones
+    p = 1.0 / mean
+    log_q = math.log(1 - p) if p < 1 else None
+    return lambda: 1 if log_q is None else 1 + int(math.log(1.0 - rng.random()) / log_q)
+
+
+def time_sampler(profile: str, rng: random.Random) -> Callable[[], int]:
+    """Seconds into a trading day"""
+    if profile not in TIME_PROFILES:
+        raise ValueError(f"Unknown time profile: {profile}")
+    if profile == "uniform":
+        return lambda: rng.randrange(86400)
+    
+    hours = list(RETAIL_HOURS)
+    cumulative = []
+    total = 0
+    for hour in hours:
+        total += RETAIL_HOURS[hour]
+        cumulative.append(total)
+    return lambda: rng.choices(hours, cum_weights=cumulative)[0] * 3600 + rng.randrange(3600)
+
+
+def generate_catalog(conn: sqlite3.Connection, products: int = DEFAULT_PRODUCTS, categories: int = 20,
+                     seed: int = DEFAULT_SEED) -> List[Dict]:
+    """Insert a synthetic catalog; returns [{'id', 'price'}] for the sales generator.
+    
+    A database that already has one (from an earlier run) keeps it.
+    """
+    existing = [dict(id=row[0], price=row[1]) for row in
+                conn.execute("SELECT id, price FROM products WHERE sku LIKE 'BENCH%' ORDER BY id")]
+    if existing:
+        return existing
+    
+    rng = random.Random(seed)
+    category_names = [f"Category {i + 1:02d}" for i in range(categories)]
+    rows = []
+    for i in range(products):
+        name = f"{rng.choice(_WORDS)} {rng.choice(_NOUNS)} {i + 1}"
+        # Log-normal prices: mostly a few dollars, some expensive items
+        price = round(min(5000.0, rng.lognormvariate(2.3, 1.0)), 2) or 0.99
+        rows.append((name, price, rng.choice(category_names), 10 ** 9, f"BENCH{i + 1:09d}"))
+    
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT INTO products (name, price, category, stock_quantity, sku) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    return [dict(id=row[0], price=row[1]) for row in
+            conn.execute("SELECT id, price FROM products WHERE sku LIKE 'BENCH%' ORDER BY id")]
+
+
+def generate_sales(conn: sqlite3.Connection, catalog: List[Dict], rows: int = DEFAULT_ROWS,
+                   days: int = DEFAULT_DAYS, end_date: Optional[datetime.date] = None,
+                   basket: str = DEFAULT_BASKET, basket_mean: float = DEFAULT_BASKET_MEAN,
+                   time_profile: str = DEFAULT_TIME_PROFILE, synced_fraction: float = DEFAULT_SYNCED_FRACTION,
+                   popularity_skew: float = DEFAULT_POPULARITY_SKEW, batch_rows: int = DEFAULT_BATCH_ROWS,
+                   seed: int = DEFAULT_SEED, progress: Optional[Callable[[int], None]] = None) -> Dict:
+    """Append `rows` sale lines spread over `days` days ending at end_date.
+    
+    Transactions are written in time order (so sales.id follows timestamp,
+    as at a real till). Products are drawn with Zipf-like popularity, the
+    oldest synced_fraction of lines is marked synced with the sync
+    watermark set accordingly, and the rollups are rebuilt at the end.
+    """
+    rng = random.Random(seed + 1)
+    next_basket = basket_sampler(basket, basket_mean, rng)
+    next_second = time_sampler(time_profile, rng)
+    end_date = end_date or datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=days - 1)
+    
+    popularity = []
+    total = 0.0
+    for rank in range(1, len(catalog) + 1):
+        total += 1.0 / rank ** popularity_skew
+        popularity.append(total)
+    # Shuffle which products are popular so it does not follow id order
+    ranked = list(catalog)
+    rng.shuffle(ranked)
+    
+    weekday_weights = RETAIL_WEEKDAYS if time_profile == "retail" else [1.0] * 7
+    day_weights = [weekday_weights[(start_date + datetime.timedelta(days=d)).weekday()] for d in range(days)]
+    weight_total = sum(day_weights)
+    transactions_total = rows / max(1.0, basket_mean)
+    
+    synced_rows = int(rows * synced_fraction)
+    first_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sales").fetchone()[0] + 1
+    started = time.perf_counter()
+    written = 0
+    transactions = 0
+    batch = []
+    
+    def flush():
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("""
+                INSERT INTO sales (transaction_id, product_id, quantity, price, total, timestamp, epoch, synced)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, batch)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        batch.clear()
+        if progress is not None:
+            progress(written)
+    
+    carry = 0.0
+    for day in range(days):
+        if written >= rows:
+            break
+        date = start_date + datetime.timedelta(days=day)
+        midnight = datetime.datetime(date.year, date.month, date.day)
+        # Spread the fractional part across days so the total comes out right
+        expected = transactions_total * day_weights[day] / weight_total + carry
+        count = int(expected)
+        carry = expected - count
+        if day == days - 1:
+            count = max(count, 1 << 62)  # the last day takes whatever is left
+        
+        seconds = sorted(next_second() for _ in range(min(count, rows - written)))
+        for second in seconds:
+            if written >= rows:
+                break
+            stamp = midnight + datetime.timedelta(seconds=second)
+            timestamp = stamp.strftime("%Y-%m-%d %H:%M:%S")
+            epoch = calendar.timegm(stamp.timetuple())
+            transaction_id = f"TXN{stamp:%Y%m%d%H%M%S}{(transactions // 10000) % 1000:03d}-BENCH-{transactions % 10000:04d}"
+            transactions += 1
+            
+            for _ in range(min(next_basket(), rows - written)):
+                product = ranked[bisect.bisect_left(popularity, rng.random() * total)]
+                quantity = 1 if rng.random() < 0.85 else rng.randint(2, 4)
+                batch.append((transaction_id, product['id'], quantity, product['price'],
+                              round(product['price'] * quantity, 2), timestamp, epoch,
+                              1 if written < synced_rows else 0))
+                written += 1
+            
+            if len(batch) >= batch_rows:
+                flush()
+    if batch:
+        flush()
+    generate_seconds = time.perf_counter() - started
+    
+    # Everything up to the last synced line counts as synced for the outbox
+    if synced_rows:
+        conn.execute("BEGIN IMMEDIATE")
+        set_sync_watermark(conn.cursor(), first_id + synced_rows - 1)
+        conn.commit()
+    
+    started = time.perf_counter()
+    rebuild_rollups(conn)
+    return {
+        "rows": written,
+        "transactions": transactions,
+        "synced_rows": synced_rows,
+        "first_date": str(start_date),
+        "last_date": str(end_date),
+        "seconds": round(generate_seconds, 3),
+        "rows_per_second": round(written / generate_seconds) if generate_seconds else None,
+        "rollup_rebuild_seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def generate_database(db_name: str, products: int = DEFAULT_PRODUCTS, rows: int = DEFAULT_ROWS,
+                      seed: int = DEFAULT_SEED, **options) -> Dict:
+    """Create (or extend) a database file with a synthetic catalog and sales history"""
+    conn = sqlite3.connect(db_name)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        migrate(conn)
+        started = time.perf_counter()
+        catalog = generate_catalog(conn, products, seed=seed)
+        catalog_seconds = time.perf_counter() - started
+        result = generate_sales(conn, catalog, rows, seed=seed, **options)
+        result.update({"products": len(catalog), "catalog_seconds": round(catalog_seconds, 3), "seed": seed})
+        conn.execute("PRAGMA optimize")
+        return result
+    finally:
+        conn.close()
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.datagen",
+                                     description="Generate a synthetic POS database")
+    parser.add_argument("db", help="database file to create or extend")
+    parser.add_argument("--products", type=int, default=DEFAULT_PRODUCTS)
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="sale lines (10k to 50M)")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS)
+    parser.add_argument("--end-date", type=datetime.date.fromisoformat, default=None)
+    parser.add_argument("--basket", choices=BASKET_DISTRIBUTIONS, default=DEFAULT_BASKET)
+    parser.add_argument("--basket-mean", type=float, default=DEFAULT_BASKET_MEAN)
+    parser.add_argument("--time-profile", choices=TIME_PROFILES, default=DEFAULT_TIME_PROFILE)
+    parser.add_argument("--synced-fraction", type=float, default=DEFAULT_SYNCED_FRACTION)
+    parser.add_argument("--popularity-skew", type=float, default=DEFAULT_POPULARITY_SKEW)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args(argv[1:])
+    
+    def progress(written):
+        print(f"\r  {written:,} / {args.rows:,} rows", end="", file=sys.stderr, flush=True)
+    
+    result = generate_database(
+        args.db, products=args.products, rows=args.rows, seed=args.seed, days=args.days, end_date=args.end_date,
+        basket=args.basket, basket_mean=args.basket_mean, time_profile=args.time_profile,
+        synced_fraction=args.synced_fraction, popularity_skew=args.popularity_skew, progress=progress
+    )
+    print(file=sys.stderr)
+    for key, value in result.items():
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
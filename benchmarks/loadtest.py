@@ -0,0 +1,320 @@
+# benchmarks/loadtest.py (Concurrent load test of the Flask API: latency, throughput, errors)
+import argparse
+import datetime
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.datagen import DEFAULT_SEED, generate_database
+from benchmarks.run import environment, percentiles
+
+DEFAULT_CONCURRENCY = (1, 4, 16, 32)
+DEFAULT_DURATION = 20.0  # seconds per concurrency level
+DEFAULT_WARMUP = 2.0
+DEFAULT_PRODUCTS = 5000
+DEFAULT_ROWS = 200000
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MIX = "product=50,search=10,catalog=2,sale=25,summary=8,top=5"
+DEFAULT_STARTUP_TIMEOUT = 30.0
+
+REPORT_WINDOW_DAYS = 30
+
+# Request kinds a mix can weight; LoadClient.request_for builds each one
+OPERATIONS = ("product", "search", "catalog", "sales_page", "sale", "summary", "top")
+
+
+def parse_mix(mix: str) -> List[Tuple[str, float]]:
+    """'product=50,sale=25,...' -> [(name, weight), ...]"""
+    weights = []
+    for part in mix.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r} (choose from {', '.join(OPERATIONS)})")
+        weights.append((name, float(weight or 1)))
+    if not weights or sum(weight for name, weight in weights) <= 0:
+        raise ValueError("The operation mix needs at least one positive weight")
+    return weights
+
+
+def classify(status: Optional[int], body: bytes) -> Optional[str]:
+    """Error class of a response (None for success)"""
+    if status is None:
+        return "connection"
+    if b"database is locked" in body or b"database is busy" in body:
+        return "database_locked"
+    if status >= 400:
+        return f"http_{status}"
+    return None
+
+
+class Fixtures:
+    """IDs and names sampled from the target database, so requests hit real rows"""
+    
+    def __init__(self, product_ids: List[int], names: List[str], last_day: Optional[datetime.date]):
+        self.product_ids = product_ids
+        self.names = names
+        self.last_day = last_day or datetime.date.today()
+    
+    @classmethod
+    def fetch(cls, host: str, port: int, timeout: float = DEFAULT_TIMEOUT) -> "Fixtures":
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        try:
+            conn.request("GET", "/api/products")
+            products = json.loads(conn.getresponse().read())
+            conn.request("GET", "/api/sales?limit=1")
+            latest = json.loads(conn.getresponse().read()).get("sales") or []
+        finally:
+            conn.close()
+        if not products:
+            raise RuntimeError("The target database has no products to sell")
+        
+        # Only products with plenty of stock, so sale writes do not fail on shortages
+        in_stock = [product for product in products if product.get("stock_quantity", 0) > 1000] or products
+        last_day = datetime.date.fromisoformat(latest[0]["timestamp"][:10]) if latest else None
+        return cls([product["id"] for product in in_stock], [product["name"] for product in in_stock], last_day)
+
+
+class LoadClient(threading.Thread):
+    """One simulated terminal: a persistent connection issuing weighted random requests"""
+    
+    def __init__(self, host: str, port: int, fixtures: Fixtures, mix: List[Tuple[str, float]],
+                 stop_at: float, record_after: float, seed: int, timeout: float = DEFAULT_TIMEOUT):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.fixtures = fixtures
+        self.names = [name for name, weight in mix]
+        self.weights = [weight for name, weight in mix]
+        self.stop_at = stop_at
+        self.record_after = record_after
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        # name -> {"latencies": [...], "errors": {class: count}}
+        self.results = {name: {"latencies": [], "errors": {}} for name in self.names}
+    
+    def request_for(self, name: str) -> Tuple[str, str, Optional[bytes]]:
+        rng = self.rng
+        fixtures = self.fixtures
+        if name == "product":
+            return "GET", f"/api/products/{rng.choice(fixtures.product_ids)}", None
+        if name == "search":
+            term = rng.choice(fixtures.names)[:rng.randint(2, 6)]
+            return "GET", "/api/products/search?" + urllib.parse.urlencode({"q": term}), None
+        if name == "catalog":
+            return "GET", "/api/products", None
+        if name == "sales_page":
+            return "GET", "/api/sales?limit=100", None
+        if name == "sale":
+            items = [{"product_id": rng.choice(fixtures.product_ids), "quantity": rng.randint(1, 3)}
+                     for _ in range(rng.randint(1, 5))]
+            return "POST", "/api/sales", json.dumps({"items": items}).encode("utf-8")
+        
+        # Reports over a random window inside the last month of data
+        start = fixtures.last_day - datetime.timedelta(days=rng.randint(1, REPORT_WINDOW_DAYS))
+        end = start + datetime.timedelta(days=rng.randint(1, 7))
+        query = urllib.parse.urlencode({"start_date": str(start), "end_date": str(end)})
+        path = "/api/reports/summary" if name == "summary" else "/api/reports/top-products"
+        return "GET", f"{path}?{query}", None
+    
+    def run(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = {"Content-Type": "application/json"}
+        try:
+            while True:
+                now = time.perf_counter()
+                if now >= self.stop_at:
+                    break
+                name = self.rng.choices(self.names, self.weights)[0]
+                method, path, body = self.request_for(name)
+                
+                start = time.perf_counter()
+                try:
+                    conn.request(method, path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    status, data = response.status, response.read()
+                except (OSError, http.client.HTTPException):
+                    status, data = None, b""
+                    conn.close()
+                elapsed = time.perf_counter() - start
+                
+                if start < self.record_after:
+                    continue
+                result = self.results[name]
+                result["latencies"].append(elapsed)
+                error = classify(status, data)
+                if error is not None:
+                    result["errors"][error] = result["errors"].get(error, 0) + 1
+        finally:
+            conn.close()
+
+
+def run_stage(host: str, port: int, fixtures: Fixtures, mix: List[Tuple[str, float]], concurrency: int,
+              duration: float, warmup: float, seed: int, timeout: float = DEFAULT_TIMEOUT) -> Dict:
+    """Drive the API with `concurrency` clients for warmup + duration seconds"""
+    started = time.perf_counter()
+    record_after = started + warmup
+    stop_at = record_after + duration
+    clients = [LoadClient(host, port, fixtures, mix, stop_at, record_after, seed + i, timeout)
+               for i in range(concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    # Requests still in flight at stop_at finish late; measure to the last one
+    seconds = max(time.perf_counter() - record_after, 1e-9)
+    
+    operations = {}
+    all_latencies = []
+    all_errors = {}
+    for name, weight in mix:
+        latencies = [value for client in clients for value in client.results[name]["latencies"]]
+        errors = {}
+        for client in clients:
+            for error, count in client.results[name]["errors"].items():
+                errors[error] = errors.get(error, 0) + count
+                all_errors[error] = all_errors.get(error, 0) + count
+        all_latencies.extend(latencies)
+        summary = percentiles(latencies)
+        summary["requests_per_second"] = round(len(latencies) / seconds, 1)
+        summary["errors"] = errors
+        summary["error_rate"] = round(sum(errors.values()) / len(latencies), 4) if latencies else 0.0
+        operations[name] = summary
+    
+    total = percentiles(all_latencies)
+    total["requests_per_second"] = round(len(all_latencies) / seconds, 1)
+    total["errors"] = all_errors
+    total["error_rate"] = round(sum(all_errors.values()) / len(all_latencies), 4) if all_latencies else 0.0
+    total["database_locked"] = all_errors.get("database_locked", 0)
+    return {"concurrency": concurrency, "seconds": round(seconds, 2), "total": total, "operations": operations}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(host: str, port: int, process: Optional[subprocess.Popen], timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"The API server exited with code {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request("GET", "/api/db/stats")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except (OSError, http.client.HTTPException):
+            time.sleep(0.2)
+    raise RuntimeError(f"The API server did not answer on {host}:{port} within {timeout}s")
+
+
+def start_server(db_name: str, port: int, quiet: bool = True) -> subprocess.Popen:
+    """Run app.py under the Flask CLI (threaded, no reloader or debugger) against db_name"""
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, POS_DATABASE=db_name)
+    output = subprocess.DEVNULL if quiet else None
+    return subprocess.Popen(
+        [sys.executable, "-m", "flask", "--app", "app", "run", "--host", "127.0.0.1", "--port", str(port),
+         "--with-threads", "--no-reload", "--no-debugger"],
+        cwd=repo, env=env, stdout=output, stderr=output
+    )
+
+
+def print_stage(stage: Dict):
+    total = stage["total"]
+    print(f"concurrency {stage['concurrency']:>4}: {total['requests_per_second']:>8} req/s  "
+          f"p50 {total.get('p50_ms', 0):>8.2f} ms  p95 {total.get('p95_ms', 0):>8.2f} ms  "
+          f"p99 {total.get('p99_ms', 0):>8.2f} ms  errors {total['error_rate'] * 100:.2f}%  "
+          f"locked {total['database_locked']}")
+    for name, summary in stage["operations"].items():
+        if not summary["count"]:
+            continue
+        errors = ", ".join(f"{error} {count}" for error, count in sorted(summary["errors"].items()))
+        print(f"    {name:<11} {summary['requests_per_second']:>8} req/s  p50 {summary['p50_ms']:>8.2f}  "
+              f"p95 {summary['p95_ms']:>8.2f}  p99 {summary['p99_ms']:>8.2f}" + (f"  [{errors}]" if errors else ""))
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest",
+                                     description="Concurrent load test of the POS web API")
+    parser.add_argument("--url", help="running server to target (e.g. http://127.0.0.1:5000); "
+                                      "default: start app.py on a generated database")
+    parser.add_argument("--db", help="database to serve (copied first) instead of generating one")
+    parser.add_argument("--products", type=int, default=DEFAULT_PRODUCTS)
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="sale lines to generate")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(DEFAULT_CONCURRENCY),
+                        help="client counts, one stage each (ramp to find the knee)")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="measured seconds per stage")
+    parser.add_argument("--warmup", type=float, default=DEFAULT_WARMUP, help="unmeasured seconds per stage")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted operations ({', '.join(OPERATIONS)})")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="per-request timeout (s)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--server-log", action="store_true", help="show the server's output")
+    parser.add_argument("--out", help="write JSON results here")
+    args = parser.parse_args(argv[1:])
+    
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    workdir = None
+    process = None
+    try:
+        if args.url:
+            target = urllib.parse.urlsplit(args.url)
+            host, port = target.hostname, target.port or 80
+        else:
+            workdir = tempfile.mkdtemp(prefix="pos-load-")
+            db_name = os.path.join(workdir, "load.db")
+            if args.db:
+                shutil.copyfile(args.db, db_name)
+            else:
+                print(f"generating {args.rows} sale lines over {args.products} products ...")
+                generate_database(db_name, products=args.products, rows=args.rows, seed=args.seed)
+            host, port = "127.0.0.1", free_port()
+            process = start_server(db_name, port, quiet=not args.server_log)
+        
+        wait_until_ready(host, port, process, DEFAULT_STARTUP_TIMEOUT)
+        fixtures = Fixtures.fetch(host, port, args.timeout)
+        
+        stages = []
+        for concurrency in args.concurrency:
+            stage = run_stage(host, port, fixtures, mix, concurrency, args.duration, args.warmup,
+                              args.seed, args.timeout)
+            print_stage(stage)
+            stages.append(stage)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    if args.out:
+        params = {key: getattr(args, key) for key in ("url", "db", "products", "rows", "duration", "warmup",
+                                                       "mix", "seed")}
+        with open(args.out, "w") as f:
+            json.dump({"environment": environment(), "params": params, "stages": stages}, f, indent=2)
+            f.write("\n")
+        print(f"results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
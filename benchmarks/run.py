@@ -0,0 +1,332 @@
+# benchmarks/run.py (Reproducible benchmark suite; JSON results comparable across commits)
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.datagen import DEFAULT_PRODUCTS, DEFAULT_ROWS, DEFAULT_SEED, basket_sampler, generate_database
+from db import close_all_managers
+from report_cache import get_report_cache
+
+DEFAULT_SALES = 2000
+DEFAULT_REPORT_REPEAT = 20
+DEFAULT_MAX_LIST_ROWS = 2000000  # get_unsynced_sales() builds a list; skip beyond this
+
+BENCHMARKS = ("process_sale", "get_sales_report", "api_reports", "unsynced_memory", "sync_drain")
+
+
+def percentiles(samples: List[float]) -> Dict:
+    """Latency summary in milliseconds (nearest-rank percentiles)"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    
+    def rank(q):
+        return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))] * 1000
+    
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4),
+        "p50_ms": round(rank(0.50), 4),
+        "p95_ms": round(rank(0.95), 4),
+        "p99_ms": round(rank(0.99), 4),
+        "max_ms": round(ordered[-1] * 1000, 4)
+    }
+
+
+def time_calls(func: Callable[[], object], repeat: int, before: Optional[Callable[[], None]] = None) -> Dict:
+    samples = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def environment() -> Dict:
+    """What the numbers were measured on (commit, interpreter, SQLite, machine)"""
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=repo, capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+    
+    return {
+        "git_commit": git("rev-parse", "HEAD"),
+        "git_dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "measured_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+def copy_archives(db_name: str, workdir: str):
+    """Copy the sales archive files of db_name next to its benchmark copy (paths are relative)"""
+    conn = sqlite3.connect(db_name)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sales_archives'").fetchone() is None:
+            return
+        paths = [row[0] for row in conn.execute("SELECT path FROM sales_archives")]
+    finally:
+        conn.close()
+    for path in paths:
+        target = os.path.join(workdir, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(os.path.join(os.path.dirname(os.path.abspath(db_name)), path), target)
+
+
+def date_ranges(conn: sqlite3.Connection) -> Dict[str, tuple]:
+    """Report ranges: everything, the last 30 days (day-aligned) and an unaligned slice"""
+    last = conn.execute("SELECT MAX(timestamp) FROM sales").fetchone()[0]
+    if last is None:
+        return {"all_time": (None, None)}
+    last_day = datetime.date.fromisoformat(last[:10])
+    month_start = str(last_day - datetime.timedelta(days=29))
+    return {
+        "all_time": (None, None),
+        # A date-only end date includes that whole day
+        "last_30_days": (month_start, str(last_day)),
+        # Not aligned to day or hour buckets, so answered from the raw sales table
+        "unaligned_7_days": (f"{last_day - datetime.timedelta(days=7)} 10:30:00", f"{last_day} 15:45:00")
+    }
+
+
+def bench_process_sale(pos, sales: int, seed: int) -> Dict:
+    """Checkout throughput and latency through POSSystem.process_sale"""
+    rng = random.Random(seed)
+    conn = pos.db.connection()
+    product_ids = [row[0] for row in conn.execute("SELECT id FROM products WHERE stock_quantity > 1000")]
+    next_basket = basket_sampler("geometric", 2.5, rng)
+    baskets = [[{"product_id": rng.choice(product_ids), "quantity": 1} for _ in range(next_basket())]
+               for _ in range(sales)]
+    
+    samples = []
+    started = time.perf_counter()
+    for items in baskets:
+        start = time.perf_counter()
+        pos.process_sale(items)
+        samples.append(time.perf_counter() - start)
+    seconds = time.perf_counter() - started
+    result = percentiles(samples)
+    result.update({
+        "sales_per_second": round(sales / seconds, 1),
+        "lines": sum(len(items) for items in baskets)
+    })
+    return result
+
+
+def bench_get_sales_report(pos, repeat: int) -> Dict:
+    """POSSystem.get_sales_report, cold (cache cleared each call) and warm"""
+    results = {}
+    for name, (start_date, end_date) in date_ranges(pos.db.connection()).items():
+        results[name] = {
+            "cold": time_calls(lambda: pos.get_sales_report(start_date, end_date), repeat,
+                               before=get_report_cache().clear),
+            "warm": time_calls(lambda: pos.get_sales_report(start_date, end_date), repeat)
+        }
+    return results
+
+
+def bench_api_reports(db_name: str, repeat: int) -> Dict:
+    """/api/reports/* latency through the Flask test client"""
+    import app as web
+    
+    web.DATABASE = db_name
+    web._schema_ready = False
+    client = web.app.test_client()
+    conn = sqlite3.connect(db_name)
+    try:
+        ranges = date_ranges(conn)
+    finally:
+        conn.close()
+    
+    results = {}
+    for endpoint in ("/api/reports/summary", "/api/reports/top-products", "/api/reports/analytics"):
+        for name, (start_date, end_date) in ranges.items():
+            query = {key: value for key, value in (("start_date", start_date), ("end_date", end_date)) if value}
+            url = endpoint + ("?" + "&".join(f"{key}={value}" for key, value in query.items()) if query else "")
+            etag = client.get(url).headers.get("ETag")
+            results[f"{endpoint} {name}"] = {
+                "cold": time_calls(lambda: client.get(url), repeat, before=get_report_cache().clear),
+                "warm": time_calls(lambda: client.get(url), repeat),
+                "not_modified": time_calls(lambda: client.get(url, headers={"If-None-Match": etag}), repeat)
+            }
+    close_all_managers(db_name)
+    return results
+
+
+def bench_unsynced_memory(pos, max_list_rows: int) -> Dict:
+    """Peak Python memory of get_unsynced_sales() (a list) vs iter_unsynced_sales() (streamed)"""
+    conn = pos.db.connection()
+    pending = conn.execute("SELECT COUNT(*) FROM sales WHERE synced = 0").fetchone()[0]
+    results = {"pending_lines": pending}
+    
+    if pending <= max_list_rows:
+        tracemalloc.start()
+        start = time.perf_counter()
+        rows = len(pos.get_unsynced_sales())
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results["list"] = {"rows": rows, "seconds": round(seconds, 3), "peak_mb": round(peak / 2 ** 20, 2)}
+    else:
+        results["list"] = {"skipped": f"more than {max_list_rows} pending lines"}
+    
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = sum(1 for _ in pos.iter_unsynced_sales())
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results["streamed"] = {"rows": rows, "seconds": round(seconds, 3), "peak_mb": round(peak / 2 ** 20, 2)}
+    return results
+
+
+def bench_sync_drain(pos) -> Dict:
+    """Drain the whole outbox to a local stand-in cloud server"""
+    from pos_system import CloudSync
+    from sync import LocalCloudServer
+    
+    with LocalCloudServer() as server:
+        cloud = CloudSync(server.url, "benchmark")
+        start = time.perf_counter()
+        stats = pos.sync_to_cloud(cloud)
+        seconds = time.perf_counter() - start
+    return {
+        "transactions": stats.get("transactions"),
+        "lines": stats.get("lines"),
+        "seconds": round(seconds, 3),
+        "transactions_per_second": round(stats.get("transactions", 0) / seconds, 1) if seconds else None,
+        "lines_per_second": round(stats.get("lines", 0) / seconds, 1) if seconds else None,
+        "chunks": stats.get("chunks"),
+        "failed": stats.get("failed"),
+        "bytes_sent": stats.get("bytes_sent")
+    }
+
+
+def run_suite(db_name: str, benchmarks=BENCHMARKS, sales: int = DEFAULT_SALES, repeat: int = DEFAULT_REPORT_REPEAT,
+              max_list_rows: int = DEFAULT_MAX_LIST_ROWS, seed: int = DEFAULT_SEED) -> Dict:
+    """Run the selected benchmarks against a database file (which they modify).
+    
+    Order matters and is fixed: reads first, then the sync drain (marks the
+    outbox synced), then checkout (appends sales).
+    """
+    from pos_system import POSSystem
+    
+    pos = POSSystem(db_name)
+    results = {}
+    try:
+        if "get_sales_report" in benchmarks:
+            results["get_sales_report"] = bench_get_sales_report(pos, repeat)
+        if "api_reports" in benchmarks:
+            results["api_reports"] = bench_api_reports(db_name, repeat)
+        if "unsynced_memory" in benchmarks:
+            results["unsynced_memory"] = bench_unsynced_memory(pos, max_list_rows)
+        if "sync_drain" in benchmarks:
+            results["sync_drain"] = bench_sync_drain(pos)
+        if "process_sale" in benchmarks:
+            results["process_sale"] = bench_process_sale(pos, sales, seed)
+    finally:
+        close_all_managers(db_name)
+    return results
+
+
+def flatten(data: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(old_path: str, new_path: str) -> int:
+    """Print every numeric result side by side with the relative change"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    
+    print(f"old: {old['environment'].get('git_commit')}  new: {new['environment'].get('git_commit')}")
+    if old.get("params") != new.get("params"):
+        print("warning: the runs used different parameters")
+    old_flat = flatten(old["results"])
+    new_flat = flatten(new["results"])
+    for key in sorted(set(old_flat) | set(new_flat)):
+        before, after = old_flat.get(key), new_flat.get(key)
+        if before is None or after is None:
+            print(f"  {key}: {before} -> {after}")
+            continue
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"  {key}: {before} -> {after} ({change})")
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Run the POS benchmark suite")
+    parser.add_argument("--db", help="existing database to benchmark (copied first); default: generate one")
+    parser.add_argument("--products", type=int, default=DEFAULT_PRODUCTS)
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="sale lines to generate")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--sales", type=int, default=DEFAULT_SALES, help="checkouts to time")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPORT_REPEAT, help="calls per report timing")
+    parser.add_argument("--max-list-rows", type=int, default=DEFAULT_MAX_LIST_ROWS)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--out", help="write JSON results here")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    args = parser.parse_args(argv[1:])
+    
+    if args.compare:
+        return compare(*args.compare)
+    
+    workdir = tempfile.mkdtemp(prefix="pos-bench-")
+    db_name = os.path.join(workdir, "bench.db")
+    try:
+        generation = None
+        if args.db:
+            shutil.copyfile(args.db, db_name)
+            copy_archives(args.db, workdir)
+        else:
+            generation = generate_database(db_name, products=args.products, rows=args.rows, seed=args.seed)
+        
+        output = {
+            "environment": environment(),
+            "params": {key: getattr(args, key) for key in ("db", "products", "rows", "seed", "sales", "repeat")},
+            "results": run_suite(db_name, args.only, args.sales, args.repeat, args.max_list_rows, args.seed)
+        }
+        if generation is not None:
+            output["results"]["datagen"] = generation
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    text = json.dumps(output, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f"results written to {args.out}")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,131 @@
+# catalog_cache.py (Versioned in-memory product catalog)
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from report_cache import CATALOG_VERSION_KEY
+
+# Internal bookkeeping columns (change tracking, replication), not part of the product records handed out
+_INTERNAL_COLUMNS = ("row_version", "uid")
+
+
+class CatalogCache:
+    """In-process copy of the products table, kept current by delta refresh.
+    
+    Every product write bumps the catalog version and stamps the row with it
+    (see migration 7), and deletes leave a tombstone. refresh() compares the
+    cached version with the database's and reloads only the rows and
+    tombstones newer than it, so reads cost one version lookup instead of a
+    full SELECT * FROM products.
+    """
+    
+    def __init__(self):
+        self.version = -1
+        self._products = {}
+        self._by_category = {}
+        self._lock = threading.Lock()
+        self._stats = {"full_loads": 0, "delta_refreshes": 0, "rows_reloaded": 0, "reads": 0}
+    
+    def _store(self, row: sqlite3.Row):
+        product = {key: row[key] for key in row.keys() if key not in _INTERNAL_COLUMNS}
+        self._drop(product['id'])
+        self._products[product['id']] = product
+        self._by_category.setdefault(product['category'], {})[product['id']] = product
+    
+    def _drop(self, product_id: int):
+        old = self._products.pop(product_id, None)
+        if old is not None:
+            category = self._by_category.get(old['category'])
+            if category is not None:
+                category.pop(product_id, None)
+                if not category:
+                    del self._by_category[old['category']]
+    
+    def refresh(self, conn: sqlite3.Connection) -> int:
+        """Bring the cache up to the database's catalog version; returns rows reloaded"""
+        current = conn.execute(
+            "SELECT COALESCE(MAX(value), 0) FROM sync_state WHERE key = ?", (CATALOG_VERSION_KEY,)
+        ).fetchone()[0]
+        
+        with self._lock:
+            if current == self.version:
+                return 0
+            
+            if self.version < 0:
+                # First load: everything, including rows written before versioning existed
+                rows = conn.execute("SELECT * FROM products").fetchall()
+                self._products.clear()
+                self._by_category.clear()
+                for row in rows:
+                    self._store(row)
+                self._stats["full_loads"] += 1
+            else:
+                rows = conn.execute(
+                    "SELECT * FROM products WHERE row_version > ?", (self.version,)
+                ).fetchall()
+                deleted = conn.execute(
+                    "SELECT product_id FROM product_tombstones WHERE row_version > ?", (self.version,)
+                ).fetchall()
+                for row in deleted:
+                    self._drop(row[0])
+                for row in rows:
+                    self._store(row)
+                self._stats["delta_refreshes"] += 1
+            
+            # Rows changed after reading `current` are simply reloaded again next time
+            self.version = current
+            self._stats["rows_reloaded"] += len(rows)
+            return len(rows)
+    
+    def products(self, conn: sqlite3.Connection, category: Optional[str] = None,
+                 order_by: Optional[str] = None) -> List[Dict]:
+        """All products (or one category's), as fresh dicts, ordered by id or a column"""
+        self.refresh(conn)
+        with self._lock:
+            self._stats["reads"] += 1
+            if category is None:
+                source = self._products
+            else:
+                source = self._by_category.get(category, {})
+            products = [dict(product) for product in source.values()]
+        
+        products.sort(key=lambda product: product['id'])
+        if order_by is not None:
+            products.sort(key=lambda product: (product[order_by] is None, product[order_by]))
+        return products
+    
+    def get(self, conn: sqlite3.Connection, product_id: int) -> Optional[Dict]:
+        """One product by id, or None"""
+        self.refresh(conn)
+        with self._lock:
+            self._stats["reads"] += 1
+            product = self._products.get(int(product_id))
+            return dict(product) if product is not None else None
+    
+    def categories(self, conn: sqlite3.Connection) -> List[str]:
+        self.refresh(conn)
+        with self._lock:
+            return sorted(category for category in self._by_category if category is not None)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["version"] = self.version
+            stats["size"] = len(self._products)
+        return stats
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_catalog_cache(db_name: str = "pos_system.db") -> CatalogCache:
+    """Process-wide catalog cache for a database file (shared by the GUI and API)"""
+    key = os.path.abspath(db_name)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = CatalogCache()
+            _caches[key] = cache
+        return cache
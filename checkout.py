@@ -0,0 +1,132 @@
+# checkout.py (Set-based checkout shared by POSSystem and POSApp)
+import sqlite3
+from typing import List, Dict, Optional, Tuple
+
+from metrics import timed
+from rollups import apply_new_sales
+from writes import WriteCoordinator, write_transaction
+
+# Stay well under SQLite's host-parameter limit for IN (...) lookups
+MAX_IN_PARAMS = 500
+
+
+class InsufficientStockError(ValueError):
+    """Raised when one or more basket lines exceed the available stock"""
+    
+    def __init__(self, shortages: List[Dict]):
+        self.shortages = shortages
+        details = "; ".join(
+            f"product ID {s['product_id']} (requested {s['requested']}, available {s['available']})"
+            for s in shortages
+        )
+        super().__init__(f"Insufficient stock for {details}")
+
+
+def _aggregate_items(items: List[Dict]) -> Dict[int, int]:
+    """Merge basket lines by product, preserving first-seen order"""
+    quantities = {}
+    for item in items:
+        product_id = int(item['product_id'])
+        quantity = int(item['quantity'])
+        if quantity <= 0:
+            raise ValueError(f"Invalid quantity {quantity} for product ID {product_id}")
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def _fetch_products(cursor: sqlite3.Cursor, product_ids: List[int]) -> Dict[int, Tuple[float, int]]:
+    """Fetch price and stock for every product in the basket with IN (...) queries"""
+    products = {}
+    for start in range(0, len(product_ids), MAX_IN_PARAMS):
+        chunk = product_ids[start:start + MAX_IN_PARAMS]
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(
+            f"SELECT id, price, stock_quantity FROM products WHERE id IN ({placeholders})",
+            chunk
+        )
+        for row in cursor.fetchall():
+            products[row[0]] = (row[1], row[2])
+    return products
+
+
+def _find_shortages(quantities: Dict[int, int], products: Dict[int, Tuple[float, int]]) -> List[Dict]:
+    return [
+        {'product_id': product_id, 'requested': quantity, 'available': products[product_id][1]}
+        for product_id, quantity in quantities.items()
+        if products[product_id][1] < quantity
+    ]
+
+
+def checkout_items(cursor: sqlite3.Cursor, transaction_id: str, items: List[Dict]) -> str:
+    """Record a basket inside the caller's write transaction (see process_checkout).
+    
+    Prices and stock are read with a single IN (...) lookup, stock is
+    decremented with conditional UPDATEs, sale lines are inserted with
+    executemany and the report rollups are updated. Stock shortages raise
+    InsufficientStockError listing every short line.
+    """
+    if not items:
+        raise ValueError("Cannot process an empty sale")
+    
+    quantities = _aggregate_items(items)
+    product_ids = list(quantities)
+    products = _fetch_products(cursor, product_ids)
+    
+    missing = [product_id for product_id in product_ids if product_id not in products]
+    if len(missing) == 1:
+        raise ValueError(f"Product with ID {missing[0]} not found")
+    if missing:
+        raise ValueError(f"Products with IDs {', '.join(map(str, missing))} not found")
+    
+    shortages = _find_shortages(quantities, products)
+    if shortages:
+        raise InsufficientStockError(shortages)
+    
+    # The stock guard makes the decrement safe even if another writer slipped in
+    cursor.execute("SAVEPOINT checkout_stock")
+    cursor.executemany(
+        "UPDATE products SET stock_quantity = stock_quantity - ? WHERE id = ? AND stock_quantity >= ?",
+        [(quantity, product_id, quantity) for product_id, quantity in quantities.items()]
+    )
+    if cursor.rowcount != len(quantities):
+        # Undo the partial decrement before reporting against fresh stock levels
+        cursor.execute("ROLLBACK TO checkout_stock")
+        cursor.execute("RELEASE checkout_stock")
+        raise InsufficientStockError(_find_shortages(quantities, _fetch_products(cursor, product_ids)))
+    cursor.execute("RELEASE checkout_stock")
+    
+    # One timestamp for every line, so a transaction never straddles rollup buckets
+    timestamp, epoch = cursor.execute(
+        "SELECT CURRENT_TIMESTAMP, CAST(strftime('%s', CURRENT_TIMESTAMP) AS INTEGER)"
+    ).fetchone()
+    cursor.executemany(
+        "INSERT INTO sales (transaction_id, product_id, quantity, price, total, timestamp, epoch) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (transaction_id, int(item['product_id']), int(item['quantity']),
+             products[int(item['product_id'])][0],
+             products[int(item['product_id'])][0] * int(item['quantity']),
+             timestamp, epoch)
+            for item in items
+        ]
+    )
+    
+    # Keep the report rollups in step with the sale, in the same transaction
+    apply_new_sales(cursor)
+    return transaction_id
+
+
+@timed("checkout")
+def process_checkout(conn: sqlite3.Connection, transaction_id: str, items: List[Dict],
+                     coordinator: Optional[WriteCoordinator] = None) -> str:
+    """Record a whole basket in one BEGIN IMMEDIATE transaction.
+    
+    The write goes through the coordinator when given (queued to its
+    writer thread in single-writer mode), otherwise straight through
+    write_transaction on conn. Either way lock contention is retried with
+    jitter and any failure rolls the whole basket back.
+    """
+    if not items:
+        raise ValueError("Cannot process an empty sale")
+    if coordinator is not None:
+        return coordinator.run(checkout_items, transaction_id, items, conn=conn)
+    return write_transaction(conn, checkout_items, transaction_id, items)
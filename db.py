@@ -0,0 +1,187 @@
+# db.py (Shared SQLite connection manager)
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import metrics
+
+# Default pragmas applied to every connection handed out by a manager
+DEFAULT_JOURNAL_MODE = "WAL"
+DEFAULT_SYNCHRONOUS = "NORMAL"
+DEFAULT_BUSY_TIMEOUT = int(os.environ.get("POS_DB_BUSY_TIMEOUT", 5000))  # milliseconds
+DEFAULT_POOL_SIZE = 8
+
+_SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+class ConnectionManager:
+    """Persistent, pre-configured SQLite connections for one database file.
+    
+    Long-lived threads (the GUI, POSSystem callers, background workers) use
+    connection(), which keeps one connection per thread. Short-lived request
+    threads (Flask) use acquire()/release() or pooled(), which recycle a
+    bounded set of idle connections.
+    """
+    
+    def __init__(self, db_name: str, journal_mode: str = DEFAULT_JOURNAL_MODE,
+                 synchronous: str = DEFAULT_SYNCHRONOUS, busy_timeout: int = DEFAULT_BUSY_TIMEOUT,
+                 pool_size: int = DEFAULT_POOL_SIZE):
+        synchronous = synchronous.upper()
+        if synchronous not in _SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Invalid synchronous level: {synchronous}")
+        
+        self.db_name = db_name
+        self.journal_mode = journal_mode.upper()
+        self.synchronous = synchronous
+        self.busy_timeout = int(busy_timeout)
+        self.pool_size = int(pool_size)
+        
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread_connections = {}
+        self._idle = []
+        self._in_use = 0
+        self._stats = {"opened": 0, "closed": 0, "checkouts": 0, "reused": 0}
+    
+    def _open(self) -> sqlite3.Connection:
+        """Open a new connection and apply the configured pragmas"""
+        # Instrumented connections feed per-statement timings into metrics
+        factory = metrics.InstrumentedConnection if metrics.ENABLED else sqlite3.Connection
+        conn = sqlite3.connect(self.db_name, timeout=self.busy_timeout / 1000.0,
+                               check_same_thread=False, factory=factory)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout}")
+        conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        with self._lock:
+            self._stats["opened"] += 1
+        return conn
+    
+    def connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        with self._lock:
+            self._stats["checkouts"] += 1
+            if conn is not None:
+                self._stats["reused"] += 1
+                return conn
+        
+        conn = self._open()
+        self._local.conn = conn
+        with self._lock:
+            self._thread_connections[threading.get_ident()] = conn
+        return conn
+    
+    def acquire(self) -> sqlite3.Connection:
+        """Take a connection from the shared pool, opening one if none are idle"""
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._in_use += 1
+            if self._idle:
+                self._stats["reused"] += 1
+                return self._idle.pop()
+        
+        try:
+            return self._open()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+            raise
+    
+    def release(self, conn: sqlite3.Connection):
+        """Return a pooled connection; anything left uncommitted is rolled back"""
+        if conn.in_transaction:
+            conn.rollback()
+        
+        with self._lock:
+            self._in_use -= 1
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+            self._stats["closed"] += 1
+        conn.close()
+    
+    @contextmanager
+    def pooled(self):
+        """Context manager around acquire()/release()"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def close(self):
+        """Close the calling thread's connection, if it has one"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        
+        self._local.conn = None
+        with self._lock:
+            self._thread_connections.pop(threading.get_ident(), None)
+            self._stats["closed"] += 1
+        conn.close()
+    
+    def close_all(self):
+        """Close every idle and per-thread connection owned by this manager"""
+        with self._lock:
+            connections = list(self._thread_connections.values()) + self._idle
+            self._thread_connections.clear()
+            self._idle = []
+            self._stats["closed"] += len(connections)
+        
+        self._local = threading.local()
+        for conn in connections:
+            conn.close()
+    
+    def stats(self) -> Dict:
+        """Return pool statistics and the active pragma settings"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["thread_connections"] = len(self._thread_connections)
+            stats["pool_idle"] = len(self._idle)
+            stats["pool_in_use"] = self._in_use
+        
+        stats.update({
+            "db_name": self.db_name,
+            "journal_mode": self.journal_mode,
+            "synchronous": self.synchronous,
+            "busy_timeout": self.busy_timeout,
+            "pool_size": self.pool_size
+        })
+        return stats
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_name: str = "pos_system.db", **options) -> ConnectionManager:
+    """Return the shared manager for a database file, creating it on first use.
+    
+    Options (journal_mode, synchronous, busy_timeout, pool_size) only take
+    effect when the manager is first created; later callers share it as is.
+    """
+    key = os.path.abspath(db_name)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = ConnectionManager(db_name, **options)
+            _managers[key] = manager
+        return manager
+
+
+def close_all_managers(db_name: Optional[str] = None):
+    """Close pooled connections for one database file, or for all of them"""
+    with _managers_lock:
+        if db_name is None:
+            managers = list(_managers.values())
+            _managers.clear()
+        else:
+            manager = _managers.pop(os.path.abspath(db_name), None)
+            managers = [manager] if manager else []
+    
+    for manager in managers:
+        manager.close_all()
@@ -0,0 +1,199 @@
+# ingest.py (Idempotent batched ingestion of terminal sales)
+import math
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from metrics import timed
+from rollups import apply_new_sales
+from timerange import normalize_timestamp
+from txn_ids import parse_transaction_id
+from writes import WriteCoordinator, write_transaction
+
+MAX_IN_PARAMS = 500
+MAX_BATCH_TRANSACTIONS = 10000
+
+# Ledger of every transaction ever ingested; its primary key is what makes retries idempotent
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS ingested_transactions (
+        transaction_id TEXT PRIMARY KEY,
+        terminal_id TEXT,
+        lines INTEGER NOT NULL,
+        total REAL NOT NULL,
+        received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_ingested_transactions_terminal ON ingested_transactions (terminal_id)"
+]
+
+ACCEPTED = "accepted"
+DUPLICATE = "duplicate"
+REJECTED = "rejected"
+
+
+def _number(value, field: str) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+        raise ValueError(f"Invalid {field}: {value!r}")
+    return value
+
+
+def validate_transaction(transaction: Dict) -> Tuple[str, str, List[Tuple]]:
+    """Check one uploaded transaction; returns (transaction_id, timestamp, line rows).
+    
+    Accepts the payload layout produced by sync.iter_unsynced_chunks. Line
+    totals are recomputed when missing, and timestamps with a UTC offset are
+    stored in UTC. Raises ValueError naming the problem.
+    """
+    if not isinstance(transaction, dict):
+        raise ValueError("Expected a transaction object")
+    transaction_id = transaction.get("transaction_id")
+    if not isinstance(transaction_id, str) or not transaction_id.strip():
+        raise ValueError("Missing transaction_id")
+    
+    timestamp = transaction.get("timestamp")
+    try:
+        timestamp, epoch = normalize_timestamp(timestamp)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid timestamp: {timestamp!r}")
+    
+    lines = transaction.get("lines")
+    if not isinstance(lines, list) or not lines:
+        raise ValueError("A transaction needs at least one line")
+    
+    rows = []
+    for line in lines:
+        if not isinstance(line, dict):
+            raise ValueError("Expected a line object")
+        product_id = line.get("product_id")
+        if isinstance(product_id, bool) or not isinstance(product_id, int):
+            raise ValueError(f"Invalid product_id: {product_id!r}")
+        quantity = line.get("quantity")
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+            raise ValueError(f"Invalid quantity: {quantity!r}")
+        price = _number(line.get("price"), "price")
+        total = line.get("total")
+        total = price * quantity if total is None else _number(total, "total")
+        rows.append((transaction_id, product_id, quantity, price, total, timestamp, epoch))
+    return transaction_id, timestamp, rows
+
+
+def _terminal_of(transaction_id: str, terminal_id: Optional[str]) -> Optional[str]:
+    if terminal_id:
+        return terminal_id
+    try:
+        return parse_transaction_id(transaction_id)["terminal_id"]
+    except ValueError:
+        return None
+
+
+def _already_ingested(cursor: sqlite3.Cursor, transaction_ids: List[str]) -> set:
+    existing = set()
+    for start in range(0, len(transaction_ids), MAX_IN_PARAMS):
+        chunk = transaction_ids[start:start + MAX_IN_PARAMS]
+        placeholders = ",".join("?" * len(chunk))
+        existing.update(row[0] for row in cursor.execute(
+            f"SELECT transaction_id FROM ingested_transactions WHERE transaction_id IN ({placeholders})", chunk
+        ))
+    return existing
+
+
+def _known_products(cursor: sqlite3.Cursor, product_ids: List[int]) -> set:
+    known = set()
+    for start in range(0, len(product_ids), MAX_IN_PARAMS):
+        chunk = product_ids[start:start + MAX_IN_PARAMS]
+        placeholders = ",".join("?" * len(chunk))
+        known.update(row[0] for row in cursor.execute(
+            f"SELECT id FROM products WHERE id IN ({placeholders})", chunk
+        ))
+    return known
+
+
+@timed("sync.ingest")
+def ingest_transactions(conn: sqlite3.Connection, transactions: List[Dict], terminal_id: Optional[str] = None,
+                        coordinator: Optional[WriteCoordinator] = None) -> Dict:
+    """Store a batch of uploaded transactions exactly once.
+    
+    Every transaction is acknowledged individually, in request order:
+    accepted (stored now), duplicate (stored by an earlier upload or earlier
+    in this batch) or rejected (malformed; the error is included). All new
+    transactions are written as one write (through the coordinator when
+    given) - ledger rows and sale lines with executemany, rollups updated
+    before commit - so a retried or partially failed upload can simply be
+    sent again. Ingested lines are stored as already synced.
+    """
+    if len(transactions) > MAX_BATCH_TRANSACTIONS:
+        raise ValueError(f"At most {MAX_BATCH_TRANSACTIONS} transactions per batch")
+    
+    results = []
+    valid = {}  # transaction_id -> (result, terminal, rows); first copy in the batch wins
+    for transaction in transactions:
+        try:
+            transaction_id, timestamp, rows = validate_transaction(transaction)
+        except ValueError as e:
+            raw_id = transaction.get("transaction_id") if isinstance(transaction, dict) else None
+            results.append({"transaction_id": raw_id, "status": REJECTED, "error": str(e)})
+            continue
+        result = {"transaction_id": transaction_id, "status": ACCEPTED, "lines": len(rows)}
+        if transaction_id in valid:
+            result["status"] = DUPLICATE
+        else:
+            valid[transaction_id] = (result, _terminal_of(transaction_id, terminal_id), rows)
+        results.append(result)
+    
+    def store(cursor):
+        pending = dict(valid)
+        for transaction_id in _already_ingested(cursor, list(pending)):
+            del pending[transaction_id]
+        # One products lookup for the whole batch; a transaction naming an unknown id is rejected whole
+        product_ids = {row[1] for result, terminal, rows in pending.values() for row in rows}
+        known = _known_products(cursor, sorted(product_ids))
+        unknown = {}
+        for transaction_id, (result, terminal, rows) in list(pending.items()):
+            missing = sorted({row[1] for row in rows} - known)
+            if missing:
+                unknown[transaction_id] = missing
+                del pending[transaction_id]
+        if not pending:
+            return pending, unknown
+        
+        cursor.executemany(
+            "INSERT INTO ingested_transactions (transaction_id, terminal_id, lines, total) VALUES (?, ?, ?, ?)",
+            [(transaction_id, terminal, len(rows), sum(row[4] for row in rows))
+             for transaction_id, (result, terminal, rows) in pending.items()]
+        )
+        cursor.executemany(
+            """INSERT INTO sales (transaction_id, product_id, quantity, price, total, timestamp, epoch, synced)
+               VALUES (?, ?, ?, ?, ?, ?, ?, 1)""",
+            [row for result, terminal, rows in pending.values() for row in rows]
+        )
+        apply_new_sales(cursor)
+        return pending, unknown
+    
+    if not valid:
+        stored, unknown = {}, {}
+    elif coordinator is not None:
+        stored, unknown = coordinator.run(store, conn=conn)
+    else:
+        stored, unknown = write_transaction(conn, store)
+    
+    lines_written = 0
+    for transaction_id, (result, terminal, rows) in valid.items():
+        if transaction_id in stored:
+            lines_written += len(rows)
+        elif transaction_id in unknown:
+            result["status"] = REJECTED
+            result["error"] = f"Unknown product_id: {', '.join(map(str, unknown[transaction_id]))}"
+            del result["lines"]
+        else:
+            result["status"] = DUPLICATE
+    
+    counts = {ACCEPTED: 0, DUPLICATE: 0, REJECTED: 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return {
+        "accepted": counts[ACCEPTED],
+        "duplicates": counts[DUPLICATE],
+        "rejected": counts[REJECTED],
+        "lines": lines_written,
+        "results": results
+    }
@@ -0,0 +1,339 @@
+# metrics.py (Query and operation timing: histograms, slow-query log, Prometheus export)
+import atexit
+import functools
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+# Latency buckets in seconds (upper bounds; +Inf is implicit)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DEFAULT_SLOW_QUERY_MS = 100.0
+SLOW_LOG_SIZE = 200
+MAX_STATEMENTS = 500  # distinct statement shapes tracked before folding into "other"
+MAX_STATEMENT_LENGTH = 300
+
+# POS_METRICS=0 turns instrumentation off; POS_METRICS_FILE exports a snapshot at exit
+ENABLED = os.environ.get("POS_METRICS", "1") != "0"
+
+logger = logging.getLogger("pos.slow_query")
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\?(\s*,\s*\?)+")
+
+
+def normalize_statement(sql: str) -> str:
+    """One label per statement shape: collapsed whitespace, IN (?, ?, ...) folded"""
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    sql = _PLACEHOLDER_LIST.sub("?, ...", sql)
+    return sql[:MAX_STATEMENT_LENGTH]
+
+
+class Histogram:
+    """Cumulative latency histogram (Prometheus layout)"""
+    
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+    
+    def cumulative(self) -> List[int]:
+        total = 0
+        result = []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None if empty)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in zip(self.buckets, self.cumulative()):
+            if total >= rank:
+                return bound
+        return self.max
+    
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(bound) for bound in self.buckets], self.cumulative()))
+        }
+
+
+class Metrics:
+    """Thread-safe registry of statement and operation timings.
+    
+    Statements are recorded by the instrumented connections handed out by
+    db.ConnectionManager; operations (checkout, reports, sync uploads, HTTP
+    requests, GUI tasks) by timed() around the code that runs them.
+    """
+    
+    def __init__(self, slow_query_ms: float = DEFAULT_SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._statements = {}
+        self._operations = {}
+        self._rows = {}
+        self._fetch_seconds = {}
+        self._errors = {}
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+        self._slow_total = 0
+        self.started_at = time.time()
+    
+    def _statement_key(self, sql: str) -> str:
+        # The same SQL strings are executed over and over; normalize each once
+        key = self._keys.get(sql)
+        if key is None:
+            key = normalize_statement(sql)
+            if key not in self._statements and len(self._statements) >= MAX_STATEMENTS:
+                key = "other"
+            if len(self._keys) < MAX_STATEMENTS * 4:
+                self._keys[sql] = key
+        return key
+    
+    def observe_statement(self, sql: str, seconds: float, rows: int = -1, error: bool = False):
+        with self._lock:
+            key = self._statement_key(sql)
+            histogram = self._statements.get(key)
+            if histogram is None:
+                histogram = self._statements[key] = Histogram()
+            histogram.observe(seconds)
+            if rows > 0:
+                self._rows[key] = self._rows.get(key, 0) + rows
+            if error:
+                self._errors[key] = self._errors.get(key, 0) + 1
+            slow = seconds * 1000 >= self.slow_query_ms
+            if slow:
+                self._slow_total += 1
+                self._slow.append({"statement": key, "ms": round(seconds * 1000, 3), "rows": rows,
+                                   "at": time.strftime("%Y-%m-%d %H:%M:%S")})
+        if slow:
+            logger.warning("slow query (%.1f ms): %s", seconds * 1000, key)
+    
+    def observe_fetch(self, sql: str, seconds: float, rows: int):
+        with self._lock:
+            key = self._statement_key(sql)
+            self._rows[key] = self._rows.get(key, 0) + rows
+            self._fetch_seconds[key] = self._fetch_seconds.get(key, 0.0) + seconds
+    
+    def observe_operation(self, name: str, seconds: float, error: bool = False):
+        with self._lock:
+            histogram = self._operations.get(name)
+            if histogram is None:
+                histogram = self._operations[name] = Histogram()
+            histogram.observe(seconds)
+            if error:
+                key = f"operation:{name}"
+                self._errors[key] = self._errors.get(key, 0) + 1
+    
+    def slow_queries(self) -> List[Dict]:
+        with self._lock:
+            return list(self._slow)
+    
+    def reset(self):
+        with self._lock:
+            self._keys.clear()
+            self._statements.clear()
+            self._operations.clear()
+            self._rows.clear()
+            self._fetch_seconds.clear()
+            self._errors.clear()
+            self._slow.clear()
+            self._slow_total = 0
+            self.started_at = time.time()
+    
+    def snapshot(self) -> Dict:
+        """Everything recorded so far, as plain data"""
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "slow_query_ms": self.slow_query_ms,
+                "statements": {
+                    key: dict(histogram.to_dict(), rows=self._rows.get(key, 0),
+                              fetch_seconds=round(self._fetch_seconds.get(key, 0.0), 6),
+                              errors=self._errors.get(key, 0))
+                    for key, histogram in self._statements.items()
+                },
+                "operations": {
+                    name: dict(histogram.to_dict(), errors=self._errors.get(f"operation:{name}", 0))
+                    for name, histogram in self._operations.items()
+                },
+                "slow_queries_total": self._slow_total,
+                "slow_queries": list(self._slow)
+            }
+    
+    def prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for metric, label, histograms, help_text in (
+                ("pos_sql_statement_seconds", "statement", self._statements, "SQL statement execute latency"),
+                ("pos_operation_seconds", "operation", self._operations, "Operation latency")
+            ):
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for key, histogram in histograms.items():
+                    labels = f'{label}="{_escape_label(key)}"'
+                    for bound, total in zip(histogram.buckets, histogram.cumulative()):
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {total}')
+                    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f"{metric}_sum{{{labels}}} {histogram.sum:.6f}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+            
+            for metric, values, help_text in (
+                ("pos_sql_statement_rows_total", self._rows, "Rows fetched or changed per statement"),
+                ("pos_sql_statement_fetch_seconds_total", self._fetch_seconds, "Time spent fetching result rows"),
+                ("pos_errors_total", self._errors, "Failed statements and operations")
+            ):
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for key, value in values.items():
+                    lines.append(f'{metric}{{key="{_escape_label(key)}"}} {value}')
+            
+            lines.append("# HELP pos_slow_queries_total Statements slower than the slow-query threshold")
+            lines.append("# TYPE pos_slow_queries_total counter")
+            lines.append(f"pos_slow_queries_total {self._slow_total}")
+        return "\n".join(lines) + "\n"
+    
+    def export(self, path: str):
+        """Write a snapshot to a file: Prometheus text for *.prom, JSON otherwise"""
+        if path.endswith(".prom"):
+            data = self.prometheus()
+        else:
+            data = json.dumps(self.snapshot(), indent=2)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_metrics = Metrics(float(os.environ.get("POS_SLOW_QUERY_MS", DEFAULT_SLOW_QUERY_MS)))
+
+
+def get_metrics() -> Metrics:
+    """Process-wide metrics registry"""
+    return _metrics
+
+
+class timed:
+    """Time an operation, as a context manager or a decorator"""
+    
+    def __init__(self, name: str):
+        self.name = name
+    
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if ENABLED:
+            _metrics.observe_operation(self.name, time.perf_counter() - self._start, error=exc_type is not None)
+        return False
+    
+    def __call__(self, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that records execute latency, row counts and slow statements"""
+    
+    _sql = ""
+    
+    def execute(self, sql, parameters=()):
+        self._sql = sql
+        start = time.perf_counter()
+        try:
+            result = super().execute(sql, parameters)
+        except Exception:
+            _metrics.observe_statement(sql, time.perf_counter() - start, error=True)
+            raise
+        _metrics.observe_statement(sql, time.perf_counter() - start, self.rowcount)
+        return result
+    
+    def executemany(self, sql, seq_of_parameters):
+        self._sql = sql
+        start = time.perf_counter()
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+        except Exception:
+            _metrics.observe_statement(sql, time.perf_counter() - start, error=True)
+            raise
+        _metrics.observe_statement(sql, time.perf_counter() - start, self.rowcount)
+        return result
+    
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        _metrics.observe_fetch(self._sql, time.perf_counter() - start, 1 if row is not None else 0)
+        return row
+    
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        _metrics.observe_fetch(self._sql, time.perf_counter() - start, len(rows))
+        return rows
+    
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        _metrics.observe_fetch(self._sql, time.perf_counter() - start, len(rows))
+        return rows
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including execute() shortcuts) are instrumented"""
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _export_at_exit():
+    path = os.environ.get("POS_METRICS_FILE")
+    if path and ENABLED:
+        try:
+            _metrics.export(path)
+        except OSError:
+            pass
+
+
+atexit.register(_export_at_exit)
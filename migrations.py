@@ -0,0 +1,331 @@
+# migrations.py (Versioned schema migrations)
+import sqlite3
+import sys
+from typing import List, Dict
+
+import archive
+import ingest
+import replication
+import rollups
+import search
+from timerange import EPOCH_SQL
+
+# Migration 5 as shipped: TEXT-bucketed rollups, filled from the sales table.
+# Frozen here because rollups.py has moved on; migration 12 replaces them.
+_TEXT_ROLLUPS = [
+    ("sales_rollup_hourly", "strftime('%Y-%m-%d %H:00:00', timestamp)", []),
+    ("sales_rollup_daily", "date(timestamp)", []),
+    ("sales_rollup_product_daily", "date(timestamp)", ["product_id"])
+]
+
+_TEXT_ROLLUP_SCHEMA = [
+    '''
+        CREATE TABLE IF NOT EXISTS sales_rollup_hourly (
+            bucket TEXT PRIMARY KEY,
+            transactions_count INTEGER NOT NULL,
+            items_sold INTEGER NOT NULL,
+            total_revenue REAL NOT NULL
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS sales_rollup_daily (
+            bucket TEXT PRIMARY KEY,
+            transactions_count INTEGER NOT NULL,
+            items_sold INTEGER NOT NULL,
+            total_revenue REAL NOT NULL
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS sales_rollup_product_daily (
+            bucket TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            transactions_count INTEGER NOT NULL,
+            items_sold INTEGER NOT NULL,
+            total_revenue REAL NOT NULL,
+            PRIMARY KEY (bucket, product_id)
+        )
+    '''
+]
+
+
+def _fill_text_rollups(cursor: sqlite3.Cursor):
+    for table, bucket_expr, keys in _TEXT_ROLLUPS:
+        columns = ", ".join(["bucket"] + keys)
+        groups = ", ".join(str(i + 1) for i in range(len(keys) + 1))
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"""
+            INSERT INTO {table} ({columns}, transactions_count, items_sold, total_revenue)
+            SELECT {", ".join([bucket_expr] + keys)}, COUNT(DISTINCT transaction_id), SUM(quantity), SUM(total)
+            FROM sales
+            GROUP BY {groups}
+        """)
+    cursor.execute("""
+        INSERT INTO sync_state (key, value, updated_at)
+        VALUES (?, (SELECT COALESCE(MAX(id), 0) FROM sales), CURRENT_TIMESTAMP)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+    """, (rollups.ROLLUP_WATERMARK_KEY,))
+
+
+# Each migration is (version, description, steps). A step is either an SQL
+# string or a callable taking a cursor. The applied version is stored in
+# PRAGMA user_version, so existing pos_system.db files (version 0) are
+# upgraded in place the first time any module opens them.
+MIGRATIONS = [
+    (1, "Base schema", [
+        '''
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                price REAL NOT NULL,
+                category TEXT,
+                stock_quantity INTEGER DEFAULT 0
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS sales (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                transaction_id TEXT NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                price REAL NOT NULL,
+                total REAL NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                synced INTEGER DEFAULT 0,
+                FOREIGN KEY (product_id) REFERENCES products (id)
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS sync_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                transaction_id TEXT NOT NULL,
+                sync_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                status TEXT NOT NULL
+            )
+        '''
+    ]),
+    (2, "Hot-path indexes on sales", [
+        "CREATE INDEX IF NOT EXISTS idx_sales_unsynced ON sales (id) WHERE synced = 0",
+        "CREATE INDEX IF NOT EXISTS idx_sales_timestamp ON sales (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_transaction_id ON sales (transaction_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_product_id ON sales (product_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sync_log_transaction_id ON sync_log (transaction_id)"
+    ]),
+    (3, "Per-chunk sync_log details", [
+        "ALTER TABLE sync_log ADD COLUMN first_sale_id INTEGER",
+        "ALTER TABLE sync_log ADD COLUMN last_sale_id INTEGER",
+        "ALTER TABLE sync_log ADD COLUMN transactions_count INTEGER",
+        "ALTER TABLE sync_log ADD COLUMN lines_count INTEGER",
+        "ALTER TABLE sync_log ADD COLUMN payload_bytes INTEGER"
+    ]),
+    (4, "Persistent sync state (high-water marks)", [
+        '''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        '''
+    ]),
+    (5, "Hourly, daily and product-by-day sales rollups", _TEXT_ROLLUP_SCHEMA + [_fill_text_rollups]),
+    (6, "Catalog version counter bumped on every product change", [
+        "INSERT OR IGNORE INTO sync_state (key, value) VALUES ('catalog_version', 0)",
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_products_version_insert AFTER INSERT ON products
+            BEGIN
+                INSERT INTO sync_state (key, value) VALUES ('catalog_version', 1)
+                ON CONFLICT (key) DO UPDATE SET value = value + 1, updated_at = CURRENT_TIMESTAMP;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_products_version_update AFTER UPDATE ON products
+            BEGIN
+                INSERT INTO sync_state (key, value) VALUES ('catalog_version', 1)
+                ON CONFLICT (key) DO UPDATE SET value = value + 1, updated_at = CURRENT_TIMESTAMP;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_products_version_delete AFTER DELETE ON products
+            BEGIN
+                INSERT INTO sync_state (key, value) VALUES ('catalog_version', 1)
+                ON CONFLICT (key) DO UPDATE SET value = value + 1, updated_at = CURRENT_TIMESTAMP;
+            END
+        '''
+    ]),
+    (7, "Per-row product versions and delete tombstones for delta catalog refresh", [
+        "ALTER TABLE products ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_products_row_version ON products (row_version)",
+        '''
+            CREATE TABLE IF NOT EXISTS product_tombstones (
+                product_id INTEGER PRIMARY KEY,
+                row_version INTEGER NOT NULL
+            )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_product_tombstones_row_version ON product_tombstones (row_version)",
+        "DROP TRIGGER IF EXISTS trg_products_version_insert",
+        "DROP TRIGGER IF EXISTS trg_products_version_update",
+        "DROP TRIGGER IF EXISTS trg_products_version_delete",
+        '''
+            CREATE TRIGGER trg_products_version_insert AFTER INSERT ON products
+            BEGIN
+                INSERT INTO sync_state (key, value) VALUES ('catalog_version', 1)
+                ON CONFLICT (key) DO UPDATE SET value = value + 1, updated_at = CURRENT_TIMESTAMP;
+                UPDATE products SET row_version = (SELECT value FROM sync_state WHERE key = 'catalog_version')
+                WHERE id = NEW.id;
+                DELETE FROM product_tombstones WHERE product_id = NEW.id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER trg_products_version_update AFTER UPDATE ON products
+            WHEN NEW.row_version IS OLD.row_version
+            BEGIN
+                INSERT INTO sync_state (key, value) VALUES ('catalog_version', 1)
+                ON CONFLICT (key) DO UPDATE SET value = value + 1, updated_at = CURRENT_TIMESTAMP;
+                UPDATE products SET row_version = (SELECT value FROM sync_state WHERE key = 'catalog_version')
+                WHERE id = NEW.id;
+            END
+        ''',
+        '''
+            CREATE TRIGGER trg_products_version_delete AFTER DELETE ON products
+            BEGIN
+                INSERT INTO sync_state (key, value) VALUES ('catalog_version', 1)
+                ON CONFLICT (key) DO UPDATE SET value = value + 1, updated_at = CURRENT_TIMESTAMP;
+                INSERT OR REPLACE INTO product_tombstones (product_id, row_version)
+                VALUES (OLD.id, (SELECT value FROM sync_state WHERE key = 'catalog_version'));
+            END
+        '''
+    ]),
+    (8, "Product barcode/SKU column and name search indexes", [
+        "ALTER TABLE products ADD COLUMN sku TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products (sku)",
+        "CREATE INDEX IF NOT EXISTS idx_products_name ON products (name COLLATE NOCASE)",
+        search.create_search_index
+    ]),
+    (9, "Ledger of transactions ingested from terminals", ingest.SCHEMA),
+    (10, "Product uids and change log for catalog/stock replication", replication.SCHEMA),
+    (11, "Catalog of monthly sales archive files", archive.SCHEMA),
+    (12, "Integer epoch sale times and epoch-bucketed rollups", [
+        "ALTER TABLE sales ADD COLUMN epoch INTEGER",
+        f"UPDATE sales SET epoch = {EPOCH_SQL}",
+        "CREATE INDEX IF NOT EXISTS idx_sales_epoch ON sales (epoch)",
+        # Writers set epoch themselves; this covers any that only set timestamp
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_sales_epoch AFTER INSERT ON sales
+            WHEN NEW.epoch IS NULL
+            BEGIN
+                UPDATE sales SET epoch = CAST(strftime('%s', NEW.timestamp) AS INTEGER) WHERE id = NEW.id;
+            END
+        ''',
+        archive.add_epoch_column,
+        "DROP TABLE IF EXISTS sales_rollup_hourly",
+        "DROP TABLE IF EXISTS sales_rollup_daily",
+        "DROP TABLE IF EXISTS sales_rollup_product_daily"
+    ] + rollups.SCHEMA + [archive.rebuild]),
+    (13, "Aliases for product uids matched by SKU or name during replication", replication.ALIAS_SCHEMA),
+    (14, "Shared replication uids for sample products seeded before they existed",
+     [replication.alias_seed_products])
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Hot queries and the index each one is expected to use
+QUERY_PLAN_CHECKS = [
+    ("unsynced sales", "SELECT id FROM sales WHERE synced = 0", "idx_sales_unsynced"),
+    ("sales by date range", "SELECT SUM(total) FROM sales WHERE epoch >= ? AND epoch < ?", "idx_sales_epoch"),
+    ("mark transaction synced", "UPDATE sales SET synced = 1 WHERE transaction_id = ?", "idx_sales_transaction_id"),
+    ("sales by product", "SELECT SUM(quantity) FROM sales WHERE product_id = ?", "idx_sales_product_id"),
+    ("product by barcode", "SELECT id FROM products WHERE sku = ?", "idx_products_sku"),
+    ("product name prefix", "SELECT id FROM products WHERE name LIKE 'a%'", "idx_products_name")
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Return the schema version recorded in the database"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target_version: int = LATEST_VERSION) -> List[int]:
+    """Apply every pending migration up to target_version, one transaction each.
+    
+    Safe to call concurrently from several processes: the version is re-read
+    under the write lock, so a migration is never applied twice.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version > target_version or version <= get_schema_version(conn):
+            continue
+        
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            
+            cursor.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        
+        applied.append(version)
+    
+    if applied:
+        # Refresh planner statistics for the new indexes
+        conn.execute("PRAGMA optimize")
+    return applied
+
+
+def check_query_plans(conn: sqlite3.Connection) -> List[Dict]:
+    """Run EXPLAIN QUERY PLAN on the hot queries and report which index each uses"""
+    results = []
+    for name, query, expected_index in QUERY_PLAN_CHECKS:
+        params = [None] * query.count("?")
+        plan = " | ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params))
+        results.append({
+            "name": name,
+            "expected_index": expected_index,
+            "uses_index": f"INDEX {expected_index}" in plan,
+            "plan": plan
+        })
+    return results
+
+
+def verify_query_plans(conn: sqlite3.Connection):
+    """Raise RuntimeError if any hot query would fall back to a table scan"""
+    failures = [check for check in check_query_plans(conn) if not check["uses_index"]]
+    if failures:
+        details = "; ".join(f"{check['name']}: {check['plan']}" for check in failures)
+        raise RuntimeError(f"Queries not using their indexes: {details}")
+
+
+def main(argv: List[str]) -> int:
+    """Upgrade a database file and print its query plan check"""
+    db_name = argv[1] if len(argv) > 1 else "pos_system.db"
+    conn = sqlite3.connect(db_name)
+    try:
+        before = get_schema_version(conn)
+        applied = migrate(conn)
+        print(f"{db_name}: schema version {before} -> {get_schema_version(conn)} (applied {applied or 'none'})")
+        
+        ok = True
+        for check in check_query_plans(conn):
+            status = "OK  " if check["uses_index"] else "SCAN"
+            ok = ok and check["uses_index"]
+            print(f"  [{status}] {check['name']}: {check['plan']}")
+        return 0 if ok else 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,10 +1,32 @@
 # pos_gui.py (Windows application)
 import tkinter as tk
 from tkinter import ttk, messagebox
+import os
 import sqlite3
 from datetime import datetime
 from typing import List, Dict
 
+from catalog_cache import get_catalog_cache
+from checkout import process_checkout
+from db import get_connection_manager
+from migrations import migrate
+import reports
+from report_cache import get_report_cache
+from search import lookup_sku, search_products
+from pos_system import CloudSync
+from sync import SyncWorker, get_outbox_status
+from timerange import parse_range
+from txn_ids import next_transaction_id
+from ui_tasks import TaskRunner
+from writes import get_write_coordinator
+
+# Product lists show the catalog a page at a time so huge catalogs stay responsive
+PRODUCT_PAGE_SIZE = 500
+
+# Search-as-you-type waits for a pause in typing before querying
+SEARCH_DELAY = 150  # milliseconds
+SEARCH_LIMIT = 50
+
 class POSApp:
     def __init__(self, root):
         self.root = root
@@ -15,6 +37,22 @@ class POSApp:
         self.db_name = "pos_system.db"
         self.init_database()
         
+        # Rows currently shown in each treeview, for diff-based refresh
+        self.tree_rows = {}
+        self.product_pages = {'sales': 0, 'products': 0}
+        
+        # Status bar (sync queue depth and lag, plus a busy indicator for background work)
+        status_frame = ttk.Frame(root, relief=tk.SUNKEN)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_bar = ttk.Label(status_frame, text="", anchor=tk.W)
+        self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.busy_bar = ttk.Progressbar(status_frame, mode='indeterminate', length=120)
+        self.busy_label = ttk.Label(status_frame, text="")
+        self.busy_label.pack(side=tk.RIGHT, padx=5)
+        
+        # Database work runs on worker threads; results come back via root.after polling
+        self.tasks = TaskRunner(root, self.db, on_busy=self.show_busy)
+        
         # Create tabs
         self.tab_control = ttk.Notebook(root)
         
@@ -36,11 +74,20 @@ class POSApp:
         # Load initial data
         self.load_products()
         self.load_sales_data()
+        
+        # Background cloud sync
+        self.sync_worker = None
+        self.start_sync()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
     
     def init_database(self):
         """Initialize database connection"""
-        self.conn = sqlite3.connect(self.db_name)
-        self.conn.row_factory = sqlite3.Row
+        # Persistent WAL connection for the Tk thread, shared with other modules in-process
+        self.db = get_connection_manager(self.db_name)
+        migrate(self.db.connection())
+        # Writes from every terminal sharing the file: BEGIN IMMEDIATE with retry on contention
+        self.writer = get_write_coordinator(self.db)
+        self.catalog = get_catalog_cache(self.db_name)
     
     def setup_sales_tab(self):
         """Setup the Point of Sale tab"""
@@ -48,6 +95,17 @@ class POSApp:
         left_frame = ttk.LabelFrame(self.tab_sales, text="Products")
         left_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10, pady=10)
         
+        # Search box: type part of a name, or scan a barcode and press Enter
+        search_frame = ttk.Frame(left_frame)
+        search_frame.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(search_frame, text="Search / Scan:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        search_entry.bind('<Return>', self.scan_barcode)
+        self.search_var.trace_add('write', self.schedule_search)
+        self.search_pending = None
+        
         # Product list
         self.product_tree = ttk.Treeview(left_frame, columns=('id', 'name', 'price', 'stock'), show='headings')
         self.product_tree.heading('id', text='ID')
@@ -59,6 +117,7 @@ class POSApp:
         self.product_tree.column('price', width=80)
         self.product_tree.column('stock', width=60)
         self.product_tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.sales_page_label = self.setup_pager(left_frame, 'sales')
         
         # Add to cart button
         add_button = ttk.Button(left_frame, text="Add to Cart", command=self.add_to_cart)
@@ -94,8 +153,8 @@ class POSApp:
         self.total_label.pack(pady=5)
         
         # Checkout button
-        checkout_button = ttk.Button(right_frame, text="Process Sale", command=self.process_sale)
-        checkout_button.pack(pady=5)
+        self.checkout_button = ttk.Button(right_frame, text="Process Sale", command=self.process_sale)
+        self.checkout_button.pack(pady=5)
         
         # Initialize cart
         self.cart = []
@@ -107,23 +166,26 @@ class POSApp:
         list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
         # Product list
-        self.product_mgmt_tree = ttk.Treeview(list_frame, columns=('id', 'name', 'price', 'category', 'stock'), show='headings')
+        self.product_mgmt_tree = ttk.Treeview(list_frame, columns=('id', 'name', 'price', 'category', 'stock', 'sku'), show='headings')
         self.product_mgmt_tree.heading('id', text='ID')
         self.product_mgmt_tree.heading('name', text='Name')
         self.product_mgmt_tree.heading('price', text='Price')
         self.product_mgmt_tree.heading('category', text='Category')
         self.product_mgmt_tree.heading('stock', text='Stock')
+        self.product_mgmt_tree.heading('sku', text='SKU / Barcode')
         self.product_mgmt_tree.column('id', width=50)
         self.product_mgmt_tree.column('name', width=150)
         self.product_mgmt_tree.column('price', width=80)
         self.product_mgmt_tree.column('category', width=100)
         self.product_mgmt_tree.column('stock', width=60)
+        self.product_mgmt_tree.column('sku', width=120)
         self.product_mgmt_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
         # Scrollbar for product list
         scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.product_mgmt_tree.yview)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.product_mgmt_tree.configure(yscrollcommand=scrollbar.set)
+        self.products_page_label = self.setup_pager(self.tab_products, 'products')
         
         # Product form frame
         form_frame = ttk.LabelFrame(self.tab_products, text="Add/Edit Product")
@@ -146,9 +208,13 @@ class POSApp:
         self.stock_var = tk.StringVar()
         ttk.Entry(form_frame, textvariable=self.stock_var).grid(row=3, column=1, padx=5, pady=5, sticky=tk.EW)
         
+        ttk.Label(form_frame, text="SKU / Barcode:").grid(row=4, column=0, padx=5, pady=5, sticky=tk.W)
+        self.sku_var = tk.StringVar()
+        ttk.Entry(form_frame, textvariable=self.sku_var).grid(row=4, column=1, padx=5, pady=5, sticky=tk.EW)
+        
         # Form buttons
         button_frame = ttk.Frame(form_frame)
-        button_frame.grid(row=4, column=0, columnspan=2, pady=10)
+        button_frame.grid(row=5, column=0, columnspan=2, pady=10)
         
         ttk.Button(button_frame, text="Add Product", command=self.add_product).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Update Product", command=self.update_product).pack(side=tk.LEFT, padx=5)
@@ -158,6 +224,22 @@ class POSApp:
         # Configure grid weights
         form_frame.columnconfigure(1, weight=1)
     
+    def setup_pager(self, parent, key):
+        """Previous/next controls for a paged product list; returns the page label"""
+        pager = ttk.Frame(parent)
+        pager.pack(fill=tk.X, padx=10)
+        
+        ttk.Button(pager, text="< Prev", command=lambda: self.change_page(key, -1)).pack(side=tk.LEFT, padx=5)
+        page_label = ttk.Label(pager, text="")
+        page_label.pack(side=tk.LEFT, padx=5)
+        ttk.Button(pager, text="Next >", command=lambda: self.change_page(key, 1)).pack(side=tk.LEFT, padx=5)
+        return page_label
+    
+    def change_page(self, key, step):
+        """Move a product list to the previous or next page"""
+        self.product_pages[key] = max(0, self.product_pages[key] + step)
+        self.load_products()
+    
     def setup_reports_tab(self):
         """Setup the Reports tab"""
         # Report controls frame
@@ -173,6 +255,10 @@ class POSApp:
         ttk.Entry(controls_frame, textvariable=self.end_date_var, width=10).pack(side=tk.LEFT, padx=5)
         
         ttk.Button(controls_frame, text="Generate Report", command=self.generate_report).pack(side=tk.LEFT, padx=5)
+        self.cancel_report_button = ttk.Button(controls_frame, text="Cancel", command=self.cancel_report,
+                                               state=tk.DISABLED)
+        self.cancel_report_button.pack(side=tk.LEFT, padx=5)
+        self.report_task = None
         
         # Report display frame
         report_frame = ttk.Frame(self.tab_reports)
@@ -188,28 +274,124 @@ class POSApp:
     
     def load_products(self):
         """Load products into the product treeviews"""
-        # Clear existing items
-        for item in self.product_tree.get_children():
-            self.product_tree.delete(item)
-        
-        for item in self.product_mgmt_tree.get_children():
-            self.product_mgmt_tree.delete(item)
-        
-        # Fetch products from database
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM products ORDER BY name")
-        products = cursor.fetchall()
-        
-        # Add products to treeviews
-        for product in products:
-            self.product_tree.insert('', 'end', values=(
-                product['id'], product['name'], f"${product['price']:.2f}", product['stock_quantity']
-            ))
-            
-            self.product_mgmt_tree.insert('', 'end', values=(
-                product['id'], product['name'], f"${product['price']:.2f}", 
-                product['category'], product['stock_quantity']
-            ))
+        # Fetch products from the shared in-memory catalog (delta-refreshed from the database)
+        self.tasks.submit(lambda conn: self.catalog.products(conn, order_by='name'),
+                          self.show_products, self.show_db_error, name="Loading products")
+    
+    def show_products(self, products):
+        """Render a product list fetched by load_products"""
+        # Only the current page of each list is rendered, and only changed rows are touched
+        if self.search_var.get().strip():
+            # The sale list is showing search results; refresh those instead
+            self.run_search()
+        else:
+            sales_page = self.page_of(products, 'sales', self.sales_page_label)
+            self.sync_tree(self.product_tree, [
+                (str(product['id']),
+                 (product['id'], product['name'], f"${product['price']:.2f}", product['stock_quantity']),
+                 product['name'])
+                for product in sales_page
+            ])
+        
+        products_page = self.page_of(products, 'products', self.products_page_label)
+        self.sync_tree(self.product_mgmt_tree, [
+            (str(product['id']),
+             (product['id'], product['name'], f"${product['price']:.2f}",
+              product['category'], product['stock_quantity'], product['sku'] or ''),
+             product['name'])
+            for product in products_page
+        ])
+    
+    def schedule_search(self, *args):
+        """Debounce search-as-you-type: search once typing pauses"""
+        if self.search_pending is not None:
+            self.root.after_cancel(self.search_pending)
+        self.search_pending = self.root.after(SEARCH_DELAY, self.run_search)
+    
+    def run_search(self):
+        """Show the products matching the search box (or the full list when it is empty)"""
+        self.search_pending = None
+        query = self.search_var.get().strip()
+        if not query:
+            self.load_products()
+            return
+        
+        def show(products):
+            # Ignore results for a query the cashier has already typed past
+            if self.search_var.get().strip() != query:
+                return
+            self.sales_page_label.config(text=f"{len(products)} matches for '{query}'")
+            self.sync_tree(self.product_tree, [
+                (str(product['id']),
+                 (product['id'], product['name'], f"${product['price']:.2f}", product['stock_quantity']),
+                 index)
+                for index, product in enumerate(products)
+            ])
+        
+        self.tasks.submit(lambda conn: search_products(conn, query, SEARCH_LIMIT), show, self.show_db_error,
+                          name="Searching", quiet=True)
+    
+    def scan_barcode(self, event=None):
+        """Enter in the search box: add the product with that barcode straight to the cart"""
+        code = self.search_var.get().strip()
+        if not code:
+            return
+        
+        def found(product):
+            if product is None:
+                # Not a barcode; leave the search results for the cashier to pick from
+                return
+            self.search_var.set("")
+            self.add_product_to_cart(product['id'], product['name'], product['price'], product['stock_quantity'])
+        
+        self.tasks.submit(lambda conn: lookup_sku(conn, code), found, self.show_db_error, name="Scanning")
+    
+    def page_of(self, products, key, page_label):
+        """Slice out the current page of a product list and update its page label"""
+        pages = max(1, -(-len(products) // PRODUCT_PAGE_SIZE))
+        page = min(self.product_pages[key], pages - 1)
+        self.product_pages[key] = page
+        page_label.config(text=f"Page {page + 1} of {pages} ({len(products)} products)")
+        return products[page * PRODUCT_PAGE_SIZE:(page + 1) * PRODUCT_PAGE_SIZE]
+    
+    def sync_tree(self, tree, rows):
+        """Make a treeview show rows of (iid, values, sort_key), touching only what changed.
+        
+        Rows must arrive in display order. Rows whose values changed are
+        updated in place; only new rows and rows whose sort key changed are
+        (re)positioned, since every other row keeps its relative order.
+        """
+        old = self.tree_rows.get(str(tree), {})
+        new = {}
+        placed = []
+        
+        for index, (iid, values, sort_key) in enumerate(rows):
+            values = tuple(values)
+            new[iid] = (values, sort_key)
+            previous = old.get(iid)
+            if previous is None:
+                placed.append((index, iid, values, True))
+                continue
+            if previous[0] != values:
+                tree.item(iid, values=values)
+            if previous[1] != sort_key:
+                placed.append((index, iid, values, False))
+        
+        removed = [iid for iid in old if iid not in new]
+        if removed:
+            tree.delete(*removed)
+        
+        # Detach the rows that move first, so each insert index counts only rows already in place
+        for index, iid, values, is_new in placed:
+            if not is_new:
+                tree.detach(iid)
+        for index, iid, values, is_new in placed:
+            if is_new:
+                tree.insert('', index, iid=iid, values=values)
+            else:
+                tree.move(iid, '', index)
+        
+        self.tree_rows[str(tree)] = new
     
     def add_to_cart(self):
         """Add selected product to cart"""
@@ -222,7 +404,10 @@ class POSApp:
         product_id, name, price_str, stock = item['values']
         price = float(price_str.replace('$', ''))
         stock = int(stock)
-        
+        self.add_product_to_cart(product_id, name, price, stock)
+    
+    def add_product_to_cart(self, product_id, name, price, stock):
+        """Add one unit of a product to the cart, within its stock"""
         # Check if product is already in cart
         for i, cart_item in enumerate(self.cart):
             if cart_item['id'] == product_id:
@@ -259,8 +444,7 @@ class POSApp:
             messagebox.showwarning("Warning", "Please select an item to remove from cart")
             return
         
-        index = self.cart_tree.index(selection[0])
-        self.cart.pop(index)
+        self.cart = [item for item in self.cart if str(item['id']) != selection[0]]
         self.update_cart_display()
     
     def clear_cart(self):
@@ -270,18 +454,14 @@ class POSApp:
     
     def update_cart_display(self):
         """Update the cart treeview and total"""
-        # Clear cart tree
-        for item in self.cart_tree.get_children():
-            self.cart_tree.delete(item)
-        
-        # Add cart items
-        total = 0
-        for item in self.cart:
-            self.cart_tree.insert('', 'end', values=(
-                item['id'], item['name'], f"${item['price']:.2f}", 
-                item['quantity'], f"${item['total']:.2f}"
-            ))
-            total += item['total']
+        # Cart rows keep insertion order, so only added, changed and removed lines are touched
+        self.sync_tree(self.cart_tree, [
+            (str(item['id']),
+             (item['id'], item['name'], f"${item['price']:.2f}", item['quantity'], f"${item['total']:.2f}"),
+             None)
+            for item in self.cart
+        ])
+        total = sum(item['total'] for item in self.cart)
         
         # Update total label
         self.total_label.config(text=f"Total: ${total:.2f}")
@@ -304,41 +484,13 @@ class POSApp:
                 'quantity': item['quantity']
             })
         
-        try:
-            # Process sale in database
-            cursor = self.conn.cursor()
-            transaction_id = f"TXN{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            
-            for item in sale_items:
-                product_id = item['product_id']
-                quantity = item['quantity']
-                
-                # Get product price and stock
-                cursor.execute("SELECT price, stock_quantity FROM products WHERE id = ?", (product_id,))
-                result = cursor.fetchone()
-                if not result:
-                    raise Exception(f"Product with ID {product_id} not found")
-                
-                price, current_stock = result['price'], result['stock_quantity']
-                total = price * quantity
-                
-                # Check stock
-                if current_stock < quantity:
-                    raise Exception(f"Insufficient stock for product ID {product_id}")
-                
-                # Update stock
-                cursor.execute(
-                    "UPDATE products SET stock_quantity = stock_quantity - ? WHERE id = ?",
-                    (quantity, product_id)
-                )
-                
-                # Record sale
-                cursor.execute(
-                    "INSERT INTO sales (transaction_id, product_id, quantity, price, total) VALUES (?, ?, ?, ?, ?)",
-                    (transaction_id, product_id, quantity, price, total)
-                )
-            
-            self.conn.commit()
+        # Process sale in database (same set-based path as POSSystem.process_sale)
+        transaction_id = next_transaction_id()
+        
+        def sale_done(result):
+            self.checkout_button.config(state=tk.NORMAL)
+            if self.sync_worker is not None:
+                self.sync_worker.notify()
             
             # Show success message
             messagebox.showinfo("Success", f"Sale processed successfully!\nTransaction ID: {transaction_id}")
@@ -346,10 +498,15 @@ class POSApp:
             # Clear cart and reload products
             self.clear_cart()
             self.load_products()
-            
-        except Exception as e:
+        
+        def sale_failed(e):
+            self.checkout_button.config(state=tk.NORMAL)
             messagebox.showerror("Error", f"Failed to process sale: {str(e)}")
-            self.conn.rollback()
+        
+        # Disabled until the sale finishes, so a double click cannot ring it up twice
+        self.checkout_button.config(state=tk.DISABLED)
+        self.tasks.submit(lambda conn: process_checkout(conn, transaction_id, sale_items, self.writer),
+                          sale_done, sale_failed, name="Processing sale")
     
     def add_product(self):
         """Add a new product"""
@@ -357,6 +514,7 @@ class POSApp:
         price_str = self.price_var.get().strip()
         category = self.category_var.get().strip()
         stock_str = self.stock_var.get().strip()
+        sku = self.sku_var.get().strip() or None
         
         if not name or not price_str or not category:
             messagebox.showwarning("Warning", "Please fill in all required fields")
@@ -365,20 +523,23 @@ class POSApp:
         try:
             price = float(price_str)
             stock = int(stock_str) if stock_str else 0
-            
-            cursor = self.conn.cursor()
-            cursor.execute(
-                "INSERT INTO products (name, price, category, stock_quantity) VALUES (?, ?, ?, ?)",
-                (name, price, category, stock)
-            )
-            self.conn.commit()
-            
-            messagebox.showinfo("Success", "Product added successfully")
-            self.clear_form()
-            self.load_products()
-            
         except ValueError:
             messagebox.showerror("Error", "Please enter valid numeric values for price and stock")
+            return
+        
+        def insert(cursor):
+            cursor.execute(
+                "INSERT INTO products (name, price, category, stock_quantity, sku) VALUES (?, ?, ?, ?, ?)",
+                (name, price, category, stock, sku)
+            )
+        
+        def save(conn):
+            return self.writer.run(insert, conn=conn)
+        
+        def saved(result):
+            self.product_saved("Product added successfully")
+        
+        self.tasks.submit(save, saved, self.product_save_failed, name="Adding product")
     
     def update_product(self):
         """Update selected product"""
@@ -392,6 +553,7 @@ class POSApp:
         price_str = self.price_var.get().strip()
         category = self.category_var.get().strip()
         stock_str = self.stock_var.get().strip()
+        sku = self.sku_var.get().strip() or None
         
         if not name or not price_str or not category:
             messagebox.showwarning("Warning", "Please fill in all required fields")
@@ -400,20 +562,23 @@ class POSApp:
         try:
             price = float(price_str)
             stock = int(stock_str) if stock_str else 0
-            
-            cursor = self.conn.cursor()
-            cursor.execute(
-                "UPDATE products SET name = ?, price = ?, category = ?, stock_quantity = ? WHERE id = ?",
-                (name, price, category, stock, product_id)
-            )
-            self.conn.commit()
-            
-            messagebox.showinfo("Success", "Product updated successfully")
-            self.clear_form()
-            self.load_products()
-            
         except ValueError:
             messagebox.showerror("Error", "Please enter valid numeric values for price and stock")
+            return
+        
+        def update(cursor):
+            cursor.execute(
+                "UPDATE products SET name = ?, price = ?, category = ?, stock_quantity = ?, sku = ? WHERE id = ?",
+                (name, price, category, stock, sku, product_id)
+            )
+        
+        def save(conn):
+            return self.writer.run(update, conn=conn)
+        
+        def saved(result):
+            self.product_saved("Product updated successfully")
+        
+        self.tasks.submit(save, saved, self.product_save_failed, name="Updating product")
     
     def delete_product(self):
         """Delete selected product"""
@@ -428,17 +593,37 @@ class POSApp:
         if not messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete '{product_name}'?"):
             return
         
-        try:
-            cursor = self.conn.cursor()
+        def delete(cursor):
             cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
-            self.conn.commit()
-            
-            messagebox.showinfo("Success", "Product deleted successfully")
-            self.clear_form()
-            self.load_products()
-            
-        except sqlite3.IntegrityError:
-            messagebox.showerror("Error", "Cannot delete product with existing sales records")
+        
+        def delete_failed(e):
+            if isinstance(e, sqlite3.IntegrityError):
+                messagebox.showerror("Error", "Cannot delete product with existing sales records")
+            else:
+                self.show_db_error(e)
+        
+        def save(conn):
+            return self.writer.run(delete, conn=conn)
+        
+        def saved(result):
+            self.product_saved("Product deleted successfully")
+        
+        self.tasks.submit(save, saved, delete_failed, name="Deleting product")
+    
+    def product_saved(self, message):
+        """Common completion for product add/update/delete"""
+        messagebox.showinfo("Success", message)
+        self.clear_form()
+        self.load_products()
+    
+    def product_save_failed(self, e):
+        if isinstance(e, sqlite3.IntegrityError):
+            messagebox.showerror("Error", "Another product already uses this SKU / barcode")
+        else:
+            self.show_db_error(e)
+    
+    def show_db_error(self, e):
+        messagebox.showerror("Error", f"Database error: {str(e)}")
     
     def clear_form(self):
         """Clear the product form"""
@@ -446,6 +631,7 @@ class POSApp:
         self.price_var.set("")
         self.category_var.set("")
         self.stock_var.set("")
+        self.sku_var.set("")
     
     def load_sales_data(self):
         """Load sales data for reporting"""
@@ -456,32 +642,41 @@ class POSApp:
         """Generate a sales report"""
         start_date = self.start_date_var.get().strip()
         end_date = self.end_date_var.get().strip()
-        
         try:
-            cursor = self.conn.cursor()
-            
-            # Build query based on date filters
-            query = """
-                SELECT 
-                    COUNT(DISTINCT transaction_id) as transactions_count,
-                    SUM(quantity) as items_sold,
-                    SUM(total) as total_revenue
-                FROM sales
-            """
-            params = []
-            
-            if start_date and end_date:
-                query += " WHERE timestamp BETWEEN ? AND ?"
-                params.extend([start_date, end_date])
-            elif start_date:
-                query += " WHERE timestamp >= ?"
-                params.append(start_date)
-            elif end_date:
-                query += " WHERE timestamp <= ?"
-                params.append(end_date)
-            
-            cursor.execute(query, params)
-            result = cursor.fetchone()
+            # An end date covers the whole day it names
+            parse_range(start_date, end_date)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
+        # A new request supersedes one still running
+        self.cancel_report()
+        
+        def compute(conn):
+            # Summary (answered from the rollup tables when the dates line up with buckets)
+            params = {'start_date': start_date, 'end_date': end_date}
+            result = get_report_cache().get_or_compute(
+                conn, (self.db_name, 'summary'), params,
+                lambda: reports.sales_summary(conn, start_date or None, end_date or None)
+            )
+            top_products = get_report_cache().get_or_compute(
+                conn, (self.db_name, 'top-products'), dict(params, limit=10),
+                lambda: reports.top_products(conn, start_date or None, end_date or None, limit=10)
+            )
+            # Baskets, busiest hours and category trends from the in-memory NumPy columns (NumPy is optional)
+            try:
+                from analytics import sales_analytics
+            except ImportError:
+                return result, top_products, None
+            breakdown = get_report_cache().get_or_compute(
+                conn, (self.db_name, 'analytics'), dict(params, grain='week'),
+                lambda: sales_analytics(conn, start_date or None, end_date or None, grain='week')
+            )
+            return result, top_products, breakdown
+        
+        def show(report):
+            result, top_products, breakdown = report
+            self.report_finished()
             
             # Generate report text
             report_text = "SALES REPORT\n"
@@ -500,47 +695,118 @@ class POSApp:
             report_text += "\nTOP SELLING PRODUCTS\n"
             report_text += "====================\n\n"
             
-            top_query = """
-                SELECT 
-                    p.name,
-                    p.category,
-                    SUM(s.quantity) as total_sold,
-                    SUM(s.total) as total_revenue
-                FROM sales s
-                JOIN products p ON s.product_id = p.id
-            """
-            
-            top_params = []
-            
-            if start_date and end_date:
-                top_query += " WHERE s.timestamp BETWEEN ? AND ?"
-                top_params.extend([start_date, end_date])
-            elif start_date:
-                top_query += " WHERE s.timestamp >= ?"
-                top_params.append(start_date)
-            elif end_date:
-                top_query += " WHERE s.timestamp <= ?"
-                top_params.append(end_date)
-            
-            top_query += """
-                GROUP BY p.id
-                ORDER BY total_sold DESC
-                LIMIT 10
-            """
-            
-            cursor.execute(top_query, top_params)
-            top_products = cursor.fetchall()
-            
             for i, product in enumerate(top_products, 1):
                 report_text += f"{i}. {product['name']} ({product['category']})\n"
                 report_text += f"   Sold: {product['total_sold']} units, Revenue: ${product['total_revenue']:.2f}\n"
             
+            if breakdown is None:
+                report_text += "\n(Install NumPy for baskets, busiest hours and category trends)\n"
+            else:
+                # Baskets
+                baskets = breakdown['baskets']
+                percentiles = baskets['revenue_percentiles']
+                report_text += "\nBASKETS\n"
+                report_text += "=======\n\n"
+                report_text += f"Average basket: {baskets['average_items']:.2f} items, ${baskets['average_revenue']:.2f}\n"
+                report_text += (f"Sale value: median ${percentiles['p50']:.2f}, 90th percentile ${percentiles['p90']:.2f}, "
+                                f"99th percentile ${percentiles['p99']:.2f}\n")
+                if breakdown['daily']:
+                    from analytics import DEFAULT_MOVING_AVERAGE_DAYS
+                    last_day = breakdown['daily'][-1]
+                    report_text += (f"{DEFAULT_MOVING_AVERAGE_DAYS}-day average revenue to {last_day['period'][:10]}: "
+                                    f"${last_day['moving_average']:.2f}\n")
+                
+                # Busiest hours (weekday and hour of day, UTC)
+                heatmap = breakdown['heatmap']
+                cells = [(count, day, hour) for day, counts in enumerate(heatmap['transactions_count'])
+                         for hour, count in enumerate(counts) if count]
+                report_text += "\nBUSIEST HOURS (UTC)\n"
+                report_text += "===================\n\n"
+                for count, day, hour in sorted(cells, reverse=True)[:5]:
+                    report_text += (f"{heatmap['weekdays'][day]} {hour:02d}:00: {count} transactions, "
+                                    f"${heatmap['total_revenue'][day][hour]:.2f}\n")
+                
+                # Category trends (least-squares change in weekly revenue)
+                report_text += "\nCATEGORY TRENDS (WEEKLY)\n"
+                report_text += "========================\n\n"
+                for category in breakdown['categories']['categories'][:10]:
+                    report_text += (f"{category['category'] or 'Uncategorized'}: ${category['total_revenue']:.2f}, "
+                                    f"trend {category['trend']:+.2f}/week\n")
+            
             # Display report
             self.report_text.delete(1.0, tk.END)
             self.report_text.insert(1.0, report_text)
-            
-        except Exception as e:
+        
+        def failed(e):
+            self.report_finished()
             messagebox.showerror("Error", f"Failed to generate report: {str(e)}")
+        
+        self.report_text.delete(1.0, tk.END)
+        self.report_text.insert(1.0, "Generating report...")
+        self.cancel_report_button.config(state=tk.NORMAL)
+        self.report_task = self.tasks.submit(compute, show, failed, name="Generating report", lane="reports")
+    
+    def cancel_report(self):
+        """Cancel the report being generated, if any"""
+        if self.report_task is not None:
+            self.report_task.cancel()
+            self.report_text.delete(1.0, tk.END)
+            self.report_text.insert(1.0, "Report cancelled.")
+            self.report_finished()
+    
+    def report_finished(self):
+        self.report_task = None
+        self.cancel_report_button.config(state=tk.DISABLED)
+    
+    def show_busy(self, active):
+        """Busy indicator: spin the progress bar while background tasks are outstanding"""
+        if active:
+            self.busy_label.config(text=f"{active[0]}..." if len(active) == 1 else f"{len(active)} tasks running...")
+            if not self.busy_bar.winfo_ismapped():
+                self.busy_bar.pack(side=tk.RIGHT, padx=5)
+                self.busy_bar.start(15)
+        else:
+            self.busy_label.config(text="")
+            self.busy_bar.stop()
+            self.busy_bar.pack_forget()
+    
+    def start_sync(self):
+        """Start the background sync worker if a sync URL is configured"""
+        api_url = os.environ.get("POS_SYNC_URL")
+        if api_url:
+            cloud = CloudSync(api_url, os.environ.get("POS_SYNC_API_KEY", ""))
+            self.sync_worker = SyncWorker(self.db, cloud).start()
+        self.update_sync_status()
+    
+    def update_sync_status(self):
+        """Refresh the status bar with the sync queue depth and lag"""
+        def fetch(conn):
+            if self.sync_worker is not None:
+                return self.sync_worker.status()
+            return get_outbox_status(conn)
+        
+        self.tasks.submit(fetch, self.show_sync_status, lambda e: None, name="Checking sync", lane="status", quiet=True)
+        self.root.after(5000, self.update_sync_status)
+    
+    def show_sync_status(self, status):
+        """Render the sync status fetched by update_sync_status"""
+        text = f"Unsynced: {status['pending_transactions']} transactions"
+        if status['pending_lines']:
+            text += f" (oldest {status['lag_seconds'] // 60} min ago)"
+        if self.sync_worker is None:
+            text += "  |  Sync: offline (POS_SYNC_URL not set)"
+        elif status['consecutive_failures']:
+            text += f"  |  Sync: retrying in {status['next_attempt_in'] or 0:.0f}s ({status['last_error']})"
+        else:
+            text += "  |  Sync: online"
+        self.status_bar.config(text=text)
+    
+    def on_close(self):
+        """Stop background work before closing the window"""
+        self.tasks.shutdown()
+        if self.sync_worker is not None:
+            self.sync_worker.stop(timeout=5)
+        self.root.destroy()
 
 def main():
     """Main function to run the application"""
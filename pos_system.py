@@ -1,221 +1,278 @@
 # pos_system.py
 import sqlite3
-import json
-import datetime
-from typing import List, Dict, Optional
+import logging
+import time
+import urllib.error
+import urllib.request
+from typing import Iterator, List, Dict, Optional
+
+from archive import DEFAULT_ARCHIVE_AFTER_DAYS, archive_sales, check_rollups, list_archives, rebuild_rollups
+from catalog_cache import get_catalog_cache
+from checkout import process_checkout
+from db import get_connection_manager
+from metrics import get_metrics, timed
+from migrations import migrate
+from product_import import DEFAULT_BATCH_SIZE, detect_format, import_products
+from report_cache import get_report_cache
+from replication import ReplicationClient, Replicator, seed_products
+from reports import sales_by_period, sales_summary
+from rollups import catch_up
+from search import DEFAULT_SEARCH_LIMIT, lookup_sku, search_products
+from sync import (DEFAULT_CHUNK_SIZE, DEFAULT_FETCH_SIZE, SyncPipeline, SyncWorker, encode_payload,
+                  get_outbox_status, group_sales_by_transaction, iter_unsynced_sales, set_sync_watermark)
+from txn_ids import TransactionIdGenerator, get_transaction_id_generator
+from writes import get_write_coordinator
+
+logger = logging.getLogger("pos.sync")
 
 class POSSystem:
     """A simple Point of Sale system with local database and cloud sync capability"""
     
-    def __init__(self, db_name="pos_system.db"):
+    def __init__(self, db_name="pos_system.db", id_generator: Optional[TransactionIdGenerator] = None, **db_options):
         self.db_name = db_name
+        self.id_generator = id_generator or get_transaction_id_generator()
+        # Persistent per-thread connections shared with any other module using this file
+        self.db = get_connection_manager(db_name, **db_options)
+        # All writes go through one coordinator per file (BEGIN IMMEDIATE, retry, optional group commit)
+        self.writer = get_write_coordinator(self.db)
+        self.sync_worker = None
+        self.catalog = get_catalog_cache(db_name)
         self.init_database()
     
     def init_database(self):
-        """Initialize the database with required tables"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        """Initialize the database with required tables and indexes"""
+        conn = self.db.connection()
         
-        # Products table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                price REAL NOT NULL,
-                category TEXT,
-                stock_quantity INTEGER DEFAULT 0
-            )
-        ''')
+        # Create or upgrade the schema (tables and indexes) to the latest version
+        migrate(conn)
         
-        # Sales table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sales (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                transaction_id TEXT NOT NULL,
-                product_id INTEGER NOT NULL,
-                quantity INTEGER NOT NULL,
-                price REAL NOT NULL,
-                total REAL NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                synced INTEGER DEFAULT 0,
-                FOREIGN KEY (product_id) REFERENCES products (id)
-            )
-        ''')
+        def seed(cursor):
+            # Insert some sample products if none exist
+            if cursor.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 0:
+                seed_products(cursor)
         
-        # Sync log table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sync_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                transaction_id TEXT NOT NULL,
-                sync_time DATETIME DEFAULT CURRENT_TIMESTAMP,
-                status TEXT NOT NULL
+        self.writer.run(seed, conn=conn)
+    
+    def add_product(self, name: str, price: float, category: str, stock_quantity: int = 0,
+                    sku: Optional[str] = None) -> int:
+        """Add a new product to the database (sku is its barcode, unique when given)"""
+        def insert(cursor):
+            cursor.execute(
+                "INSERT INTO products (name, price, category, stock_quantity, sku) VALUES (?, ?, ?, ?, ?)",
+                (name, price, category, stock_quantity, sku or None)
             )
-        ''')
+            return cursor.lastrowid
         
-        # Insert some sample products if none exist
-        cursor.execute("SELECT COUNT(*) FROM products")
-        if cursor.fetchone()[0] == 0:
-            sample_products = [
-                ("Laptop", 999.99, "Electronics", 10),
-                ("Mouse", 24.99, "Electronics", 50),
-                ("Keyboard", 49.99, "Electronics", 30),
-                ("Monitor", 199.99, "Electronics", 15),
-                ("Desk", 149.99, "Furniture", 8),
-                ("Chair", 89.99, "Furniture", 12)
-            ]
-            cursor.executemany(
-                "INSERT INTO products (name, price, category, stock_quantity) VALUES (?, ?, ?, ?)",
-                sample_products
-            )
+        return self.writer.run(insert)
+    
+    @timed("pos.import_products")
+    def import_products(self, source, fmt: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict:
+        """Bulk upsert products by SKU from a CSV/NDJSON file path or open stream.
         
-        conn.commit()
-        conn.close()
-    
-    def add_product(self, name: str, price: float, category: str, stock_quantity: int = 0) -> int:
-        """Add a new product to the database"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO products (name, price, category, stock_quantity) VALUES (?, ?, ?, ?)",
-            (name, price, category, stock_quantity)
-        )
-        product_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return product_id
-    
-    def get_products(self) -> List[Dict]:
-        """Retrieve all products from the database"""
-        conn = sqlite3.connect(self.db_name)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM products")
-        products = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return products
+        Returns counts plus per-row errors; bad rows are skipped, not fatal.
+        """
+        conn = self.db.connection()
+        if isinstance(source, str):
+            with open(source, "rb") as stream:
+                return import_products(conn, stream, fmt or detect_format(source), batch_size, coordinator=self.writer)
+        return import_products(conn, source, fmt or "csv", batch_size, coordinator=self.writer)
+    
+    def get_products(self, category: Optional[str] = None) -> List[Dict]:
+        """Retrieve all products (optionally one category) from the in-memory catalog"""
+        return self.catalog.products(self.db.connection(), category=category)
+    
+    def get_product(self, product_id: int) -> Optional[Dict]:
+        """Retrieve a single product by id, or None"""
+        return self.catalog.get(self.db.connection(), product_id)
     
+    def get_product_by_sku(self, sku: str) -> Optional[Dict]:
+        """Look up a product by barcode/SKU, or None"""
+        return lookup_sku(self.db.connection(), sku)
+    
+    @timed("pos.search_products")
+    def search_products(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[Dict]:
+        """Products matching a barcode or (part of) a name, best matches first"""
+        return search_products(self.db.connection(), query, limit)
+    
+    @timed("pos.process_sale")
     def process_sale(self, items: List[Dict]) -> str:
-        """Process a sale transaction"""
-        transaction_id = f"TXN{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        """Process a sale transaction.
         
-        for item in items:
-            product_id = item['product_id']
-            quantity = item['quantity']
-            
-            # Get product price
-            cursor.execute("SELECT price, stock_quantity FROM products WHERE id = ?", (product_id,))
-            result = cursor.fetchone()
-            if not result:
-                raise ValueError(f"Product with ID {product_id} not found")
-            
-            price, current_stock = result
-            total = price * quantity
-            
-            # Update stock
-            if current_stock < quantity:
-                raise ValueError(f"Insufficient stock for product ID {product_id}")
-            
-            cursor.execute(
-                "UPDATE products SET stock_quantity = stock_quantity - ? WHERE id = ?",
-                (quantity, product_id)
-            )
-            
-            # Record sale
-            cursor.execute(
-                "INSERT INTO sales (transaction_id, product_id, quantity, price, total) VALUES (?, ?, ?, ?, ?)",
-                (transaction_id, product_id, quantity, price, total)
-            )
+        Raises ValueError for unknown products and InsufficientStockError
+        (a ValueError) listing every line that is short on stock.
+        """
+        transaction_id = self.id_generator.next_id()
+        
+        # Single set-based transaction shared with the GUI checkout
+        process_checkout(self.db.connection(), transaction_id, items, self.writer)
         
-        conn.commit()
-        conn.close()
+        if self.sync_worker is not None:
+            self.sync_worker.notify()
         return transaction_id
     
     def get_unsynced_sales(self) -> List[Dict]:
-        """Retrieve sales that haven't been synced to the cloud"""
-        conn = sqlite3.connect(self.db_name)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT s.*, p.name as product_name 
-            FROM sales s 
-            JOIN products p ON s.product_id = p.id 
-            WHERE s.synced = 0
-        """)
-        sales = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return sales
+        """Retrieve sales that haven't been synced to the cloud.
+        
+        Loads the whole backlog into memory; prefer iter_unsynced_sales.
+        """
+        return list(self.iter_unsynced_sales())
+    
+    def iter_unsynced_sales(self, batch_size: int = DEFAULT_FETCH_SIZE) -> Iterator[Dict]:
+        """Stream unsynced sales in batches, resuming after the sync watermark"""
+        return iter_unsynced_sales(self.db.connection(), batch_size)
+    
+    def reset_sync_watermark(self):
+        """Rescan the whole sales table on the next sync (e.g. after re-flagging rows)"""
+        self.writer.run(set_sync_watermark, 0)
     
     def mark_as_synced(self, transaction_id: str) -> bool:
         """Mark a transaction as synced to the cloud"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE sales SET synced = 1 WHERE transaction_id = ?",
-            (transaction_id,)
-        )
-        cursor.execute(
-            "INSERT INTO sync_log (transaction_id, status) VALUES (?, ?)",
-            (transaction_id, "success")
-        )
-        conn.commit()
-        conn.close()
+        def mark(cursor):
+            cursor.execute(
+                "UPDATE sales SET synced = 1 WHERE transaction_id = ?",
+                (transaction_id,)
+            )
+            cursor.execute(
+                "INSERT INTO sync_log (transaction_id, status) VALUES (?, ?)",
+                (transaction_id, "success")
+            )
+        
+        self.writer.run(mark)
         return True
     
+    @timed("pos.get_sales_report")
     def get_sales_report(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict:
-        """Generate a sales report for the given period"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        
-        query = """
-            SELECT 
-                COUNT(DISTINCT transaction_id) as transactions_count,
-                SUM(quantity) as items_sold,
-                SUM(total) as total_revenue
-            FROM sales
-        """
-        params = []
-        
-        if start_date and end_date:
-            query += " WHERE timestamp BETWEEN ? AND ?"
-            params.extend([start_date, end_date])
-        elif start_date:
-            query += " WHERE timestamp >= ?"
-            params.append(start_date)
-        elif end_date:
-            query += " WHERE timestamp <= ?"
-            params.append(end_date)
-        
-        cursor.execute(query, params)
-        result = cursor.fetchone()
-        
-        report = {
-            "transactions_count": result[0] or 0,
-            "items_sold": result[1] or 0,
-            "total_revenue": result[2] or 0.0
-        }
-        
-        conn.close()
-        return report
+        """Generate a sales report for the given period (cached, and served from rollups when aligned)"""
+        conn = self.db.connection()
+        return get_report_cache().get_or_compute(
+            conn, (self.db_name, 'summary'), {'start_date': start_date, 'end_date': end_date},
+            lambda: sales_summary(conn, start_date, end_date)
+        )
+    
+    @timed("pos.get_sales_by_period")
+    def get_sales_by_period(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                            grain: str = "day") -> List[Dict]:
+        """Sales per hour, day or week for the given period, oldest first"""
+        conn = self.db.connection()
+        return get_report_cache().get_or_compute(
+            conn, (self.db_name, 'sales-by-period'), {'start_date': start_date, 'end_date': end_date, 'grain': grain},
+            lambda: sales_by_period(conn, start_date, end_date, grain)
+        )
+    
+    @timed("pos.get_sales_analytics")
+    def get_sales_analytics(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                            grain: str = "week") -> Dict:
+        """Basket stats, hourly heat map, daily moving average and category trends for the given period (needs NumPy)"""
+        from analytics import sales_analytics
+        conn = self.db.connection()
+        return get_report_cache().get_or_compute(
+            conn, (self.db_name, 'analytics'), {'start_date': start_date, 'end_date': end_date, 'grain': grain},
+            lambda: sales_analytics(conn, start_date, end_date, grain)
+        )
+    
+    def get_report_cache_stats(self) -> Dict:
+        """Return report cache hit/miss statistics"""
+        return get_report_cache().stats()
+    
+    def rebuild_rollups(self):
+        """Recompute the report rollup tables from the raw sales table"""
+        rebuild_rollups(self.db.connection(), self.writer)
+    
+    def catch_up_rollups(self) -> int:
+        """Fold sales written outside checkout and ingestion into the rollups (a write of its own)"""
+        return catch_up(self.db.connection(), self.writer)
+    
+    def check_rollups(self) -> List[Dict]:
+        """Return rollup buckets that disagree with the raw sales table"""
+        return check_rollups(self.db.connection())
+    
+    def archive_sales(self, older_than_days: int = DEFAULT_ARCHIVE_AFTER_DAYS, archive_dir: Optional[str] = None) -> Dict:
+        """Move old synced sales out of the hot database into monthly archive files"""
+        return archive_sales(self.db.connection(), older_than_days, archive_dir)
+    
+    def get_archives(self) -> List[Dict]:
+        """Return the archived months, newest first"""
+        return list_archives(self.db.connection())
+    
+    @timed("pos.sync_to_cloud")
+    def sync_to_cloud(self, cloud: "CloudSync", chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict:
+        """Upload all unsynced sales in chunks; returns counts and throughput"""
+        pipeline = SyncPipeline(self.db.connection(), cloud, chunk_size=chunk_size, coordinator=self.writer)
+        return pipeline.run()
+    
+    def start_sync_worker(self, cloud: "CloudSync", **options) -> SyncWorker:
+        """Start background syncing (see sync.SyncWorker for options)"""
+        if self.sync_worker is None or not self.sync_worker.running:
+            self.sync_worker = SyncWorker(self.db, cloud, **options).start()
+        return self.sync_worker
+    
+    def stop_sync_worker(self, timeout: Optional[float] = None):
+        """Stop background syncing; unsynced sales stay queued in the database"""
+        if self.sync_worker is not None:
+            self.sync_worker.stop(timeout)
+            self.sync_worker = None
+    
+    def replicate(self, client: ReplicationClient) -> Dict:
+        """Two-way catalog and stock sync: push local product changes, pull everyone else's"""
+        return Replicator(self.db, client).sync()
+    
+    def get_sync_status(self) -> Dict:
+        """Outbox queue depth and lag, plus worker state if one is running"""
+        if self.sync_worker is not None:
+            return self.sync_worker.status()
+        return get_outbox_status(self.db.connection())
+    
+    def get_write_stats(self) -> Dict:
+        """Write coordinator counters: retries, busy give-ups, group-commit sizes"""
+        return self.writer.stats()
+    
+    def get_metrics(self) -> Dict:
+        """Statement/operation latency histograms, row counts and the slow-query log"""
+        return get_metrics().snapshot()
+    
+    def export_metrics(self, path: str):
+        """Write the metrics to a file (Prometheus text for *.prom, JSON otherwise)"""
+        get_metrics().export(path)
+    
+    def get_connection_stats(self) -> Dict:
+        """Return connection pool statistics for this database"""
+        return self.db.stats()
 
-# Cloud sync functionality (simulated)
+# Cloud sync functionality
 class CloudSync:
-    """Simulated cloud synchronization service"""
+    """Cloud synchronization client: gzip-compressed JSON over HTTP POST"""
     
-    def __init__(self, api_url: str, api_key: str):
+    def __init__(self, api_url: str, api_key: str, timeout: float = 30.0, simulate: bool = False):
         self.api_url = api_url
         self.api_key = api_key
+        self.timeout = timeout
+        # When simulating, uploads are only counted locally and always succeed
+        self.simulate = simulate
     
-    def upload_sales_data(self, sales_data: List[Dict]) -> bool:
-        """Simulate uploading sales data to the cloud"""
-        print(f"Uploading {len(sales_data)} sales records to {self.api_url}")
-        print(f"Using API key: {self.api_key}")
-        print("Data:", json.dumps(sales_data, indent=2))
+    def upload_payload(self, body: bytes) -> bool:
+        """Upload one encoded (gzip JSON) payload; returns True on a 2xx response"""
+        if self.simulate:
+            logger.info("Uploading %d compressed bytes to %s (simulated)", len(body), self.api_url)
+            return True
         
-        # In a real implementation, this would make an HTTP request
-        # For now, we'll just simulate a successful upload
-        return True
+        request = urllib.request.Request(self.api_url, data=body, method="POST", headers={
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+            "Authorization": f"Bearer {self.api_key}"
+        })
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                ok = 200 <= response.status < 300
+        except (urllib.error.URLError, OSError):
+            ok = False
+        get_metrics().observe_operation("sync.upload", time.perf_counter() - start, error=not ok)
+        return ok
+    
+    def upload_sales_data(self, sales_data: List[Dict]) -> bool:
+        """Upload a list of sale rows as a single compressed payload"""
+        return self.upload_payload(encode_payload(group_sales_by_transaction(sales_data)))
 
 # Example usage
 if __name__ == "__main__":
@@ -239,18 +296,11 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Error processing sale: {e}")
     
-    # Get unsynced sales
-    unsynced_sales = pos.get_unsynced_sales()
-    print(f"\nUnsynced sales: {len(unsynced_sales)}")
-    
-    # Simulate cloud sync
-    if unsynced_sales:
-        cloud_sync = CloudSync("https://api.example.com/pos/sync", "your_api_key_here")
-        if cloud_sync.upload_sales_data(unsynced_sales):
-            # Mark as synced if upload was successful
-            for sale in unsynced_sales:
-                pos.mark_as_synced(sale['transaction_id'])
-            print("Sales data successfully synced to cloud!")
+    # Sync unsynced sales to the cloud in compressed chunks
+    cloud_sync = CloudSync("https://api.example.com/pos/sync", "your_api_key_here", simulate=True)
+    result = pos.sync_to_cloud(cloud_sync)
+    print(f"\nSynced {result['transactions']} transactions ({result['lines']} lines) "
+          f"in {result['chunks']} chunks, {result['bytes_sent']} bytes")
     
     # Generate a sales report
     report = pos.get_sales_report()
@@ -0,0 +1,343 @@
+# product_import.py (Streaming bulk product import / upsert by SKU)
+import csv
+import io
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+from typing import IO, Dict, Iterator, List, Optional, Tuple, Union
+
+from migrations import migrate
+from writes import WriteCoordinator, is_busy_error, write_transaction
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_MAX_ERRORS = 1000  # errors kept in the result; all of them are counted
+MAX_IN_PARAMS = 500
+
+FORMATS = ("csv", "ndjson")
+
+# Accepted spellings of each column
+_ALIASES = {
+    "sku": "sku", "barcode": "sku",
+    "name": "name",
+    "price": "price",
+    "category": "category",
+    "stock_quantity": "stock_quantity", "stock": "stock_quantity"
+}
+
+
+def _upsert_sql(with_stock: bool) -> str:
+    """One set-based upsert for a whole batch, passed in as a JSON array.
+    
+    A single statement per batch (instead of executemany) matters here:
+    FTS5 flushes its pending index data at every statement boundary, so
+    row-at-a-time statements make the search-index triggers several times
+    slower. Unchanged rows are skipped by the WHERE clause, so re-importing
+    the same file does not bump the catalog version. Rows without a stock
+    value keep the current stock of existing products (0 for new ones).
+    """
+    stock = "json_extract(value, '$.stock_quantity')" if with_stock else "0"
+    stock_update = "excluded.stock_quantity" if with_stock else "products.stock_quantity"
+    return f"""
+        INSERT INTO products (sku, name, price, category, stock_quantity)
+        SELECT json_extract(value, '$.sku'), json_extract(value, '$.name'), json_extract(value, '$.price'),
+               json_extract(value, '$.category'), {stock}
+        FROM json_each(?)
+        WHERE true
+        ON CONFLICT (sku) DO UPDATE SET
+            name = excluded.name,
+            price = excluded.price,
+            category = excluded.category,
+            stock_quantity = {stock_update}
+        WHERE products.name IS NOT excluded.name
+           OR products.price IS NOT excluded.price
+           OR products.category IS NOT excluded.category
+           OR products.stock_quantity IS NOT {stock_update}
+    """
+
+
+UPSERT_WITH_STOCK_SQL = _upsert_sql(True)
+UPSERT_KEEP_STOCK_SQL = _upsert_sql(False)
+
+
+def _upsert(cursor: sqlite3.Cursor, rows: List[Dict]) -> int:
+    """Upsert validated rows; returns how many were inserted or changed"""
+    written = 0
+    for sql, group in ((UPSERT_WITH_STOCK_SQL, [row for row in rows if row["stock_quantity"] is not None]),
+                       (UPSERT_KEEP_STOCK_SQL, [row for row in rows if row["stock_quantity"] is None])):
+        if group:
+            cursor.execute(sql, (json.dumps(group),))
+            written += cursor.rowcount
+    return written
+
+
+def detect_format(name: Optional[str] = None, content_type: Optional[str] = None) -> str:
+    """Pick csv or ndjson from a file name or Content-Type (csv by default)"""
+    if content_type and ("ndjson" in content_type or "json" in content_type):
+        return "ndjson"
+    if name and os.path.splitext(name)[1].lower() in (".ndjson", ".jsonl", ".json"):
+        return "ndjson"
+    return "csv"
+
+
+def _text_stream(stream: IO) -> IO[str]:
+    """Wrap binary streams (files opened 'rb', request bodies) for text parsing"""
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+
+def _normalize_keys(raw: Dict) -> Dict:
+    record = {}
+    for key, value in raw.items():
+        field = _ALIASES.get(str(key).strip().lower()) if key is not None else None
+        if field is not None:
+            record[field] = value
+    return record
+
+
+def read_csv(stream: IO) -> Iterator[Tuple[int, Union[Dict, Exception]]]:
+    """Yield (line number, record) for each CSV row after the header"""
+    reader = csv.DictReader(_text_stream(stream))
+    for raw in reader:
+        yield reader.line_num, _normalize_keys(raw)
+
+
+def read_ndjson(stream: IO) -> Iterator[Tuple[int, Union[Dict, Exception]]]:
+    """Yield (line number, record) for each NDJSON line; bad JSON yields the error instead"""
+    for line_no, line in enumerate(_text_stream(stream), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            raw = json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(raw, dict):
+            yield line_no, ValueError("Expected a JSON object")
+            continue
+        yield line_no, _normalize_keys(raw)
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def validate_product(record: Dict) -> Dict:
+    """Clean one import record into upsert parameters; raises ValueError naming the problem"""
+    sku = record.get("sku")
+    if _blank(sku):
+        raise ValueError("Missing sku")
+    name = record.get("name")
+    if _blank(name):
+        raise ValueError("Missing name")
+    
+    try:
+        price = float(record.get("price"))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid price: {record.get('price')!r}")
+    if not math.isfinite(price) or price < 0:
+        raise ValueError(f"Invalid price: {record.get('price')!r}")
+    
+    stock = record.get("stock_quantity")
+    if _blank(stock):
+        stock = None
+    else:
+        try:
+            stock = int(str(stock).strip()) if not isinstance(stock, int) else stock
+        except ValueError:
+            raise ValueError(f"Invalid stock_quantity: {record.get('stock_quantity')!r}")
+        if isinstance(stock, bool) or stock < 0:
+            raise ValueError(f"Invalid stock_quantity: {record.get('stock_quantity')!r}")
+    
+    category = record.get("category")
+    return {
+        "sku": str(sku).strip(),
+        "name": str(name).strip(),
+        "price": round(price, 2),
+        "category": None if _blank(category) else str(category).strip(),
+        "stock_quantity": stock
+    }
+
+
+class ImportResult:
+    """Running totals and per-row errors of one import"""
+    
+    def __init__(self, max_errors: int = DEFAULT_MAX_ERRORS):
+        self.max_errors = max_errors
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.error_count = 0
+        self.errors = []
+        self.batches = 0
+        self._started = time.perf_counter()
+        self.seconds = 0.0
+    
+    def add_error(self, line: int, error: Exception, sku=None):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "sku": sku, "error": str(error)})
+    
+    def finish(self) -> "ImportResult":
+        self.seconds = time.perf_counter() - self._started
+        return self
+    
+    def to_dict(self) -> Dict:
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "error_count": self.error_count,
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+            "errors_truncated": self.error_count > len(self.errors),
+            "batches": self.batches,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows / self.seconds) if self.seconds else None
+        }
+
+
+def _existing_skus(cursor: sqlite3.Cursor, skus: List[str]) -> set:
+    existing = set()
+    for start in range(0, len(skus), MAX_IN_PARAMS):
+        chunk = skus[start:start + MAX_IN_PARAMS]
+        placeholders = ",".join("?" * len(chunk))
+        existing.update(row[0] for row in cursor.execute(
+            f"SELECT sku FROM products WHERE sku IN ({placeholders})", chunk
+        ))
+    return existing
+
+
+def _write_batch(conn: sqlite3.Connection, batch: List[Tuple[int, Dict]], result: ImportResult,
+                 coordinator: Optional[WriteCoordinator] = None):
+    """Upsert one batch in its own write (through the coordinator when given).
+    
+    The fast path writes the whole batch at once. If that fails (e.g. a
+    constraint the validator cannot see), the batch is replayed row by row
+    under savepoints so only the offending rows are reported and skipped.
+    """
+    def write(cursor):
+        skus = [params["sku"] for line, params in batch]
+        new_skus = set(skus) - _existing_skus(cursor, skus)
+        errors = []
+        cursor.execute("SAVEPOINT import_batch")
+        try:
+            written = _upsert(cursor, [params for line, params in batch])
+            cursor.execute("RELEASE import_batch")
+        except sqlite3.Error as e:
+            if is_busy_error(e):
+                raise
+            # Undo the partial batch and replay it row by row
+            cursor.execute("ROLLBACK TO import_batch")
+            cursor.execute("RELEASE import_batch")
+            written = 0
+            new_skus = set()
+            for line, params in batch:
+                cursor.execute("SAVEPOINT import_row")
+                try:
+                    is_new = not _existing_skus(cursor, [params["sku"]])
+                    written += _upsert(cursor, [params])
+                    if is_new:
+                        new_skus.add(params["sku"])
+                    cursor.execute("RELEASE import_row")
+                except sqlite3.Error as e:
+                    if is_busy_error(e):
+                        raise
+                    cursor.execute("ROLLBACK TO import_row")
+                    cursor.execute("RELEASE import_row")
+                    errors.append((line, e, params["sku"]))
+        return written, new_skus, errors
+    
+    # Retried from the top on lock contention, so errors are only recorded once it commits
+    if coordinator is not None:
+        written, new_skus, errors = coordinator.run(write, conn=conn)
+    else:
+        written, new_skus, errors = write_transaction(conn, write)
+    for line, error, sku in errors:
+        result.add_error(line, error, sku)
+    
+    result.batches += 1
+    result.inserted += len(new_skus)
+    result.updated += written - len(new_skus)
+    result.unchanged += len(batch) - len(errors) - written
+
+
+def import_products(conn: sqlite3.Connection, stream: IO, fmt: str = "csv",
+                    batch_size: int = DEFAULT_BATCH_SIZE, max_errors: int = DEFAULT_MAX_ERRORS,
+                    coordinator: Optional[WriteCoordinator] = None) -> Dict:
+    """Stream products from CSV or NDJSON and upsert them by SKU.
+    
+    Rows are validated as they are read; invalid rows are reported by line
+    number and skipped without aborting the run. Valid rows are written in
+    batches of batch_size, one write each (queued with the other writers
+    when a coordinator is given), so memory stays flat and a failure part
+    way through keeps every batch already committed.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown import format: {fmt}")
+    
+    result = ImportResult(max_errors)
+    reader = read_csv(stream) if fmt == "csv" else read_ndjson(stream)
+    batch = []
+    
+    for line, record in reader:
+        result.rows += 1
+        if isinstance(record, Exception):
+            result.add_error(line, record)
+            continue
+        try:
+            params = validate_product(record)
+        except ValueError as e:
+            result.add_error(line, e, record.get("sku"))
+            continue
+        
+        batch.append((line, params))
+        if len(batch) >= batch_size:
+            _write_batch(conn, batch, result, coordinator)
+            batch = []
+    
+    if batch:
+        _write_batch(conn, batch, result, coordinator)
+    return result.finish().to_dict()
+
+
+def import_file(conn: sqlite3.Connection, path: str, fmt: Optional[str] = None, **options) -> Dict:
+    """Import a CSV or NDJSON file (format from the extension unless given)"""
+    with open(path, "rb") as stream:
+        return import_products(conn, stream, fmt or detect_format(path), **options)
+
+
+def main(argv: List[str]) -> int:
+    """python product_import.py FILE [db] [batch_size]"""
+    if len(argv) < 2:
+        print("usage: python product_import.py FILE [db] [batch_size]")
+        return 2
+    
+    path = argv[1]
+    db_name = argv[2] if len(argv) > 2 else "pos_system.db"
+    batch_size = int(argv[3]) if len(argv) > 3 else DEFAULT_BATCH_SIZE
+    
+    conn = sqlite3.connect(db_name)
+    try:
+        migrate(conn)
+        result = import_file(conn, path, batch_size=batch_size)
+    finally:
+        conn.close()
+    
+    for error in result["errors"][:20]:
+        print(f"  line {error['line']} (sku {error['sku']}): {error['error']}")
+    if result["error_count"] > 20:
+        print(f"  ... {result['error_count'] - 20} more errors")
+    print(f"{path} -> {db_name}: {result['rows']} rows in {result['seconds']}s "
+          f"({result['rows_per_second']} rows/s): {result['inserted']} inserted, {result['updated']} updated, "
+          f"{result['unchanged']} unchanged, {result['error_count']} errors")
+    return 1 if result["error_count"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,552 @@
+# replication.py (Change-log driven two-way catalog and stock replication)
+import gzip
+import json
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from metrics import timed
+from writes import get_write_coordinator
+
+DEFAULT_BATCH_SIZE = 1000   # changes per push or pull request
+MAX_BATCH_SIZE = 10000
+PUSHED_KEY = "replication_pushed_through"
+PULLED_KEY = "replication_pulled_through"
+APPLYING_KEY = "replication_applying"
+
+CHANGE_FIELDS = ("seq", "product_uid", "kind", "name", "price", "category", "sku", "stock_delta", "origin")
+
+# Change-log triggers stay quiet while remote changes are being applied
+_NOT_APPLYING = f"NOT EXISTS (SELECT 1 FROM sync_state WHERE key = '{APPLYING_KEY}' AND value = 1)"
+
+# Products get a replication-wide uid (local ids differ per store). Every
+# local product write is logged in product_changes with a sequence number:
+# 'upsert' carries the catalog fields (and any stock change as a delta),
+# 'stock' only a stock delta, 'delete' only the uid. origin is NULL for
+# changes made in this database and the store ID for changes a server
+# received from a store.
+SCHEMA = [
+    "ALTER TABLE products ADD COLUMN uid TEXT",
+    "UPDATE products SET uid = lower(hex(randomblob(16))) WHERE uid IS NULL",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_products_uid ON products (uid)",
+    """
+        CREATE TABLE IF NOT EXISTS product_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_uid TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            name TEXT,
+            price REAL,
+            category TEXT,
+            sku TEXT,
+            stock_delta INTEGER NOT NULL DEFAULT 0,
+            origin TEXT,
+            changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS replication_peers (
+            store_id TEXT PRIMARY KEY,
+            acked_seq INTEGER NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS replication_identity (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            store_id TEXT NOT NULL
+        )
+    """,
+    "INSERT OR IGNORE INTO replication_identity (id, store_id) VALUES (1, upper(hex(randomblob(4))))",
+    # The existing catalog is this database's first change, so a new peer can bootstrap from seq 0
+    """
+        INSERT INTO product_changes (product_uid, kind, name, price, category, sku, stock_delta)
+        SELECT uid, 'upsert', name, price, category, sku, COALESCE(stock_quantity, 0) FROM products ORDER BY id
+    """,
+    f"""
+        CREATE TRIGGER IF NOT EXISTS trg_products_changes_insert AFTER INSERT ON products
+        WHEN {_NOT_APPLYING}
+        BEGIN
+            UPDATE products SET uid = lower(hex(randomblob(16))) WHERE id = NEW.id AND uid IS NULL;
+            INSERT INTO product_changes (product_uid, kind, name, price, category, sku, stock_delta)
+            SELECT uid, 'upsert', name, price, category, sku, COALESCE(stock_quantity, 0)
+            FROM products WHERE id = NEW.id;
+        END
+    """,
+    f"""
+        CREATE TRIGGER IF NOT EXISTS trg_products_changes_update AFTER UPDATE OF name, price, category, sku ON products
+        WHEN (NEW.name IS NOT OLD.name OR NEW.price IS NOT OLD.price
+              OR NEW.category IS NOT OLD.category OR NEW.sku IS NOT OLD.sku)
+         AND {_NOT_APPLYING}
+        BEGIN
+            INSERT INTO product_changes (product_uid, kind, name, price, category, sku, stock_delta)
+            VALUES (NEW.uid, 'upsert', NEW.name, NEW.price, NEW.category, NEW.sku,
+                    COALESCE(NEW.stock_quantity, 0) - COALESCE(OLD.stock_quantity, 0));
+        END
+    """,
+    f"""
+        CREATE TRIGGER IF NOT EXISTS trg_products_changes_stock AFTER UPDATE OF stock_quantity ON products
+        WHEN NEW.stock_quantity IS NOT OLD.stock_quantity
+         AND NEW.name IS OLD.name AND NEW.price IS OLD.price
+         AND NEW.category IS OLD.category AND NEW.sku IS OLD.sku
+         AND {_NOT_APPLYING}
+        BEGIN
+            INSERT INTO product_changes (product_uid, kind, stock_delta)
+            VALUES (NEW.uid, 'stock', COALESCE(NEW.stock_quantity, 0) - COALESCE(OLD.stock_quantity, 0));
+        END
+    """,
+    f"""
+        CREATE TRIGGER IF NOT EXISTS trg_products_changes_delete AFTER DELETE ON products
+        WHEN {_NOT_APPLYING}
+        BEGIN
+            INSERT INTO product_changes (product_uid, kind) VALUES (OLD.uid, 'delete');
+        END
+    """
+]
+
+
+# Sample catalog every new store database is seeded with (POSSystem.init_database),
+# as (name, price, category, stock_quantity). Seeded rows share a uid across
+# stores, so each store's copy of the seed is recognised instead of added.
+SEED_PRODUCTS = [
+    ("Laptop", 999.99, "Electronics", 10),
+    ("Mouse", 24.99, "Electronics", 50),
+    ("Keyboard", 49.99, "Electronics", 30),
+    ("Monitor", 199.99, "Electronics", 15),
+    ("Desk", 149.99, "Furniture", 8),
+    ("Chair", 89.99, "Furniture", 12)
+]
+
+# Other stores' uids for a product this store already had under its own uid
+# (matched by SKU, or as a row of the seeded sample catalog).
+# Mapping instead of renaming keeps every store's uid stable, so a product
+# is never flipped back and forth between the uids of two stores.
+ALIAS_SCHEMA = [
+    """
+        CREATE TABLE IF NOT EXISTS product_uid_aliases (
+            uid TEXT PRIMARY KEY,
+            product_id INTEGER NOT NULL
+        )
+    """
+]
+
+
+def seed_uid(name: str, category: Optional[str]) -> str:
+    """Replication uid shared by every store's copy of a seeded sample product"""
+    return f"seed:{category}:{name}"
+
+
+def seed_products(cursor: sqlite3.Cursor):
+    """Insert the sample catalog under its shared uids (logged like any new product)"""
+    cursor.executemany(
+        "INSERT INTO products (uid, name, price, category, stock_quantity) VALUES (?, ?, ?, ?, ?)",
+        [(seed_uid(name, category), name, price, category, stock) for name, price, category, stock in SEED_PRODUCTS]
+    )
+
+
+def alias_seed_products(cursor: sqlite3.Cursor):
+    """Map the shared seed uids onto sample rows seeded before they existed (random uids)"""
+    for name, price, category, stock in SEED_PRODUCTS:
+        cursor.execute("""
+            INSERT OR IGNORE INTO product_uid_aliases (uid, product_id)
+            SELECT ?, id FROM products
+            WHERE name = ? AND price = ? AND category IS ? AND sku IS NULL
+              AND NOT EXISTS (SELECT 1 FROM products WHERE uid = ?)
+            ORDER BY id LIMIT 1
+        """, (seed_uid(name, category), name, price, category, seed_uid(name, category)))
+
+
+def get_store_id(conn: sqlite3.Connection) -> str:
+    """This database's replication identity (generated once by the migration)"""
+    return conn.execute("SELECT store_id FROM replication_identity WHERE id = 1").fetchone()[0]
+
+
+def _get_state(conn, key: str) -> int:
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def _set_state(cursor: sqlite3.Cursor, key: str, value: int):
+    cursor.execute("""
+        INSERT INTO sync_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+    """, (key, value))
+
+
+def _rows_to_changes(rows) -> List[Dict]:
+    return [dict(zip(CHANGE_FIELDS, row)) for row in rows]
+
+
+def local_changes(conn: sqlite3.Connection, after_seq: int, limit: int = DEFAULT_BATCH_SIZE) -> List[Dict]:
+    """Changes made in this database after after_seq, oldest first"""
+    rows = conn.execute(f"""
+        SELECT {', '.join(CHANGE_FIELDS)} FROM product_changes
+        WHERE seq > ? AND origin IS NULL
+        ORDER BY seq
+        LIMIT ?
+    """, (after_seq, limit)).fetchall()
+    return _rows_to_changes(rows)
+
+
+def changes_since(conn: sqlite3.Connection, since: int, limit: int = DEFAULT_BATCH_SIZE,
+                  store_id: Optional[str] = None) -> Dict:
+    """One page of the change feed after sequence `since` (the server side of a pull).
+    
+    Stock-only changes that came from the requesting store are left out -
+    it already has them - but last_seq still moves past them.
+    """
+    limit = max(1, min(int(limit), MAX_BATCH_SIZE))
+    rows = conn.execute(f"""
+        SELECT {', '.join(CHANGE_FIELDS)} FROM product_changes
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+    """, (since, limit)).fetchall()
+    changes = [change for change in _rows_to_changes(rows)
+               if not (store_id is not None and change["origin"] == store_id and change["kind"] == "stock")]
+    return {
+        "changes": changes,
+        "last_seq": rows[-1][0] if rows else since,
+        "more": len(rows) == limit
+    }
+
+
+def _is_seed(change: Dict) -> bool:
+    return (not change.get("sku") and (change.get("name"), change.get("price"), change.get("category"),
+                                       int(change.get("stock_delta") or 0)) in SEED_PRODUCTS)
+
+
+def _is_seed(change: Dict) -> bool:
+    """Whether an upsert is the creation of a seeded sample row (same fields, initial stock as delta)"""
+    return (change["kind"] == "upsert" and not change.get("sku")
+            and (change.get("name"), change.get("price"), change.get("category"),
+                 int(change.get("stock_delta") or 0)) in SEED_PRODUCTS)
+
+
+def _lookup_uid(cursor: sqlite3.Cursor, uid: str) -> Optional[int]:
+    row = cursor.execute("SELECT id FROM products WHERE uid = ?", (uid,)).fetchone()
+    if row is None:
+        row = cursor.execute("""
+            SELECT p.id FROM product_uid_aliases a JOIN products p ON p.id = a.product_id WHERE a.uid = ?
+        """, (uid,)).fetchone()
+    return row[0] if row is not None else None
+
+
+def _find_product(cursor: sqlite3.Cursor, change: Dict) -> Tuple[Optional[int], bool]:
+    """Local product id for a change, and whether it is a seed row this store already counted.
+    
+    Looks up the uid, then uids seen before; an upsert for an unknown uid is
+    matched by SKU. Products without a SKU are only matched when the change
+    creates a row of the seeded sample catalog, via that row's shared seed
+    uid (stores seeded before seed uids existed carry random ones), so
+    unrelated products that share a name stay apart. A match records the
+    remote uid as an alias of the local product.
+    """
+    uid = change["product_uid"]
+    seeded = _is_seed(change)
+    product_id = _lookup_uid(cursor, uid)
+    if product_id is not None:
+        return product_id, seeded and uid == seed_uid(change["name"], change["category"])
+    if change["kind"] != "upsert":
+        return None, False
+    
+    if change.get("sku"):
+        row = cursor.execute("SELECT id FROM products WHERE sku = ?", (change["sku"],)).fetchone()
+        product_id = row[0] if row is not None else None
+    elif seeded:
+        product_id = _lookup_uid(cursor, seed_uid(change["name"], change["category"]))
+    if product_id is None:
+        return None, False
+    cursor.execute("INSERT OR REPLACE INTO product_uid_aliases (uid, product_id) VALUES (?, ?)", (uid, product_id))
+    return product_id, seeded
+
+
+def apply_changes(cursor: sqlite3.Cursor, changes: List[Dict], store_id: Optional[str] = None,
+                  log_origin: Optional[str] = None) -> int:
+    """Apply remote changes in order inside the caller's write transaction.
+    
+    Catalog fields are last-writer-wins in feed order. Stock is never
+    overwritten: each change adds its delta, so sales made concurrently in
+    different stores all count, and a SKU created in two stores ends up
+    with the sum of both stores' stock everywhere. Deltas that originated in store_id (this
+    store, echoed back by the server) are skipped. With log_origin (the
+    server receiving a push) every change is re-logged under that origin so
+    it appears in the feed for the other stores. Returns changes applied.
+    """
+    _set_state(cursor, APPLYING_KEY, 1)
+    applied = 0
+    try:
+        for change in changes:
+            kind = change["kind"]
+            delta = int(change.get("stock_delta") or 0)
+            if change.get("origin") is not None and change.get("origin") == store_id:
+                delta = 0
+            product_id, seeded = _find_product(cursor, change)
+            if seeded:
+                # Both stores started from the same seed row: its stock is already counted here
+                delta = 0
+            
+            if kind == "delete":
+                if product_id is not None:
+                    cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
+            elif kind == "upsert":
+                if change.get("sku"):
+                    # The SKU moves with the latest change; release it from any other product
+                    cursor.execute("UPDATE products SET sku = NULL WHERE sku = ? AND id IS NOT ?",
+                                   (change["sku"], product_id))
+                if product_id is None:
+                    cursor.execute(
+                        """INSERT INTO products (uid, name, price, category, sku, stock_quantity)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        (change["product_uid"], change["name"], change["price"], change["category"],
+                         change["sku"], delta)
+                    )
+                    if _is_seed(change) and _lookup_uid(cursor, seed_uid(change["name"], change["category"])) is None:
+                        # A seed row under a pre-seed-uid random uid: later copies find it by the shared uid
+                        cursor.execute("INSERT OR REPLACE INTO product_uid_aliases (uid, product_id) VALUES (?, ?)",
+                                       (seed_uid(change["name"], change["category"]), cursor.lastrowid))
+                else:
+                    cursor.execute(
+                        """UPDATE products SET name = ?, price = ?, category = ?, sku = ?,
+                                  stock_quantity = COALESCE(stock_quantity, 0) + ?
+                           WHERE id = ?""",
+                        (change["name"], change["price"], change["category"], change["sku"], delta, product_id)
+                    )
+            elif kind == "stock":
+                if product_id is not None and delta:
+                    cursor.execute(
+                        "UPDATE products SET stock_quantity = COALESCE(stock_quantity, 0) + ? WHERE id = ?",
+                        (delta, product_id)
+                    )
+            else:
+                raise ValueError(f"Unknown change kind: {kind!r}")
+            
+            if log_origin is not None:
+                cursor.execute(
+                    """INSERT INTO product_changes (product_uid, kind, name, price, category, sku, stock_delta, origin)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (change["product_uid"], kind, change.get("name"), change.get("price"), change.get("category"),
+                     change.get("sku"), int(change.get("stock_delta") or 0), log_origin)
+                )
+            applied += 1
+    finally:
+        _set_state(cursor, APPLYING_KEY, 0)
+    return applied
+
+
+def receive_push(cursor: sqlite3.Cursor, store_id: str, changes: List[Dict]) -> int:
+    """Server side of a push: apply a store's changes once each; returns the acknowledged seq.
+    
+    A per-store watermark makes retries idempotent: changes at or below the
+    last acknowledged sequence are ignored.
+    """
+    row = cursor.execute("SELECT acked_seq FROM replication_peers WHERE store_id = ?", (store_id,)).fetchone()
+    acked = row[0] if row else 0
+    fresh = sorted((change for change in changes if change["seq"] > acked), key=lambda change: change["seq"])
+    if not fresh:
+        return acked
+    
+    apply_changes(cursor, fresh, log_origin=store_id)
+    acked = fresh[-1]["seq"]
+    cursor.execute("""
+        INSERT INTO replication_peers (store_id, acked_seq, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (store_id) DO UPDATE SET acked_seq = excluded.acked_seq, updated_at = excluded.updated_at
+    """, (store_id, acked))
+    return acked
+
+
+def encode_body(data: Dict) -> bytes:
+    return gzip.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+
+def decode_body(body: bytes, encoding: Optional[str]) -> Dict:
+    if encoding == 'gzip':
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+class ReplicationClient:
+    """HTTP client for a replication server (app.py or LocalReplicationServer)"""
+    
+    def __init__(self, base_url: str, api_key: Optional[str] = None, timeout: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+    
+    def _request(self, path: str, body: Optional[bytes] = None) -> Dict:
+        headers = {"Accept-Encoding": "gzip"}
+        if body is not None:
+            headers.update({"Content-Type": "application/json", "Content-Encoding": "gzip"})
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers,
+                                         method="POST" if body is not None else "GET")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return decode_body(response.read(), response.headers.get("Content-Encoding"))
+    
+    def push(self, store_id: str, changes: List[Dict]) -> int:
+        return self._request("/push", encode_body({"store_id": store_id, "changes": changes}))["acked_seq"]
+    
+    def pull(self, since: int, store_id: str, limit: int = DEFAULT_BATCH_SIZE) -> Dict:
+        query = urllib.parse.urlencode({"since": since, "store_id": store_id, "limit": limit})
+        return self._request(f"/changes?{query}")
+
+
+class Replicator:
+    """Keeps one store database in step with a replication server.
+    
+    push() sends local changes after the last acknowledged sequence and
+    drops them locally once acknowledged; pull() applies the server's feed
+    after the last sequence pulled. Both move in batches, one write per
+    batch through the database's write coordinator, so an interrupted sync
+    resumes where it stopped.
+    """
+    
+    def __init__(self, db_manager, client: ReplicationClient, store_id: Optional[str] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self.db = db_manager
+        self.client = client
+        self.batch_size = batch_size
+        self.writer = get_write_coordinator(db_manager)
+        self.store_id = store_id or get_store_id(self.db.connection())
+    
+    def push(self) -> int:
+        conn = self.db.connection()
+        pushed = 0
+        while True:
+            changes = local_changes(conn, _get_state(conn, PUSHED_KEY), self.batch_size)
+            if not changes:
+                return pushed
+            acked = self.client.push(self.store_id, changes)
+            
+            def acknowledge(cursor):
+                _set_state(cursor, PUSHED_KEY, acked)
+                cursor.execute("DELETE FROM product_changes WHERE seq <= ? AND origin IS NULL", (acked,))
+            
+            self.writer.run(acknowledge, conn=conn)
+            pushed += len([change for change in changes if change["seq"] <= acked])
+            if acked < changes[-1]["seq"]:
+                raise RuntimeError(f"Server acknowledged {acked}, expected {changes[-1]['seq']}")
+    
+    def pull(self) -> int:
+        conn = self.db.connection()
+        pulled = 0
+        while True:
+            since = _get_state(conn, PULLED_KEY)
+            page = self.client.pull(since, self.store_id, self.batch_size)
+            
+            def apply(cursor):
+                count = apply_changes(cursor, page["changes"], store_id=self.store_id)
+                _set_state(cursor, PULLED_KEY, page["last_seq"])
+                return count
+            
+            if page["last_seq"] != since:
+                pulled += self.writer.run(apply, conn=conn)
+            if not page["more"]:
+                return pulled
+    
+    @timed("replication.sync")
+    def sync(self) -> Dict:
+        """Push local changes, then pull everyone else's"""
+        start = time.perf_counter()
+        pushed = self.push()
+        pulled = self.pull()
+        return {"store_id": self.store_id, "pushed": pushed, "pulled": pulled,
+                "seconds": round(time.perf_counter() - start, 3)}
+
+
+class LocalReplicationServer:
+    """Local HTTP stand-in for the replication server, backed by its own database file.
+    
+    Serves the same /push and /changes protocol as app.py's
+    /api/replication endpoints, for tests and drills between store files.
+    """
+    
+    def __init__(self, db_name: str, host: str = "127.0.0.1", port: int = 0):
+        from db import get_connection_manager
+        from migrations import migrate
+        
+        self.db = get_connection_manager(db_name)
+        migrate(self.db.connection())
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                if not url.path.endswith("/changes"):
+                    return self._reply(404, {"error": "not found"})
+                query = dict(urllib.parse.parse_qsl(url.query))
+                conn = server.db.connection()
+                self._reply(200, changes_since(conn, int(query.get("since", 0)),
+                                               int(query.get("limit", DEFAULT_BATCH_SIZE)), query.get("store_id")))
+            
+            def do_POST(self):
+                if not self.path.endswith("/push"):
+                    return self._reply(404, {"error": "not found"})
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                payload = decode_body(body, self.headers.get("Content-Encoding"))
+                acked = get_write_coordinator(server.db).run(receive_push, payload["store_id"], payload["changes"],
+                                                             conn=server.db.connection())
+                self._reply(200, {"acked_seq": acked})
+            
+            def _reply(self, status, data):
+                body = encode_body(data)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/replication"
+    
+    def start(self) -> "LocalReplicationServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main(argv: List[str]) -> int:
+    """python replication.py DB SERVER_URL [store_id]"""
+    if len(argv) < 3:
+        print("usage: python replication.py DB SERVER_URL [store_id]")
+        return 2
+    
+    from db import get_connection_manager
+    from migrations import migrate
+    
+    manager = get_connection_manager(argv[1])
+    migrate(manager.connection())
+    replicator = Replicator(manager, ReplicationClient(argv[2]), argv[3] if len(argv) > 3 else None)
+    result = replicator.sync()
+    print(f"{argv[1]} (store {result['store_id']}): pushed {result['pushed']}, pulled {result['pulled']} "
+          f"changes in {result['seconds']}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,174 @@
+# report_cache.py (Report result cache invalidated by data version)
+import copy
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+CATALOG_VERSION_KEY = "catalog_version"
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 300.0  # seconds
+
+
+def get_data_version(conn: sqlite3.Connection) -> Tuple[int, int]:
+    """Cheap change counter: (last sales.id handed out, catalog version).
+    
+    Both parts only ever grow: every sale takes a new AUTOINCREMENT id (the
+    sequence does not go back when old rows are archived away), and
+    triggers on products bump the catalog version on any insert, update or
+    delete.
+    """
+    row = conn.execute("""
+        SELECT
+            (SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'sales'),
+            (SELECT COALESCE(MAX(value), 0) FROM sync_state WHERE key = ?)
+    """, (CATALOG_VERSION_KEY,)).fetchone()
+    return row[0], row[1]
+
+
+class DataVersionTracker:
+    """get_data_version without a query while the database files are unchanged.
+    
+    Every committed write changes the size or modification time of the
+    database file or its WAL, whichever process made it, so a stat() of the
+    two files tells whether the cached version can still be trusted. Only
+    when they changed (or max_age passed) is the version read again.
+    """
+    
+    def __init__(self, db_name: str, max_age: float = 60.0):
+        self.db_name = db_name
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._signature = None
+        self._version = None
+        self._read_at = 0.0
+        self._stats = {"stat_hits": 0, "queries": 0}
+    
+    def _file_signature(self) -> Tuple:
+        signature = []
+        for path in (self.db_name, self.db_name + "-wal"):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+    
+    def current(self, connect: Callable[[], sqlite3.Connection]) -> Tuple[int, int]:
+        """The data version; connect() is only called when it has to be re-read"""
+        # Taken before the query, so a write that lands during it is seen next time
+        signature = self._file_signature()
+        now = time.monotonic()
+        with self._lock:
+            if signature == self._signature and now - self._read_at < self.max_age:
+                self._stats["stat_hits"] += 1
+                return self._version
+        
+        version = get_data_version(connect())
+        with self._lock:
+            self._signature = signature
+            self._version = version
+            self._read_at = now
+            self._stats["queries"] += 1
+        return version
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, version=self._version)
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def get_data_version_tracker(db_name: str = "pos_system.db") -> DataVersionTracker:
+    """Process-wide tracker for a database file"""
+    key = os.path.abspath(db_name)
+    with _trackers_lock:
+        tracker = _trackers.get(key)
+        if tracker is None:
+            tracker = DataVersionTracker(db_name)
+            _trackers[key] = tracker
+        return tracker
+
+
+def normalize_params(params: Dict) -> Tuple:
+    """Order-independent cache key for request parameters; empty values are dropped"""
+    return tuple(sorted((str(key), str(value)) for key, value in params.items()
+                        if value is not None and value != ""))
+
+
+class ReportCache:
+    """LRU + TTL cache of report results, validated against get_data_version.
+    
+    An entry is only served while the database's data version still matches
+    the version it was computed at, so results are never stale; the TTL just
+    bounds how long unused entries linger.
+    """
+    
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "expired": 0, "evictions": 0}
+    
+    def get_or_compute(self, conn: sqlite3.Connection, endpoint: Tuple, params: Dict,
+                       compute: Callable[[], Any]) -> Any:
+        """Return the cached result for (endpoint, params), computing it on a miss"""
+        key = (endpoint, normalize_params(params))
+        version = get_data_version(conn)
+        now = time.monotonic()
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, expires_at, value = entry
+                if entry_version == version and expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return copy.deepcopy(value)
+                self._stats["stale" if entry_version != version else "expired"] += 1
+                del self._entries[key]
+            self._stats["misses"] += 1
+        
+        value = compute()
+        
+        with self._lock:
+            self._entries[key] = (version, now + self.ttl, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return value
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters, hit ratio and current size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["ttl"] = self.ttl
+        return stats
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_report_cache() -> ReportCache:
+    """Process-wide cache shared by app.py, POSSystem and POSApp"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ReportCache()
+        return _default_cache
@@ -0,0 +1,199 @@
+# reports.py (Sales reports shared by POSSystem, app.py and POSApp)
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from archive import sales_sources
+from metrics import timed
+from rollups import get_rollup_watermark
+from timerange import bucket_sql, check_grain, format_epoch, is_aligned, parse_range, range_conditions
+
+
+def _bucket_conditions(start: Optional[int], end: Optional[int], grain: str) -> Optional[Tuple[List[str], List]]:
+    """Translate an epoch range into conditions on a rollup table's buckets.
+    
+    Returns None when the range does not line up with the grain's buckets,
+    in which case the report has to be answered from the raw sales table.
+    """
+    if not (is_aligned(start, grain) and is_aligned(end, grain)):
+        return None
+    return range_conditions(start, end, "bucket")
+
+
+def _where(conditions: List[str]) -> str:
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+@contextmanager
+def _rollup_snapshot(conn: sqlite3.Connection, start: Optional[int],
+                     end: Optional[int]) -> Iterator[Tuple[List[str], List]]:
+    """Read the rollups as they stand, plus the sales not folded into them yet.
+    
+    Yields conditions (and params) selecting the sales rows above the rollup
+    watermark in [start, end); rollups and those rows are read in one read
+    transaction so they agree. Reports never write: catch_up is a job of
+    its own. A transaction the caller has open is used as is.
+    """
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        conn.execute("BEGIN")
+    try:
+        conditions, params = range_conditions(start, end)
+        yield ["id > ?"] + conditions, [get_rollup_watermark(conn)] + params
+    finally:
+        if own_transaction and conn.in_transaction:
+            conn.commit()
+
+
+@timed("report.summary")
+def sales_summary(conn: sqlite3.Connection, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                  use_rollups: bool = True) -> Dict:
+    """Transactions, items sold and revenue for a period"""
+    start, end = parse_range(start_date, end_date)
+    result = None
+    if use_rollups:
+        for grain, table in (("day", "sales_rollup_daily"), ("hour", "sales_rollup_hourly")):
+            bucket_filter = _bucket_conditions(start, end, grain)
+            if bucket_filter is not None:
+                conditions, params = bucket_filter
+                with _rollup_snapshot(conn, start, end) as (pending, pending_params):
+                    result = conn.execute(f"""
+                        SELECT SUM(transactions_count), SUM(items_sold), SUM(total_revenue)
+                        FROM (
+                            SELECT
+                                SUM(transactions_count) as transactions_count,
+                                SUM(items_sold) as items_sold,
+                                SUM(total_revenue) as total_revenue
+                            FROM {table}{_where(conditions)}
+                            UNION ALL
+                            SELECT COUNT(DISTINCT transaction_id), SUM(quantity), SUM(total)
+                            FROM sales{_where(pending)}
+                        )
+                    """, params + pending_params).fetchone()
+                break
+    
+    if result is None:
+        conditions, params = range_conditions(start, end)
+        # A transaction's lines share one timestamp, so sources never split one
+        totals = [0, 0, 0.0]
+        for source in sales_sources(conn, start, end):
+            row = conn.execute(f"""
+                SELECT
+                    COUNT(DISTINCT transaction_id) as transactions_count,
+                    SUM(quantity) as items_sold,
+                    SUM(total) as total_revenue
+                FROM {source}{_where(conditions)}
+            """, params).fetchall()[0]
+            totals = [total + (value or 0) for total, value in zip(totals, row)]
+        result = totals
+    
+    return {
+        "transactions_count": result[0] or 0,
+        "items_sold": result[1] or 0,
+        "total_revenue": result[2] or 0.0
+    }
+
+
+@timed("report.top_products")
+def top_products(conn: sqlite3.Connection, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                 limit: int = 10, use_rollups: bool = True) -> List[Dict]:
+    """Best-selling products by units sold for a period"""
+    start, end = parse_range(start_date, end_date)
+    bucket_filter = _bucket_conditions(start, end, "day") if use_rollups else None
+    if bucket_filter is not None:
+        conditions, params = bucket_filter
+        with _rollup_snapshot(conn, start, end) as (pending, pending_params):
+            query = f"""
+                SELECT
+                    p.id,
+                    p.name,
+                    p.category,
+                    SUM(r.items_sold) as total_sold,
+                    SUM(r.total_revenue) as total_revenue
+                FROM (
+                    SELECT product_id, items_sold, total_revenue
+                    FROM sales_rollup_product_daily{_where(conditions)}
+                    UNION ALL
+                    SELECT product_id, quantity, total
+                    FROM sales{_where(pending)}
+                ) r
+                JOIN products p ON r.product_id = p.id
+                GROUP BY p.id
+                ORDER BY total_sold DESC, p.id
+                LIMIT ?
+            """
+            return [dict(row) for row in conn.execute(query, params + pending_params + [int(limit)]).fetchall()]
+    
+    # Per-product totals from the hot table and any archives in the range, ranked here
+    conditions, params = range_conditions(start, end, "s.epoch")
+    products = {}
+    for source in sales_sources(conn, start, end):
+        rows = conn.execute(f"""
+            SELECT
+                p.id,
+                p.name,
+                p.category,
+                SUM(s.quantity) as total_sold,
+                SUM(s.total) as total_revenue
+            FROM {source} s
+            JOIN products p ON s.product_id = p.id{_where(conditions)}
+            GROUP BY p.id
+        """, params).fetchall()
+        for row in rows:
+            product = products.get(row["id"])
+            if product is None:
+                products[row["id"]] = dict(row)
+            else:
+                product["total_sold"] += row["total_sold"]
+                product["total_revenue"] += row["total_revenue"]
+    
+    ranked = sorted(products.values(), key=lambda product: (-product["total_sold"], product["id"]))
+    return ranked[:int(limit)]
+
+
+@timed("report.sales_by_period")
+def sales_by_period(conn: sqlite3.Connection, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                    grain: str = "day", use_rollups: bool = True) -> List[Dict]:
+    """Transactions, items sold and revenue per UTC hour, day or week (from Monday), oldest first"""
+    check_grain(grain)
+    start, end = parse_range(start_date, end_date)
+    periods = {}
+    
+    table, table_grain = ("sales_rollup_hourly", "hour") if grain == "hour" else ("sales_rollup_daily", "day")
+    bucket_filter = _bucket_conditions(start, end, table_grain) if use_rollups else None
+    raw_totals = "COUNT(DISTINCT transaction_id), SUM(quantity), SUM(total)"
+    
+    def add(source: str, bucket: str, totals: str, conditions: List[str], params: List):
+        rows = conn.execute(f"""
+            SELECT {bucket} AS period_start, {totals}
+            FROM {source}{_where(conditions)}
+            GROUP BY 1
+        """, params).fetchall()
+        for period_start, transactions_count, items_sold, total_revenue in rows:
+            period = periods.setdefault(period_start, [0, 0, 0.0])
+            period[0] += transactions_count
+            period[1] += items_sold or 0
+            period[2] += total_revenue or 0.0
+    
+    if bucket_filter is not None:
+        conditions, params = bucket_filter
+        with _rollup_snapshot(conn, start, end) as (pending, pending_params):
+            # Weeks are summed from day buckets: bucket arithmetic, no date parsing
+            add(table, bucket_sql(grain, "bucket"), "SUM(transactions_count), SUM(items_sold), SUM(total_revenue)",
+                conditions, params)
+            add("sales", bucket_sql(grain), raw_totals, pending, pending_params)
+    else:
+        conditions, params = range_conditions(start, end)
+        for source in sales_sources(conn, start, end):
+            add(source, bucket_sql(grain), raw_totals, conditions, params)
+    
+    return [
+        {
+            "period_start": period_start,
+            "period": format_epoch(period_start),
+            "transactions_count": transactions_count,
+            "items_sold": items_sold,
+            "total_revenue": total_revenue
+        }
+        for period_start, (transactions_count, items_sold, total_revenue) in sorted(periods.items())
+    ]
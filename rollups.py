@@ -0,0 +1,264 @@
+# rollups.py (Incrementally maintained sales rollup tables)
+import sqlite3
+import sys
+from typing import Dict, Iterable, List, Tuple
+
+from timerange import bucket_sql
+from writes import write_transaction
+
+# Sales rows with id <= this watermark are already counted in the rollups
+ROLLUP_WATERMARK_KEY = "rollups_through"
+
+# (table, bucket expression, extra key columns); buckets are the epoch
+# second the UTC hour or day starts at
+ROLLUPS = [
+    ("sales_rollup_hourly", bucket_sql("hour"), []),
+    ("sales_rollup_daily", bucket_sql("day"), []),
+    ("sales_rollup_product_daily", bucket_sql("day"), ["product_id"])
+]
+
+SCHEMA = [
+    '''
+        CREATE TABLE IF NOT EXISTS sales_rollup_hourly (
+            bucket INTEGER PRIMARY KEY,
+            transactions_count INTEGER NOT NULL,
+            items_sold INTEGER NOT NULL,
+            total_revenue REAL NOT NULL
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS sales_rollup_daily (
+            bucket INTEGER PRIMARY KEY,
+            transactions_count INTEGER NOT NULL,
+            items_sold INTEGER NOT NULL,
+            total_revenue REAL NOT NULL
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS sales_rollup_product_daily (
+            bucket INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            transactions_count INTEGER NOT NULL,
+            items_sold INTEGER NOT NULL,
+            total_revenue REAL NOT NULL,
+            PRIMARY KEY (bucket, product_id)
+        )
+    '''
+]
+
+
+def _aggregate_sql(bucket_expr: str, keys: List[str], source: str = "sales", where: str = "") -> str:
+    select_keys = ", ".join([bucket_expr] + keys)
+    group_keys = ", ".join(["1"] + [str(i + 2) for i in range(len(keys))])
+    return f"""
+        SELECT {select_keys}, COUNT(DISTINCT transaction_id), SUM(quantity), SUM(total)
+        FROM {source}{where}
+        GROUP BY {group_keys}
+    """
+
+
+def _merge_sql(table: str, keys: List[str], rows_sql: str) -> str:
+    key_columns = ", ".join(["bucket"] + keys)
+    return f"""
+        INSERT INTO {table} ({key_columns}, transactions_count, items_sold, total_revenue)
+        {rows_sql}
+        ON CONFLICT ({key_columns}) DO UPDATE SET
+            transactions_count = transactions_count + excluded.transactions_count,
+            items_sold = items_sold + excluded.items_sold,
+            total_revenue = total_revenue + excluded.total_revenue
+    """
+
+
+def _upsert_sql(table: str, bucket_expr: str, keys: List[str]) -> str:
+    return _merge_sql(table, keys, _aggregate_sql(bucket_expr, keys, where=" WHERE id > ? AND id <= ?"))
+
+
+def _fold(db, target: str, bucket_expr: str, keys: List[str], conn: sqlite3.Connection, source: str):
+    """Add the aggregates of sales held in another database to target"""
+    rows = conn.execute(_aggregate_sql(bucket_expr, keys, source)).fetchall()
+    placeholders = ", ".join("?" * (len(keys) + 4))
+    db.executemany(_merge_sql(target, keys, f"VALUES ({placeholders})"), rows)
+
+
+def get_rollup_watermark(db) -> int:
+    row = db.execute("SELECT value FROM sync_state WHERE key = ?", (ROLLUP_WATERMARK_KEY,)).fetchone()
+    return row[0] if row else 0
+
+
+def _set_rollup_watermark(db, value: int):
+    db.execute("""
+        INSERT INTO sync_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+    """, (ROLLUP_WATERMARK_KEY, value))
+
+
+def apply_new_sales(db) -> int:
+    """Fold sales rows added since the watermark into the rollups.
+    
+    Must run inside the caller's write transaction (checkout calls it just
+    before committing, so rollups change atomically with the sale). Returns
+    the number of sales rows applied.
+    """
+    low = get_rollup_watermark(db)
+    high = db.execute("SELECT COALESCE(MAX(id), 0) FROM sales").fetchone()[0]
+    if high <= low:
+        return 0
+    
+    for table, bucket_expr, keys in ROLLUPS:
+        db.execute(_upsert_sql(table, bucket_expr, keys), (low, high))
+    _set_rollup_watermark(db, high)
+    return high - low
+
+
+def catch_up(conn: sqlite3.Connection, writer=None) -> int:
+    """Incremental catch-up job for sales written outside checkout and ingestion.
+    
+    Runs as a write of its own - through writer (a WriteCoordinator) when
+    given, else write_transaction - so it gets the usual busy retry. Reports
+    never need it: they add the sales above the watermark themselves.
+    """
+    if conn.in_transaction:
+        raise RuntimeError("catch_up runs its own write transaction; finish the open one first")
+    high = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sales").fetchone()[0]
+    if high <= get_rollup_watermark(conn):
+        return 0
+    if writer is not None:
+        return writer.run(apply_new_sales, conn=conn)
+    return write_transaction(conn, apply_new_sales)
+
+
+def rebuild(db, archived: Iterable[Tuple[sqlite3.Connection, str]] = ()):
+    """Recompute every rollup from the raw sales table (no transaction handling).
+    
+    archived holds (connection, source) pairs for sales that were moved out
+    of the table into archive databases; their aggregates are added on top.
+    """
+    for table, bucket_expr, keys in ROLLUPS:
+        db.execute(f"DELETE FROM {table}")
+    _set_rollup_watermark(db, 0)
+    apply_new_sales(db)
+    for conn, source in archived:
+        for table, bucket_expr, keys in ROLLUPS:
+            _fold(db, table, bucket_expr, keys, conn, source)
+
+
+def rebuild_rollups(conn: sqlite3.Connection, archived: Iterable[Tuple[sqlite3.Connection, str]] = (), writer=None):
+    """Rebuild command: recompute every rollup as one write (through writer, a WriteCoordinator, when given)"""
+    archived = list(archived)
+    if writer is not None:
+        writer.run(rebuild, archived, conn=conn)
+    else:
+        write_transaction(conn, rebuild, archived)
+
+
+def _archived_raw(conn: sqlite3.Connection, table: str, bucket_expr: str, keys: List[str], where: str,
+                  archived: List[Tuple[sqlite3.Connection, str]]) -> str:
+    """Raw aggregates of the sales table plus the archives, collected in a temp table"""
+    conn.execute("DROP TABLE IF EXISTS temp.rollup_check_raw")
+    conn.execute(f"CREATE TEMP TABLE rollup_check_raw AS SELECT * FROM {table} WHERE 0")
+    conn.execute(f"CREATE UNIQUE INDEX temp.idx_rollup_check_raw ON rollup_check_raw ({', '.join(['bucket'] + keys)})")
+    conn.execute(_merge_sql("temp.rollup_check_raw", keys, _aggregate_sql(bucket_expr, keys, where=where)))
+    for archive_conn, source in archived:
+        _fold(conn, "temp.rollup_check_raw", bucket_expr, keys, archive_conn, source)
+    return "SELECT * FROM temp.rollup_check_raw"
+
+
+def check_rollups(conn: sqlite3.Connection, archived: Iterable[Tuple[sqlite3.Connection, str]] = ()) -> List[Dict]:
+    """Compare each rollup with the raw sales (plus any archived sales); returns the mismatched buckets.
+    
+    Read-only. The rollups hold exactly the sales up to the watermark, so
+    that is what they are compared with, in one read transaction (the
+    caller's, if one is open). Sales above it are pending: reports add them
+    on the fly and catch_up folds them in.
+    """
+    archived = list(archived)
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        conn.execute("BEGIN")
+    try:
+        return _compare_rollups(conn, archived, f" WHERE id <= {int(get_rollup_watermark(conn))}")
+    finally:
+        if archived:
+            conn.execute("DROP TABLE IF EXISTS temp.rollup_check_raw")
+        if own_transaction and conn.in_transaction:
+            conn.commit()
+
+
+def _compare_rollups(conn: sqlite3.Connection, archived: List[Tuple[sqlite3.Connection, str]],
+                     where: str) -> List[Dict]:
+    mismatches = []
+    for table, bucket_expr, keys in ROLLUPS:
+        key_columns = ", ".join(["bucket"] + keys)
+        raw_keys = ", ".join([f"{bucket_expr} AS bucket"] + keys)
+        join_on = " AND ".join(f"r.{key} = a.{key}" for key in ["bucket"] + keys)
+        raw = f"""
+            SELECT {raw_keys}, COUNT(DISTINCT transaction_id) AS transactions_count,
+                   SUM(quantity) AS items_sold, SUM(total) AS total_revenue
+            FROM sales{where}
+            GROUP BY {key_columns}
+        """
+        if archived:
+            raw = _archived_raw(conn, table, bucket_expr, keys, where, archived)
+        # Full outer join written as two LEFT JOINs (buckets missing on either side)
+        query = f"""
+            SELECT r.*, a.transactions_count AS raw_transactions, a.items_sold AS raw_items,
+                   a.total_revenue AS raw_revenue
+            FROM {table} r LEFT JOIN ({raw}) a ON {join_on}
+            UNION ALL
+            SELECT a.{', a.'.join(['bucket'] + keys)}, NULL, NULL, NULL,
+                   a.transactions_count, a.items_sold, a.total_revenue
+            FROM ({raw}) a LEFT JOIN {table} r ON {join_on}
+            WHERE r.bucket IS NULL
+        """
+        cursor = conn.execute(query)
+        columns = [description[0] for description in cursor.description]
+        for values in cursor:
+            row = dict(zip(columns, values))
+            if (row['transactions_count'] != row['raw_transactions']
+                    or row['items_sold'] != row['raw_items']
+                    or abs((row['total_revenue'] or 0) - (row['raw_revenue'] or 0)) > 0.005):
+                row['table'] = table
+                mismatches.append(row)
+    return mismatches
+
+
+def _has_archived_sales(conn: sqlite3.Connection) -> bool:
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sales_archives'").fetchone() is None:
+        return False
+    return conn.execute("SELECT EXISTS (SELECT 1 FROM sales_archives)").fetchone()[0] == 1
+
+
+def main(argv: List[str]) -> int:
+    """python rollups.py [db] rebuild|check|catch-up"""
+    db_name = argv[1] if len(argv) > 1 else "pos_system.db"
+    command = argv[2] if len(argv) > 2 else "check"
+    conn = sqlite3.connect(db_name)
+    conn.row_factory = sqlite3.Row
+    try:
+        if command == "catch-up":
+            applied = catch_up(conn)
+            print(f"{db_name}: {applied} sales rows folded into the rollups")
+            return 0
+        if _has_archived_sales(conn):
+            # Rollups cover the archived months too, which only archive.py can read
+            print(f"{db_name}: has archived sales; use python archive.py {db_name} {command}")
+            return 2
+        
+        if command == "rebuild":
+            rebuild_rollups(conn)
+            print(f"{db_name}: rollups rebuilt through sales.id {get_rollup_watermark(conn)}")
+            return 0
+        
+        mismatches = check_rollups(conn)
+        for row in mismatches:
+            print(f"  MISMATCH {row['table']} {row['bucket']}: rollup "
+                  f"({row['transactions_count']}, {row['items_sold']}, {row['total_revenue']}) vs raw "
+                  f"({row['raw_transactions']}, {row['raw_items']}, {row['raw_revenue']})")
+        print(f"{db_name}: {len(mismatches)} mismatched rollup buckets")
+        return 1 if mismatches else 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,143 @@
+# search.py (Barcode/SKU lookup and product name search)
+import sqlite3
+from typing import Dict, List, Optional
+
+# Columns handed out for search results (same shape as the catalog's products)
+PRODUCT_FIELDS = ("id", "name", "price", "category", "stock_quantity", "sku")
+PRODUCT_COLUMNS = ", ".join(f"p.{field}" for field in PRODUCT_FIELDS)
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 200
+
+# Trigram tokens are three characters; shorter queries use the name index only
+MIN_SUBSTRING_LENGTH = 3
+
+# External-content FTS5 index over products, kept in step by triggers.
+# Stock changes (every checkout) do not touch name/sku, so they skip the index.
+SEARCH_SCHEMA = [
+    '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, sku, content='products', content_rowid='id', tokenize='trigram'
+        )
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_products_fts_insert AFTER INSERT ON products
+        BEGIN
+            INSERT INTO products_fts (rowid, name, sku) VALUES (NEW.id, NEW.name, NEW.sku);
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_products_fts_update AFTER UPDATE OF name, sku ON products
+        BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, sku) VALUES ('delete', OLD.id, OLD.name, OLD.sku);
+            INSERT INTO products_fts (rowid, name, sku) VALUES (NEW.id, NEW.name, NEW.sku);
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS trg_products_fts_delete AFTER DELETE ON products
+        BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, sku) VALUES ('delete', OLD.id, OLD.name, OLD.sku);
+        END
+    ''',
+    "INSERT INTO products_fts (products_fts) VALUES ('rebuild')"
+]
+
+
+def create_search_index(db):
+    """Migration step: build the FTS5 trigram index if this SQLite supports it.
+    
+    Builds without FTS5 or the trigram tokenizer (SQLite < 3.34) skip it;
+    search_products then falls back to a LIKE scan for substring matches.
+    """
+    try:
+        db.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x, tokenize='trigram')")
+        db.execute("DROP TABLE temp.fts5_probe")
+    except sqlite3.OperationalError:
+        return
+    
+    for step in SEARCH_SCHEMA:
+        db.execute(step)
+
+
+def has_search_index(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'").fetchone()
+    return row is not None
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_phrase(text: str) -> str:
+    """Quote user input as a single FTS5 string (a substring match under trigram)"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def lookup_sku(conn: sqlite3.Connection, sku: str) -> Optional[Dict]:
+    """Exact barcode/SKU lookup through the unique index, or None"""
+    sku = (sku or "").strip()
+    if not sku:
+        return None
+    row = conn.execute(f"SELECT {PRODUCT_COLUMNS} FROM products p WHERE p.sku = ?", (sku,)).fetchone()
+    return dict(zip(PRODUCT_FIELDS, row)) if row else None
+
+
+def search_products(conn: sqlite3.Connection, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[Dict]:
+    """Search-as-you-type: an exact SKU, else name and SKU prefix matches, then substring matches.
+    
+    Prefix matches come from the NOCASE name index (in name order) and the
+    SKU index; substring matches (name or SKU containing the query) come
+    from the trigram index. Every step stops at `limit`, so cost does not
+    grow with catalog size.
+    """
+    query = (query or "").strip()
+    limit = max(1, min(int(limit), MAX_SEARCH_LIMIT))
+    if not query:
+        return []
+    
+    results = []
+    seen = set()
+    
+    def collect(sql, params):
+        for row in conn.execute(sql, params):
+            if row[0] not in seen:
+                seen.add(row[0])
+                results.append(dict(zip(PRODUCT_FIELDS, row)))
+    
+    # A scanned barcode is an exact SKU hit and needs nothing else
+    product = lookup_sku(conn, query)
+    if product is not None:
+        return [product]
+    
+    collect(f"""
+        SELECT {PRODUCT_COLUMNS} FROM products p
+        WHERE p.name LIKE ? ESCAPE '\\'
+        ORDER BY p.name COLLATE NOCASE, p.id
+        LIMIT ?
+    """, (_escape_like(query) + "%", limit + 1))
+    
+    if len(results) < limit:
+        # Partially typed barcodes: a range scan on the unique SKU index
+        collect(f"""
+            SELECT {PRODUCT_COLUMNS} FROM products p
+            WHERE p.sku >= ? AND p.sku < ?
+            ORDER BY p.sku
+            LIMIT ?
+        """, (query, query + "\U0010ffff", limit))
+    
+    if len(results) < limit and len(query) >= MIN_SUBSTRING_LENGTH:
+        if has_search_index(conn):
+            collect(f"""
+                SELECT {PRODUCT_COLUMNS} FROM products_fts f
+                JOIN products p ON p.id = f.rowid
+                WHERE products_fts MATCH ?
+                LIMIT ?
+            """, (_fts_phrase(query), limit + len(seen)))
+        else:
+            collect(f"""
+                SELECT {PRODUCT_COLUMNS} FROM products p
+                WHERE p.name LIKE ? ESCAPE '\\' OR p.sku LIKE ? ESCAPE '\\'
+                LIMIT ?
+            """, ("%" + _escape_like(query) + "%", "%" + _escape_like(query) + "%", limit + len(seen)))
+    
+    return results[:limit]
@@ -0,0 +1,456 @@
+# sync.py (Chunked, compressed bulk sync pipeline)
+import gzip
+import json
+import sqlite3
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+from writes import WriteCoordinator, get_write_coordinator, write_transaction
+
+DEFAULT_CHUNK_SIZE = 500        # transactions per upload
+DEFAULT_FETCH_SIZE = 2000       # sale lines read per query
+DEFAULT_COMPRESS_LEVEL = 6
+SALES_WATERMARK_KEY = "sales_synced_through"
+DEFAULT_SYNC_INTERVAL = 30.0    # seconds between background syncs when healthy
+DEFAULT_BACKOFF_BASE = 2.0      # seconds before the first retry
+DEFAULT_BACKOFF_MAX = 600.0     # cap on the retry delay
+
+
+def group_sales_by_transaction(sales: List[Dict]) -> List[Dict]:
+    """Group sale line dicts (as returned by get_unsynced_sales) into transactions"""
+    transactions = []
+    by_id = {}
+    for sale in sales:
+        transaction = by_id.get(sale['transaction_id'])
+        if transaction is None:
+            transaction = {
+                'transaction_id': sale['transaction_id'],
+                'timestamp': sale['timestamp'],
+                'lines': []
+            }
+            by_id[sale['transaction_id']] = transaction
+            transactions.append(transaction)
+        transaction['lines'].append({
+            'sale_id': sale['id'],
+            'product_id': sale['product_id'],
+            'product_name': sale.get('product_name'),
+            'quantity': sale['quantity'],
+            'price': sale['price'],
+            'total': sale['total']
+        })
+    return transactions
+
+
+def encode_payload(transactions: List[Dict], compresslevel: int = DEFAULT_COMPRESS_LEVEL) -> bytes:
+    """Serialize transactions as compact JSON and gzip it"""
+    raw = json.dumps({'transactions': transactions}, separators=(',', ':')).encode('utf-8')
+    return gzip.compress(raw, compresslevel=compresslevel)
+
+
+def decode_payload(body: bytes) -> Dict:
+    """Inverse of encode_payload"""
+    return json.loads(gzip.decompress(body).decode('utf-8'))
+
+
+def get_sync_watermark(conn: sqlite3.Connection, key: str = SALES_WATERMARK_KEY) -> int:
+    """Highest sales.id known to be synced along with everything before it"""
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def set_sync_watermark(cursor: sqlite3.Cursor, value: int, key: str = SALES_WATERMARK_KEY):
+    """Persist a high-water mark (call inside the caller's transaction)"""
+    cursor.execute("""
+        INSERT INTO sync_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+    """, (key, value))
+
+
+def iter_unsynced_sales(conn: sqlite3.Connection, batch_size: int = DEFAULT_FETCH_SIZE,
+                        after_id: Optional[int] = None) -> Iterator[Dict]:
+    """Stream unsynced sale lines (with product_name) in sales.id order.
+    
+    Rows are read batch_size at a time with keyset pagination on sales.id,
+    starting after the persisted watermark unless after_id is given, so
+    memory stays flat however large the backlog is.
+    """
+    if after_id is None:
+        after_id = get_sync_watermark(conn)
+    
+    while True:
+        rows = conn.execute("""
+            SELECT s.*, p.name AS product_name
+            FROM sales s
+            LEFT JOIN products p ON s.product_id = p.id
+            WHERE s.synced = 0 AND s.id > ?
+            ORDER BY s.id
+            LIMIT ?
+        """, (after_id, batch_size)).fetchall()
+        if not rows:
+            return
+        
+        for row in rows:
+            yield dict(row)
+        after_id = rows[-1]['id']
+
+
+def iter_unsynced_chunks(conn: sqlite3.Connection, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         fetch_size: int = DEFAULT_FETCH_SIZE, after_id: Optional[int] = None) -> Iterator[Dict]:
+    """Yield chunks of up to chunk_size whole transactions, in sales.id order.
+    
+    Built on iter_unsynced_sales, so only one fetch batch and one chunk are
+    held in memory at a time. Each chunk carries the sales.id range it covers
+    so it can be marked synced in one statement.
+    """
+    transactions = []
+    current = None
+    first_id = None
+    lines_count = 0
+    
+    for row in iter_unsynced_sales(conn, fetch_size, after_id):
+        if current is None or current['transaction_id'] != row['transaction_id']:
+            if current is not None and len(transactions) == chunk_size:
+                yield _make_chunk(transactions, first_id, lines_count)
+                transactions, first_id, lines_count = [], None, 0
+            current = {
+                'transaction_id': row['transaction_id'],
+                'timestamp': row['timestamp'],
+                'lines': []
+            }
+            transactions.append(current)
+        
+        if first_id is None:
+            first_id = row['id']
+        current['lines'].append({
+            'sale_id': row['id'],
+            'product_id': row['product_id'],
+            'product_name': row['product_name'],
+            'quantity': row['quantity'],
+            'price': row['price'],
+            'total': row['total']
+        })
+        lines_count += 1
+    
+    if transactions:
+        yield _make_chunk(transactions, first_id, lines_count)
+
+
+def _make_chunk(transactions: List[Dict], first_id: int, lines_count: int) -> Dict:
+    return {
+        'transactions': transactions,
+        'first_sale_id': first_id,
+        'last_sale_id': transactions[-1]['lines'][-1]['sale_id'],
+        'lines_count': lines_count
+    }
+
+
+class SyncPipeline:
+    """Drains unsynced sales to the cloud in compressed, per-transaction chunks"""
+    
+    def __init__(self, conn: sqlite3.Connection, cloud, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 compresslevel: int = DEFAULT_COMPRESS_LEVEL, fetch_size: int = DEFAULT_FETCH_SIZE,
+                 max_in_flight: int = 1, coordinator: Optional[WriteCoordinator] = None):
+        self.conn = conn
+        self.cloud = cloud
+        self.coordinator = coordinator
+        self.chunk_size = chunk_size
+        self.compresslevel = compresslevel
+        self.fetch_size = fetch_size
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.stats = {
+            'chunks': 0,
+            'failed_chunks': 0,
+            'transactions': 0,
+            'lines': 0,
+            'bytes_sent': 0,
+            'seconds': 0.0
+        }
+    
+    def run(self, max_chunks: Optional[int] = None) -> Dict:
+        """Upload chunks until the backlog is empty, an upload fails or max_chunks is hit.
+        
+        Up to max_in_flight uploads run concurrently; chunks are still read on
+        the calling thread's connection, and their results recorded through
+        the coordinator when given (else on that connection).
+        """
+        started = time.perf_counter()
+        result = {'chunks': 0, 'transactions': 0, 'lines': 0, 'bytes_sent': 0, 'failed': False}
+        in_flight = deque()
+        submitted = 0
+        
+        def settle_oldest():
+            chunk, payload_bytes, future = in_flight.popleft()
+            try:
+                ok = bool(future.result())
+            except Exception:
+                ok = False
+            # The watermark only moves while every earlier chunk has succeeded
+            self._record_chunk(chunk, payload_bytes, ok, advance_watermark=ok and not result['failed'])
+            if not ok:
+                result['failed'] = True
+                self.stats['failed_chunks'] += 1
+                return
+            
+            result['chunks'] += 1
+            result['transactions'] += len(chunk['transactions'])
+            result['lines'] += chunk['lines_count']
+            result['bytes_sent'] += payload_bytes
+        
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="sync-upload")
+        try:
+            for chunk in iter_unsynced_chunks(self.conn, self.chunk_size, self.fetch_size):
+                body = encode_payload(chunk['transactions'], self.compresslevel)
+                in_flight.append((chunk, len(body), executor.submit(self.cloud.upload_payload, body)))
+                submitted += 1
+                
+                if len(in_flight) >= self.max_in_flight:
+                    settle_oldest()
+                if result['failed'] or (max_chunks is not None and submitted >= max_chunks):
+                    break
+            
+            # Uploads already sent still get recorded, even after a failure
+            while in_flight:
+                settle_oldest()
+        finally:
+            executor.shutdown(wait=True)
+            elapsed = time.perf_counter() - started
+            for key in ('chunks', 'transactions', 'lines', 'bytes_sent'):
+                self.stats[key] += result[key]
+            self.stats['seconds'] += elapsed
+        
+        result['seconds'] = elapsed
+        result['transactions_per_second'] = result['transactions'] / elapsed if elapsed else 0.0
+        return result
+    
+    def _record_chunk(self, chunk: Dict, payload_bytes: int, ok: bool, advance_watermark: bool = False):
+        """Mark a chunk synced with one bulk UPDATE and write one sync_log row"""
+        transactions = chunk['transactions']
+        label = transactions[0]['transaction_id']
+        if len(transactions) > 1:
+            label += f"..{transactions[-1]['transaction_id']}"
+        
+        def record(cursor):
+            if ok:
+                cursor.execute(
+                    "UPDATE sales SET synced = 1 WHERE synced = 0 AND id BETWEEN ? AND ?",
+                    (chunk['first_sale_id'], chunk['last_sale_id'])
+                )
+            if advance_watermark:
+                set_sync_watermark(cursor, chunk['last_sale_id'])
+            cursor.execute(
+                """INSERT INTO sync_log (transaction_id, status, first_sale_id, last_sale_id,
+                                         transactions_count, lines_count, payload_bytes)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (label, "success" if ok else "failed", chunk['first_sale_id'], chunk['last_sale_id'],
+                 len(transactions), chunk['lines_count'], payload_bytes)
+            )
+        
+        # Competes with checkouts for the write lock, so it is queued with them when a coordinator is set
+        if self.coordinator is not None:
+            self.coordinator.run(record, conn=self.conn)
+        else:
+            write_transaction(self.conn, record)
+    
+    def throughput(self) -> Dict:
+        """Cumulative counters plus transactions and lines per second"""
+        stats = dict(self.stats)
+        seconds = stats['seconds']
+        stats['transactions_per_second'] = stats['transactions'] / seconds if seconds else 0.0
+        stats['lines_per_second'] = stats['lines'] / seconds if seconds else 0.0
+        return stats
+
+
+def get_outbox_status(conn: sqlite3.Connection) -> Dict:
+    """Queue depth and lag of the durable outbox (unsynced sales)"""
+    row = conn.execute("""
+        SELECT COUNT(*) AS pending_lines,
+               COUNT(DISTINCT transaction_id) AS pending_transactions,
+               MIN(timestamp) AS oldest_unsynced,
+               CAST(strftime('%s', 'now') AS INTEGER) - CAST(strftime('%s', MIN(timestamp)) AS INTEGER) AS lag_seconds
+        FROM sales
+        WHERE synced = 0
+    """).fetchone()
+    last_success = conn.execute(
+        "SELECT MAX(sync_time) FROM sync_log WHERE status = 'success'"
+    ).fetchone()[0]
+    return {
+        'pending_lines': row['pending_lines'],
+        'pending_transactions': row['pending_transactions'],
+        'oldest_unsynced': row['oldest_unsynced'],
+        'lag_seconds': row['lag_seconds'] or 0,
+        'last_success': last_success
+    }
+
+
+class SyncWorker:
+    """Background thread that drains the sales outbox to the cloud.
+    
+    The outbox is durable: it is simply every sales row with synced = 0, and
+    every chunk attempt is written to sync_log, so nothing is lost if the
+    process stops mid-drain. Failed syncs are retried with exponential
+    backoff and jitter; healthy syncs repeat every interval seconds or as
+    soon as notify() is called.
+    """
+    
+    def __init__(self, db_manager, cloud, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 interval: float = DEFAULT_SYNC_INTERVAL, max_in_flight: int = 2,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_max: float = DEFAULT_BACKOFF_MAX):
+        self.db_manager = db_manager
+        self.cloud = cloud
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.max_in_flight = max_in_flight
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_result = None
+        self.next_attempt = None
+        self.pipeline = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+    
+    def start(self) -> "SyncWorker":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sync-worker", daemon=True)
+            self._thread.start()
+        return self
+    
+    def stop(self, timeout: Optional[float] = None):
+        """Ask the worker to finish its current chunk and exit"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def notify(self):
+        """Sync soon (e.g. after a sale); ignored while backing off after failures"""
+        if self.consecutive_failures == 0:
+            self._wake.set()
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def backoff_delay(self) -> float:
+        """Exponential backoff with equal jitter for the current failure count"""
+        cap = min(self.backoff_max, self.backoff_base * (2 ** max(0, self.consecutive_failures - 1)))
+        return cap / 2 + random.uniform(0, cap / 2)
+    
+    def _run(self):
+        self.pipeline = SyncPipeline(self.db_manager.connection(), self.cloud,
+                                     chunk_size=self.chunk_size, max_in_flight=self.max_in_flight,
+                                     coordinator=get_write_coordinator(self.db_manager))
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.last_result = self.pipeline.run()
+                    failed = self.last_result['failed']
+                    if failed:
+                        self.last_error = "upload rejected or unreachable"
+                except Exception as e:
+                    failed = True
+                    self.last_error = str(e)
+                
+                if failed:
+                    self.consecutive_failures += 1
+                    delay = self.backoff_delay()
+                else:
+                    self.consecutive_failures = 0
+                    self.last_error = None
+                    delay = self.interval
+                
+                self.next_attempt = time.time() + delay
+                self._wake.wait(delay)
+                self._wake.clear()
+        finally:
+            self.db_manager.close()
+    
+    def status(self) -> Dict:
+        """Queue depth, lag and retry state (safe to call from any thread)"""
+        status = get_outbox_status(self.db_manager.connection())
+        status.update({
+            'running': self.running,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+            'next_attempt_in': max(0.0, self.next_attempt - time.time()) if self.next_attempt else None,
+            'throughput': self.pipeline.throughput() if self.pipeline else None
+        })
+        return status
+
+
+class LocalCloudServer:
+    """Local HTTP stand-in for the cloud sync endpoint, for tests and drills.
+    
+    Accepts gzip JSON payloads on any POST path and keeps counts of what it
+    received. Set fail_next to make the next N uploads return HTTP 503.
+    """
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, reply = server._handle(body)
+                data = json.dumps(reply).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.fail_next = 0
+        self.requests = 0
+        self.transactions = 0
+        self.lines = 0
+        self.transaction_ids = set()
+    
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/sync"
+    
+    def _handle(self, body: bytes):
+        with self._lock:
+            self.requests += 1
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return 503, {'error': 'unavailable'}
+        
+        payload = decode_payload(body)
+        with self._lock:
+            for transaction in payload['transactions']:
+                self.transaction_ids.add(transaction['transaction_id'])
+                self.lines += len(transaction['lines'])
+            self.transactions += len(payload['transactions'])
+        return 200, {'accepted': len(payload['transactions'])}
+    
+    def start(self) -> "LocalCloudServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
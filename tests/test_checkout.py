@@ -0,0 +1,71 @@
+# test_checkout.py (Set-based checkout: stock guard, missing products, repeated lines)
+import pytest
+
+import checkout
+from checkout import InsufficientStockError, process_checkout
+from pos_system import POSSystem
+
+
+@pytest.fixture
+def pos(tmp_path):
+    return POSSystem(str(tmp_path / "pos.db"))
+
+
+def stock(pos):
+    rows = pos.db.connection().execute("SELECT id, stock_quantity FROM products")
+    return {product_id: quantity for product_id, quantity in rows}
+
+
+def sales_count(pos):
+    return pos.db.connection().execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+
+
+def test_short_line_rolls_back_the_whole_sale(pos, monkeypatch):
+    conn = pos.db.connection()
+    before = stock(pos)
+    fetch = checkout._fetch_products
+    calls = []
+    
+    def stale_fetch(cursor, product_ids):
+        # The first read sees stock another writer has since sold, so only the conditional UPDATE catches it
+        products = fetch(cursor, product_ids)
+        calls.append(product_ids)
+        if len(calls) == 1:
+            products[2] = (products[2][0], products[2][1] + 100)
+        return products
+    
+    monkeypatch.setattr(checkout, "_fetch_products", stale_fetch)
+    with pytest.raises(InsufficientStockError) as error:
+        process_checkout(conn, "TXN-SHORT", [{"product_id": 1, "quantity": 1},
+                                             {"product_id": 2, "quantity": before[2] + 1}])
+    
+    assert len(calls) == 2
+    assert error.value.shortages == [{"product_id": 2, "requested": before[2] + 1, "available": before[2]}]
+    assert stock(pos) == before
+    assert sales_count(pos) == 0
+
+
+def test_missing_products_are_reported(pos):
+    conn = pos.db.connection()
+    with pytest.raises(ValueError, match="Product with ID 999 not found"):
+        process_checkout(conn, "TXN-MISSING", [{"product_id": 1, "quantity": 1}, {"product_id": 999, "quantity": 1}])
+    with pytest.raises(ValueError, match="Products with IDs 998, 999 not found"):
+        process_checkout(conn, "TXN-MISSING", [{"product_id": 998, "quantity": 1}, {"product_id": 999, "quantity": 1}])
+    assert sales_count(pos) == 0
+
+
+def test_repeated_lines_are_combined(pos):
+    conn = pos.db.connection()
+    available = stock(pos)[1]
+    
+    # Each line fits on its own, together they do not
+    with pytest.raises(InsufficientStockError) as error:
+        process_checkout(conn, "TXN-SPLIT", [{"product_id": 1, "quantity": available - 1},
+                                             {"product_id": 1, "quantity": 2}])
+    assert error.value.shortages == [{"product_id": 1, "requested": available + 1, "available": available}]
+    assert stock(pos)[1] == available
+    
+    process_checkout(conn, "TXN-OK", [{"product_id": 1, "quantity": 2}, {"product_id": 1, "quantity": 3}])
+    assert stock(pos)[1] == available - 5
+    lines = conn.execute("SELECT quantity FROM sales WHERE transaction_id = 'TXN-OK' ORDER BY id").fetchall()
+    assert [row[0] for row in lines] == [2, 3]
@@ -0,0 +1,28 @@
+# test_ingest.py (Batched ingestion of uploaded sales)
+from ingest import ingest_transactions
+from pos_system import POSSystem
+
+
+def _transaction(transaction_id, *product_ids):
+    return {
+        "transaction_id": transaction_id,
+        "timestamp": "2026-10-01 12:00:00",
+        "lines": [{"product_id": product_id, "quantity": 1, "price": 2.5} for product_id in product_ids]
+    }
+
+
+def test_unknown_products_are_rejected(tmp_path):
+    pos = POSSystem(str(tmp_path / "pos.db"))
+    conn = pos.db.connection()
+    product_id = pos.get_products()[0]["id"]
+    
+    result = ingest_transactions(conn, [
+        _transaction("TXN-A", product_id),
+        _transaction("TXN-B", product_id, 999)
+    ])
+    
+    assert (result["accepted"], result["rejected"], result["lines"]) == (1, 1, 1)
+    assert result["results"][1] == {"transaction_id": "TXN-B", "status": "rejected",
+                                    "error": "Unknown product_id: 999"}
+    assert [row[0] for row in conn.execute("SELECT transaction_id FROM sales")] == ["TXN-A"]
+    assert conn.execute("SELECT COUNT(*) FROM ingested_transactions").fetchone()[0] == 1
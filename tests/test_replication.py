@@ -0,0 +1,60 @@
+# test_replication.py (Two store databases replicating through a local server)
+from pos_system import POSSystem
+from replication import LocalReplicationServer, ReplicationClient
+
+
+def catalog(pos):
+    rows = pos.db.connection().execute("SELECT name, category, stock_quantity FROM products ORDER BY name, price")
+    return [tuple(row) for row in rows]
+
+
+def test_seeded_stores_share_one_catalog(tmp_path):
+    store_a = POSSystem(str(tmp_path / "a.db"))
+    store_b = POSSystem(str(tmp_path / "b.db"))
+    seeded = catalog(store_a)
+    assert catalog(store_b) == seeded
+    
+    with LocalReplicationServer(str(tmp_path / "hq.db")) as server:
+        client = ReplicationClient(server.url)
+        for _ in range(2):
+            store_a.replicate(client)
+            store_b.replicate(client)
+        
+        # Same six products once each, seeded stock counted once
+        assert catalog(store_a) == seeded
+        assert catalog(store_b) == seeded
+        
+        laptop = store_a.db.connection().execute("SELECT id FROM products WHERE name = 'Laptop'").fetchone()[0]
+        store_a.process_sale([{"product_id": laptop, "quantity": 2}])
+        store_b.add_product("Lamp", 19.99, "Furniture", 5)
+        for _ in range(2):
+            store_a.replicate(client)
+            store_b.replicate(client)
+        
+        assert catalog(store_a) == catalog(store_b)
+        stock = dict(((name, category), quantity) for name, category, quantity in catalog(store_b))
+        assert stock[("Laptop", "Electronics")] == 8
+        assert stock[("Lamp", "Furniture")] == 5
+
+
+def test_stock_converges_when_stores_create_the_same_sku(tmp_path):
+    store_a = POSSystem(str(tmp_path / "a.db"))
+    store_b = POSSystem(str(tmp_path / "b.db"))
+    store_a.add_product("Lamp", 19.99, "Furniture", 3, sku="LAMP-1")
+    store_b.add_product("Lamp", 19.99, "Furniture", 5, sku="LAMP-1")
+    # Same name, no SKU: unrelated products that are not merged
+    store_a.add_product("Stool", 29.99, "Furniture", 2)
+    store_b.add_product("Stool", 39.99, "Furniture", 4)
+    
+    with LocalReplicationServer(str(tmp_path / "hq.db")) as server:
+        client = ReplicationClient(server.url)
+        for _ in range(3):
+            store_a.replicate(client)
+            store_b.replicate(client)
+        
+        hq = server.db.connection()
+        for conn in (store_a.db.connection(), store_b.db.connection(), hq):
+            assert conn.execute("SELECT stock_quantity FROM products WHERE sku = 'LAMP-1'").fetchall()[0][0] == 8
+            stools = conn.execute("SELECT price, stock_quantity FROM products WHERE name = 'Stool' ORDER BY price")
+            assert [tuple(row) for row in stools] == [(29.99, 2), (39.99, 4)]
+        assert catalog(store_a) == catalog(store_b)
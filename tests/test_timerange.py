@@ -0,0 +1,71 @@
+# test_timerange.py (Half-open report ranges and Monday-based week buckets)
+import sqlite3
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import timerange
+from timerange import DAY, bucket_sql, bucket_start, is_aligned, parse_bound, parse_range, to_epoch
+
+
+@pytest.fixture
+def utc(monkeypatch):
+    monkeypatch.setattr(timerange, "REPORT_TIMEZONE", ZoneInfo("UTC"))
+
+
+def test_date_end_includes_the_whole_day(utc):
+    assert parse_range("2026-03-02", "2026-03-02") == (to_epoch("2026-03-02 00:00:00"), to_epoch("2026-03-03 00:00:00"))
+    assert parse_bound("2026-02-28", end=True) == to_epoch("2026-03-01 00:00:00")
+
+
+def test_time_end_includes_the_named_minute_or_second(utc):
+    assert parse_bound("2026-03-02 10:15", end=True) == to_epoch("2026-03-02 10:16:00")
+    assert parse_bound("2026-03-02 23:59", end=True) == to_epoch("2026-03-03 00:00:00")
+    assert parse_bound("2026-03-02 10:15:30", end=True) == to_epoch("2026-03-02 10:15:31")
+    assert parse_bound("2026-03-02 10:15") == to_epoch("2026-03-02 10:15:00")
+
+
+def test_values_with_an_offset_are_converted_to_utc(utc):
+    assert parse_bound("2026-03-02T10:00+02:00") == to_epoch("2026-03-02 08:00:00")
+    assert parse_bound("2026-03-02T10:00-0500", end=True) == to_epoch("2026-03-02 15:01:00")
+    assert parse_bound("2026-03-02T10:00:00Z") == to_epoch("2026-03-02 10:00:00")
+
+
+def test_report_timezone_applies_to_values_without_an_offset(monkeypatch):
+    monkeypatch.setattr(timerange, "REPORT_TIMEZONE", ZoneInfo("America/New_York"))
+    # Clocks go forward on 2026-03-08: that local day is 23 hours long
+    start, end = parse_range("2026-03-08", "2026-03-08")
+    assert start == to_epoch("2026-03-08 05:00:00")
+    assert end == to_epoch("2026-03-09 04:00:00")
+    assert parse_bound("2026-03-08T00:00Z") == to_epoch("2026-03-08 00:00:00")
+
+
+def test_open_and_invalid_bounds(utc):
+    assert parse_range(None, "  ") == (None, None)
+    assert parse_range(1000, 2000) == (1000, 2000)
+    with pytest.raises(ValueError, match="before start_date"):
+        parse_range("2026-03-03", "2026-03-01")
+    with pytest.raises(ValueError, match="Invalid date"):
+        parse_bound("03/02/2026")
+
+
+@pytest.mark.parametrize("timestamp, monday", [
+    ("2026-03-02 00:00:00", "2026-03-02 00:00:00"),   # Monday midnight starts its own week
+    ("2026-03-04 13:45:00", "2026-03-02 00:00:00"),   # Wednesday
+    ("2026-03-08 23:59:59", "2026-03-02 00:00:00"),   # Sunday, last second of the week
+    ("2026-03-09 00:00:00", "2026-03-09 00:00:00"),
+    ("1970-01-01 00:00:00", "1969-12-29 00:00:00")    # a Thursday, before the first epoch Monday
+])
+def test_weeks_start_on_monday(timestamp, monday):
+    epoch = to_epoch(timestamp)
+    assert bucket_start(epoch, "week") == to_epoch(monday)
+    row = sqlite3.connect(":memory:").execute(f"SELECT {bucket_sql('week', '?1')}", (epoch,)).fetchone()
+    assert row[0] == to_epoch(monday)
+
+
+def test_alignment():
+    monday = to_epoch("2026-03-02 00:00:00")
+    assert is_aligned(None, "week")
+    assert is_aligned(monday, "week") and is_aligned(monday + DAY, "day")
+    assert not is_aligned(monday + DAY, "week")
+    assert not is_aligned(monday + 1800, "hour")
@@ -0,0 +1,29 @@
+# test_txn_ids.py (Transaction IDs across a DST change and terminal ID persistence)
+import time
+
+import txn_ids
+from txn_ids import TerminalIdGenerator, default_terminal_id
+
+
+def test_ids_stay_unique_across_fall_back(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        generator = TerminalIdGenerator("T01")
+        ids = []
+        # 01:30 EDT and, an hour later, 01:30 EST on 2026-11-01
+        for seconds in (1793511000, 1793514600):
+            monkeypatch.setattr(txn_ids.time, "time_ns", lambda: seconds * 10 ** 9)
+            ids.append(generator.next_id())
+        assert ids == ["TXN20261101053000000-T01-0000", "TXN20261101063000000-T01-0000"]
+    finally:
+        monkeypatch.delenv("TZ")
+        time.tzset()
+
+
+def test_terminal_id_is_generated_once(tmp_path, monkeypatch):
+    monkeypatch.delenv("POS_TERMINAL_ID", raising=False)
+    path = str(tmp_path / "pos_terminal_id")
+    first = default_terminal_id(path)
+    assert len(first) == 8
+    assert default_terminal_id(path) == first
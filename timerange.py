@@ -0,0 +1,122 @@
+# timerange.py (Report date ranges and integer epoch time buckets)
+import calendar
+import datetime
+import os
+import re
+from typing import List, Optional, Tuple, Union
+from zoneinfo import ZoneInfo
+
+# Dates typed without a UTC offset are read in this zone; stored sale times are UTC
+REPORT_TIMEZONE = ZoneInfo(os.environ.get("POS_TIMEZONE", "UTC"))
+
+HOUR = 3600
+DAY = 86400
+WEEK = 7 * DAY
+GRAINS = {"hour": HOUR, "day": DAY, "week": WEEK}
+
+# 1970-01-01 was a Thursday; weeks start on Monday
+_WEEK_OFFSET = 3 * DAY
+
+# SQL twin of to_epoch, for backfilling sales.epoch from sales.timestamp
+EPOCH_SQL = "CAST(strftime('%s', timestamp) AS INTEGER)"
+
+_INPUT = re.compile(r"^\d{4}-\d{2}-\d{2}(?:[ T](\d{2}):(\d{2})(:\d{2}(?:\.\d+)?)?)?(?:Z|[+-]\d{2}:?\d{2})?$")
+
+
+def _parse(value: str) -> Tuple[datetime.datetime, str]:
+    """Parse a typed date or date-time; returns it timezone-aware with its precision"""
+    text = value.strip()
+    match = _INPUT.match(text)
+    if not match:
+        raise ValueError(f"Invalid date: {value!r} (expected YYYY-MM-DD or YYYY-MM-DD HH:MM[:SS])")
+    try:
+        parsed = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value!r}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=REPORT_TIMEZONE)
+    precision = "day" if match.group(1) is None else "minute" if match.group(3) is None else "second"
+    return parsed, precision
+
+
+def parse_bound(value: Union[str, int, None], end: bool = False) -> Optional[int]:
+    """Epoch seconds for a start or end date as typed (None or blank means open).
+    
+    An end bound includes everything it names - the whole day for a date,
+    the whole minute for HH:MM - and comes back exclusive, so every range is
+    half-open: [start, end). Integers are taken as epoch seconds already.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    if not value.strip():
+        return None
+    parsed, precision = _parse(value)
+    if end:
+        # Wall-clock arithmetic, so a day is still a day across a DST change
+        parsed += {"day": datetime.timedelta(days=1), "minute": datetime.timedelta(minutes=1),
+                   "second": datetime.timedelta(seconds=1)}[precision]
+    return int(parsed.timestamp())
+
+
+def parse_range(start_date: Union[str, int, None], end_date: Union[str, int, None]) -> Tuple[Optional[int], Optional[int]]:
+    """Half-open [start, end) epoch range for report start/end dates; raises ValueError on bad input"""
+    start = parse_bound(start_date)
+    end = parse_bound(end_date, end=True)
+    if start is not None and end is not None and end < start:
+        raise ValueError("end_date is before start_date")
+    return start, end
+
+
+def range_conditions(start: Optional[int], end: Optional[int], column: str = "epoch") -> Tuple[List[str], List]:
+    """WHERE conditions for a half-open range, as an index range scan on column"""
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append(f"{column} < ?")
+        params.append(end)
+    return conditions, params
+
+
+def check_grain(grain: str) -> str:
+    if grain not in GRAINS:
+        raise ValueError(f"Invalid grain: {grain!r} (expected one of {', '.join(GRAINS)})")
+    return grain
+
+
+def bucket_sql(grain: str, column: str = "epoch") -> str:
+    """SQL for the start of column's hour, day or week (UTC; weeks start on Monday)"""
+    if check_grain(grain) == "week":
+        return f"({column} - ({column} + {_WEEK_OFFSET}) % {WEEK})"
+    return f"({column} - {column} % {GRAINS[grain]})"
+
+
+def bucket_start(epoch: int, grain: str) -> int:
+    if check_grain(grain) == "week":
+        return epoch - (epoch + _WEEK_OFFSET) % WEEK
+    return epoch - epoch % GRAINS[grain]
+
+
+def is_aligned(epoch: Optional[int], grain: str) -> bool:
+    """True for an open bound or one on a bucket boundary"""
+    return epoch is None or bucket_start(epoch, grain) == epoch
+
+
+def to_epoch(timestamp: str) -> int:
+    """Epoch seconds for a stored UTC 'YYYY-MM-DD HH:MM:SS' timestamp"""
+    return calendar.timegm(datetime.datetime.fromisoformat(timestamp).timetuple())
+
+
+def format_epoch(epoch: int) -> str:
+    """Stored timestamp format (UTC) for epoch seconds"""
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def normalize_timestamp(value: str) -> Tuple[str, int]:
+    """Stored timestamp text and epoch for an ISO timestamp; values with an offset are converted to UTC"""
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S"), calendar.timegm(parsed.timetuple())
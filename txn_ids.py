@@ -0,0 +1,144 @@
+# txn_ids.py (Collision-free transaction ID generation)
+import datetime
+import os
+import re
+import secrets
+import threading
+import time
+from typing import Dict, Optional
+
+# New IDs look like TXN20250101093015123-T01-0007:
+#   TXN + UTC time to the millisecond + terminal ID + per-millisecond sequence.
+# UTC never repeats an hour, so IDs stay unique and in time order across DST
+# changes. Legacy IDs (TXN + local %Y%m%d%H%M%S) are a strict prefix of that
+# layout, so old and new IDs still sort together as plain text.
+_ID_PATTERN = re.compile(r"^TXN(\d{17})-([0-9A-Z]+)-(\d{4})$")
+_LEGACY_PATTERN = re.compile(r"^TXN(\d{14})$")
+_TERMINAL_PATTERN = re.compile(r"^[0-9A-Z]{1,8}$")
+
+MAX_SEQUENCE = 9999
+
+# Where a terminal keeps the random ID generated on its first run
+DEFAULT_TERMINAL_ID_FILE = os.environ.get("POS_TERMINAL_ID_FILE", "pos_terminal_id")
+
+
+class TransactionIdGenerator:
+    """Base class for pluggable transaction ID generators"""
+    
+    def next_id(self) -> str:
+        raise NotImplementedError
+
+
+class TerminalIdGenerator(TransactionIdGenerator):
+    """Snowflake-style IDs: millisecond timestamp, terminal ID and sequence.
+    
+    IDs are allocated in memory (no database round trip), are strictly
+    increasing for a generator even if the wall clock steps backwards, and
+    never collide between terminals with distinct terminal IDs.
+    """
+    
+    def __init__(self, terminal_id: Optional[str] = None):
+        terminal_id = (terminal_id or default_terminal_id()).upper()
+        if not _TERMINAL_PATTERN.match(terminal_id):
+            raise ValueError(f"Invalid terminal ID: {terminal_id} (use 1-8 letters or digits)")
+        
+        self.terminal_id = terminal_id
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+    
+    def next_id(self) -> str:
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            elif self._sequence < MAX_SEQUENCE:
+                self._sequence += 1
+            else:
+                # Sequence exhausted (or clock went backwards): borrow the next millisecond
+                self._last_ms += 1
+                self._sequence = 0
+            last_ms, sequence = self._last_ms, self._sequence
+        
+        stamp = datetime.datetime.fromtimestamp(last_ms / 1000.0, tz=datetime.timezone.utc)
+        return f"TXN{stamp.strftime('%Y%m%d%H%M%S')}{last_ms % 1000:03d}-{self.terminal_id}-{sequence:04d}"
+
+
+def default_terminal_id(path: Optional[str] = None) -> str:
+    """Terminal ID from POS_TERMINAL_ID, else the one stored in the terminal ID file.
+    
+    The file is written with a random 8-character ID on first use, so the ID
+    stays the same across restarts. Processes that issue IDs at the same
+    time on one machine must each set their own POS_TERMINAL_ID.
+    """
+    configured = os.environ.get("POS_TERMINAL_ID")
+    if configured:
+        return configured.upper()
+    
+    path = path or DEFAULT_TERMINAL_ID_FILE
+    if not os.path.exists(path):
+        # Written whole and then linked into place: if two processes start
+        # together, one link wins and the other reads the winner's ID
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as stored:
+            stored.write(secrets.token_hex(4).upper() + "\n")
+        try:
+            os.link(temporary, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary)
+    with open(path) as stored:
+        return stored.read().strip().upper()
+
+
+def parse_transaction_id(transaction_id: str) -> Dict:
+    """Split a transaction ID into its timestamp, terminal ID and sequence.
+    
+    The timestamp is naive: UTC for current IDs, local time for legacy
+    TXN%Y%m%d%H%M%S IDs, which parse with terminal_id and sequence set to None.
+    """
+    match = _ID_PATTERN.match(transaction_id)
+    if match:
+        stamp, terminal_id, sequence = match.groups()
+        return {
+            "timestamp": datetime.datetime.strptime(stamp, "%Y%m%d%H%M%S%f"),
+            "terminal_id": terminal_id,
+            "sequence": int(sequence)
+        }
+    
+    match = _LEGACY_PATTERN.match(transaction_id)
+    if match:
+        return {
+            "timestamp": datetime.datetime.strptime(match.group(1), "%Y%m%d%H%M%S"),
+            "terminal_id": None,
+            "sequence": None
+        }
+    
+    raise ValueError(f"Unrecognised transaction ID: {transaction_id}")
+
+
+_default_generator = None
+_default_lock = threading.Lock()
+
+
+def get_transaction_id_generator() -> TransactionIdGenerator:
+    """Return the process-wide generator, creating a TerminalIdGenerator on first use"""
+    global _default_generator
+    with _default_lock:
+        if _default_generator is None:
+            _default_generator = TerminalIdGenerator()
+        return _default_generator
+
+
+def set_transaction_id_generator(generator: TransactionIdGenerator):
+    """Replace the process-wide generator (e.g. to pin a terminal ID)"""
+    global _default_generator
+    with _default_lock:
+        _default_generator = generator
+
+
+def next_transaction_id() -> str:
+    """Allocate a transaction ID from the process-wide generator"""
+    return get_transaction_id_generator().next_id()
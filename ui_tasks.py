@@ -0,0 +1,177 @@
+# ui_tasks.py (Background database work for the Tk GUI)
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from db import ConnectionManager
+from metrics import timed
+
+# How often the Tk thread drains finished tasks while any are outstanding
+DEFAULT_POLL_INTERVAL = 15  # milliseconds, just under one 60 Hz frame
+
+# Independent single-thread lanes: a long report never delays a sale, and
+# neither delays the status bar polling
+DEFAULT_LANE = "db"
+LANES = ("db", "reports", "status")
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task's connection when it was interrupted by cancel()"""
+
+
+class Task:
+    """Handle for one piece of background work submitted to a TaskRunner"""
+    
+    def __init__(self, name: str, func: Callable[[sqlite3.Connection], Any],
+                 on_success: Optional[Callable[[Any], None]], on_error: Optional[Callable[[Exception], None]],
+                 quiet: bool = False):
+        self.name = name
+        self.quiet = quiet
+        self.func = func
+        self.on_success = on_success
+        self.on_error = on_error
+        self.future = None
+        self._conn = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+    
+    def cancel(self):
+        """Drop the task if queued, or interrupt its running query.
+        
+        Callbacks of a cancelled task are never called.
+        """
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+        with self._lock:
+            if self._conn is not None:
+                # Makes the statement in progress fail with "interrupted"
+                self._conn.interrupt()
+    
+    def run(self, db_manager: ConnectionManager) -> Any:
+        """Worker-thread side: run func on the thread's own connection"""
+        if self.cancelled:
+            raise TaskCancelled(self.name)
+        
+        conn = db_manager.connection()
+        with self._lock:
+            self._conn = conn
+        try:
+            with timed(f"gui.{self.name}"):
+                return self.func(conn)
+        except sqlite3.OperationalError as e:
+            if self.cancelled:
+                raise TaskCancelled(self.name) from e
+            raise
+        finally:
+            with self._lock:
+                self._conn = None
+            if conn.in_transaction:
+                conn.rollback()
+
+
+class TaskRunner:
+    """Runs database work on worker threads and delivers results on the Tk thread.
+    
+    submit() hands func(conn) to a single-thread executor lane, where it
+    runs on that thread's own connection. Finished tasks are put on a queue
+    that the Tk thread drains with root.after polling (only while tasks are
+    outstanding), so callbacks can touch widgets safely and the event loop
+    never blocks on SQLite.
+    """
+    
+    def __init__(self, root, db_manager: ConnectionManager, poll_interval: int = DEFAULT_POLL_INTERVAL,
+                 on_busy: Optional[Callable[[List[str]], None]] = None):
+        self.root = root
+        self.db_manager = db_manager
+        self.poll_interval = poll_interval
+        self.on_busy = on_busy
+        self._executors = {
+            lane: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"pos-gui-{lane}") for lane in LANES
+        }
+        self._done = queue.Queue()
+        self._active = []
+        self._polling = None
+    
+    def submit(self, func: Callable[[sqlite3.Connection], Any], on_success: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[Exception], None]] = None, name: str = "task",
+               lane: str = DEFAULT_LANE, quiet: bool = False) -> Task:
+        """Queue func(conn) on a lane; call from the Tk thread only.
+        
+        Quiet tasks (periodic polling) do not count towards the busy indicator.
+        """
+        task = Task(name, func, on_success, on_error, quiet)
+        task.future = self._executors[lane].submit(self._run, task)
+        self._active.append(task)
+        self._busy_changed()
+        self._schedule_poll()
+        return task
+    
+    def _run(self, task: Task):
+        try:
+            result = task.run(self.db_manager)
+        except Exception as e:
+            self._done.put((task, False, e))
+        else:
+            self._done.put((task, True, result))
+    
+    def _schedule_poll(self):
+        if self._polling is None:
+            self._polling = self.root.after(self.poll_interval, self._poll)
+    
+    def _poll(self):
+        """Tk-thread side: deliver finished tasks, keep polling while any remain"""
+        self._polling = None
+        while True:
+            try:
+                task, ok, value = self._done.get_nowait()
+            except queue.Empty:
+                break
+            self._finish(task, ok, value)
+        
+        # Tasks cancelled before they started never reach the queue
+        for task in [task for task in self._active if task.future.cancelled()]:
+            self._active.remove(task)
+            self._busy_changed()
+        
+        if self._active:
+            self._schedule_poll()
+    
+    def _finish(self, task: Task, ok: bool, value: Any):
+        if task in self._active:
+            self._active.remove(task)
+            self._busy_changed()
+        if task.cancelled:
+            return
+        
+        callback = task.on_success if ok else task.on_error
+        if callback is not None:
+            callback(value)
+        elif not ok:
+            self.root.report_callback_exception(type(value), value, value.__traceback__)
+    
+    def _busy_changed(self):
+        if self.on_busy is not None:
+            self.on_busy([task.name for task in self._active if not task.quiet])
+    
+    def busy(self) -> bool:
+        return bool(self._active)
+    
+    def stats(self) -> Dict:
+        return {"active": [task.name for task in self._active], "pending_results": self._done.qsize()}
+    
+    def shutdown(self):
+        """Cancel outstanding work and stop the worker threads"""
+        for task in list(self._active):
+            task.cancel()
+        if self._polling is not None:
+            self.root.after_cancel(self._polling)
+            self._polling = None
+        for executor in self._executors.values():
+            executor.shutdown(wait=False)
@@ -0,0 +1,275 @@
+# writes.py (Write coordination: BEGIN IMMEDIATE, bounded retry with jitter, group-committing writer)
+import atexit
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from metrics import get_metrics
+
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_RETRY_BASE = 0.02   # seconds; doubles per attempt before jitter
+DEFAULT_RETRY_MAX = 1.0     # cap on a single retry delay
+DEFAULT_GROUP_SIZE = 200    # writes applied per group commit
+
+# POS_WRITE_QUEUE=1 routes writes through one writer thread per database file
+SINGLE_WRITER = os.environ.get("POS_WRITE_QUEUE", "0") == "1"
+
+
+def is_busy_error(error: BaseException) -> bool:
+    """True for SQLITE_BUSY / SQLITE_LOCKED, which are safe to retry after a rollback"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error)
+    return "locked" in message or "busy" in message
+
+
+class RetryPolicy:
+    """Bounded exponential backoff with full jitter.
+    
+    Applies on top of the connection's busy_timeout: SQLite already waits
+    that long for the lock, so a retry only happens when it gave up (or
+    returned SQLITE_BUSY without waiting, e.g. during WAL recovery). The
+    jitter keeps terminals that collided from colliding again in lockstep.
+    """
+    
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, base_delay: float = DEFAULT_RETRY_BASE,
+                 max_delay: float = DEFAULT_RETRY_MAX):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy(int(os.environ.get("POS_WRITE_RETRIES", DEFAULT_MAX_RETRIES)))
+
+_counters = {"writes": 0, "retries": 0, "busy_failures": 0}
+_counters_lock = threading.Lock()
+
+
+def _count(key: str, amount: int = 1):
+    with _counters_lock:
+        _counters[key] += amount
+
+
+def write_stats() -> Dict:
+    """Process-wide write, retry and give-up counts"""
+    with _counters_lock:
+        return dict(_counters)
+
+
+def write_transaction(conn: sqlite3.Connection, func: Callable, *args, policy: Optional[RetryPolicy] = None):
+    """Run func(cursor, *args) inside BEGIN IMMEDIATE and commit; returns its result.
+    
+    Taking the write lock up front means a transaction can never fail half
+    way through on a lock upgrade. If SQLite still reports busy/locked, the
+    transaction is rolled back and re-run from the top after a jittered
+    delay, so func must only touch the database through the cursor (no
+    commit or rollback of its own). Other errors roll back and propagate.
+    """
+    policy = policy or DEFAULT_RETRY_POLICY
+    if conn.in_transaction:
+        conn.commit()
+    
+    attempt = 0
+    while True:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            result = func(cursor, *args)
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not is_busy_error(e):
+                raise
+            if attempt >= policy.max_retries:
+                _count("busy_failures")
+                raise
+            _count("retries")
+            time.sleep(policy.delay(attempt))
+            attempt += 1
+            continue
+        _count("writes")
+        return result
+
+
+class WriteCoordinator:
+    """Applies the writes for one database file, inline or through a single writer.
+    
+    Inline (the default), run() executes the write on the caller's
+    connection with write_transaction. With single_writer, producers queue
+    their writes and one thread applies them: whatever is waiting (up to
+    group_size) goes into one BEGIN IMMEDIATE transaction, each write under
+    its own savepoint so a failing write is undone alone, and the group is
+    committed once. Producers then never contend for the lock among
+    themselves, and throughput grows with load instead of collapsing.
+    
+    Every writer in the process goes through it except two: migrations
+    (schema changes, applied when a database is opened, before other
+    writes) and archive.archive_sales (its writes span an archive file
+    attached to its own connection). Both use write_transaction directly.
+    """
+    
+    def __init__(self, db_manager, single_writer: bool = SINGLE_WRITER, policy: Optional[RetryPolicy] = None,
+                 group_size: int = DEFAULT_GROUP_SIZE):
+        self.db = db_manager
+        self.single_writer = single_writer
+        self.policy = policy or DEFAULT_RETRY_POLICY
+        self.group_size = max(1, int(group_size))
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"queued": 0, "groups": 0, "grouped_writes": 0, "largest_group": 0, "failed_groups": 0}
+    
+    def run(self, func: Callable, *args, conn: Optional[sqlite3.Connection] = None):
+        """Apply func(cursor, *args) as one write and return its result (blocking).
+        
+        Inline, the write runs on conn (default: this thread's connection).
+        In single-writer mode conn is ignored - the writer thread uses its
+        own connection - so func must not rely on connection state such as
+        attached databases or temp tables.
+        """
+        if self.single_writer:
+            return self.submit(func, *args).result()
+        return write_transaction(conn if conn is not None else self.db.connection(), func, *args,
+                                 policy=self.policy)
+    
+    def submit(self, func: Callable, *args) -> Future:
+        """Queue a write for the writer thread; the future resolves after its group commits"""
+        future = Future()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._writer, name="pos-writer", daemon=True)
+                self._thread.start()
+            self._stats["queued"] += 1
+        self._queue.put((future, func, args))
+        return future
+    
+    def _writer(self):
+        conn = self.db.connection()
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            group = [first]
+            stopping = False
+            # Natural batching: take whatever queued up while the last group was committing
+            while len(group) < self.group_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                group.append(item)
+            
+            group = [item for item in group if item[0].set_running_or_notify_cancel()]
+            if group:
+                self._commit_group(conn, group)
+            if stopping:
+                return
+    
+    def _apply_group(self, cursor: sqlite3.Cursor, group: List) -> List:
+        outcomes = []
+        for future, func, args in group:
+            cursor.execute("SAVEPOINT group_write")
+            try:
+                result = func(cursor, *args)
+            except Exception as e:
+                if is_busy_error(e):
+                    raise
+                cursor.execute("ROLLBACK TO group_write")
+                cursor.execute("RELEASE group_write")
+                outcomes.append((future, False, e))
+                continue
+            cursor.execute("RELEASE group_write")
+            outcomes.append((future, True, result))
+        return outcomes
+    
+    def _commit_group(self, conn: sqlite3.Connection, group: List):
+        start = time.perf_counter()
+        try:
+            outcomes = write_transaction(conn, self._apply_group, group, policy=self.policy)
+        except Exception as e:
+            with self._lock:
+                self._stats["failed_groups"] += 1
+            for future, func, args in group:
+                future.set_exception(e)
+            return
+        get_metrics().observe_operation("write.group_commit", time.perf_counter() - start)
+        
+        with self._lock:
+            self._stats["groups"] += 1
+            self._stats["grouped_writes"] += len(group)
+            self._stats["largest_group"] = max(self._stats["largest_group"], len(group))
+        for future, ok, value in outcomes:
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+    
+    def stop(self, timeout: Optional[float] = None):
+        """Apply everything already queued, then stop the writer thread"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        groups = stats["groups"]
+        stats.update({
+            "single_writer": self.single_writer,
+            "queue_depth": self._queue.qsize(),
+            "average_group": round(stats["grouped_writes"] / groups, 2) if groups else 0.0,
+            "busy_timeout_ms": self.db.busy_timeout,
+            "max_retries": self.policy.max_retries
+        })
+        stats.update(write_stats())
+        return stats
+
+
+_coordinators = {}
+_coordinators_lock = threading.Lock()
+
+
+def get_write_coordinator(db_manager, **options) -> WriteCoordinator:
+    """Return the shared coordinator for a manager's database file, creating it on first use.
+    
+    As with connection managers, options only apply on first creation.
+    """
+    key = os.path.abspath(db_manager.db_name)
+    stale = None
+    with _coordinators_lock:
+        coordinator = _coordinators.get(key)
+        if coordinator is None or coordinator.db is not db_manager:
+            # A replaced manager (close_all_managers) gets a fresh coordinator too
+            stale = coordinator
+            coordinator = WriteCoordinator(db_manager, **options)
+            _coordinators[key] = coordinator
+    if stale is not None:
+        stale.stop()
+    return coordinator
+
+
+def stop_write_coordinators(timeout: Optional[float] = None):
+    """Drain and stop every writer thread (registered to run at exit)"""
+    with _coordinators_lock:
+        coordinators = list(_coordinators.values())
+        _coordinators.clear()
+    for coordinator in coordinators:
+        coordinator.stop(timeout)
+
+
+atexit.register(stop_write_coordinators)